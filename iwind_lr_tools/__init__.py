@@ -15,8 +15,14 @@ from .utils import run_simulation, exe_version
 from .io import aser_inp, efdc_inp, qbal_out, qser_inp, wqpsc_inp, WQWCTS_OUT
 from .io.common import dumps
 from .runner import Runner, run_batch, restart_batch, fork, restart_iterator,\
-     start_iterator, debug_env, start_single, restart_single, restart_list_iterator
+     start_iterator, debug_env, start_single, restart_single, restart_list_iterator, SandboxPool,\
+     run_batch_async, restart_batch_async, TimeoutPolicy, restart_list_iterator_pipelined, StepPolicy
 from .actioner import Actioner
 from .load_stats import Pedant
+from .fault_tolerant_pool import BatchExecutor
+from .result_cache import ResultCache
+from .checkpoint_store import CheckpointStore
+from .remote import RemoteExecutor, WorkerDaemon
+from .simulation_tree import SimulationTree
 # from .collector import get_all, get_model
 
@@ -1,6 +1,7 @@
 
 from multiprocessing.dummy import Value
 import pandas as pd
+import numpy as np
 from typing import List
 from warnings import warn
 from copy import deepcopy
@@ -8,6 +9,7 @@ from collections.abc import Iterable
 
 from .collector import inp_out_map, get_df_node_map_map_and_df_map_map, dumpable_list
 from .io import qser_inp
+from .io.qser_inp import FlowStore
 from .io.common import ConcentrationNode, Node, FlowNode, CommentNode, FlowAdjustMatrixNode
 
 
@@ -16,17 +18,24 @@ class Actioner:
         self.data_map = data_map
         self.df_node_map_map = df_node_map_map
         self.df_map_map = df_map_map
+        self.flow_store = None
+
+    def _mark_dirty(self, fname, key):
+        # Tell `dumps` / `Runner.write` the node is modified without waiting for the fingerprint check.
+        self.df_node_map_map[fname][key].mark_dirty()
 
     def get_simulation_length(self):
         return self.df_map_map["efdc.inp"]["C03"]["NTC"].iloc[0]
 
     def set_simulation_length(self, value):
         self.df_map_map["efdc.inp"]["C03"]["NTC"].iloc[0] = value
+        self._mark_dirty("efdc.inp", "C03")
 
     def enable_restart(self, enable=True):
         C02 = self.df_map_map["efdc.inp"]["C02"]
         val = 1 if enable else 0
         C02.loc[0, "ISRESTI"] = val
+        self._mark_dirty("efdc.inp", "C02")
 
     def is_restarting(self):
         C02 = self.df_map_map["efdc.inp"]["C02"]
@@ -35,11 +44,23 @@ class Actioner:
     def set_simulation_begin_time(self, value):
         C03 = self.df_map_map["efdc.inp"]["C03"]
         C03.loc[0, "TBEGIN"] = value
+        self._mark_dirty("efdc.inp", "C03")
 
     def get_simulation_begin_time(self):
         C03 = self.df_map_map["efdc.inp"]["C03"]
         return C03.loc[0, "TBEGIN"]
 
+    def enable_flow_store(self, enable=True):
+        """
+        Move qser.inp flows into a columnar `FlowStore`, so flow setters and `copy` work on a single matrix.
+        """
+        if enable and self.flow_store is None:
+            self.flow_store = FlowStore.from_node_list(self.data_map["qser.inp"])
+        elif not enable and self.flow_store is not None:
+            self.flow_store.detach()
+            self.flow_store = None
+        self._sync_from_data_map()
+
     def _sync_from_data_map(self):
         # Now we recommend df[:] = df2 to sync automatically.
         _df_node_map_map, _df_map_map = get_df_node_map_map_and_df_map_map(self.data_map)
@@ -58,6 +79,7 @@ class Actioner:
 
         assert C07["NQSIJ"].iloc[0] == C07["NQSER"].iloc[0]
         C07["NQSIJ"].iloc[0] = C07["NQSER"].iloc[0] = len(idx_list)
+        self._mark_dirty("efdc.inp", "C07")
 
         C08_selected = C08.iloc[idx_list].copy()
         C09_selected = C09.iloc[idx_list].copy()
@@ -81,6 +103,9 @@ class Actioner:
         self.data_map["qser.inp"].clear()
         self.data_map["qser.inp"].extend(node_list)
 
+        if self.flow_store is not None:
+            self.flow_store = FlowStore.from_node_list(self.data_map["qser.inp"])
+
         # Modify wqpsc.inp
 
         old_node_list = self.data_map["wqpsc.inp"]
@@ -106,6 +131,7 @@ class Actioner:
 
         assert C34_1["IWQPS"].iloc[0] == C34_1["NPSTMSR"].iloc[0]
         C34_1["IWQPS"].iloc[0] = C34_1["NPSTMSR"].iloc[0] = len(idx_list_wq)
+        self._mark_dirty("wq3dwc.inp", "C34_1")
 
         C34_2_selected = C34_2.iloc[idx_list_wq].copy()
         C34_2_selected["N"] = C34_2_selected["N"].map(lambda x:old2new_wq[x - 1] + 1)
@@ -136,6 +162,7 @@ class Actioner:
 
         assert C07["NQSIJ"].iloc[0] == C07["NQSER"].iloc[0]
         C07["NQSIJ"].iloc[0] = C07["NQSER"].iloc[0] = len(idx_list)
+        self._mark_dirty("efdc.inp", "C07")
 
         C08_selected = C08.iloc[idx_list].copy()
         C09_selected = C09.iloc[idx_list].copy()
@@ -153,6 +180,7 @@ class Actioner:
 
         assert C34_1["IWQPS"].iloc[0] == C34_1["NPSTMSR"].iloc[0]
         C34_1["IWQPS"].iloc[0] = C34_1["NPSTMSR"].iloc[0] = len(idx_list_wq)
+        self._mark_dirty("wq3dwc.inp", "C34_1")
 
         C34_2_selected = C34_2.iloc[idx_list_wq].copy()
         
@@ -165,7 +193,12 @@ class Actioner:
 
         for drop_idx in drop_idx_list:
             self.df_map_map["qser.inp"]
-            df = self.get_flow_node_list()[drop_idx].get_df()
+            node = self.get_flow_node_list()[drop_idx]
+            node.mark_dirty()
+            if self.flow_store is not None:
+                self.flow_store.matrix[:, self.flow_store.get_col(node.get_name())] = 0
+                continue
+            df = node.get_df()
             df["flow"] = 0
 
     def select_flow_qfactor0(self, idx_list: List[int]):
@@ -174,6 +207,7 @@ class Actioner:
         C08 = self.df_map_map["efdc.inp"]["C08"]
         for drop_idx in drop_idx_list:
             C08.loc[C08.index[drop_idx], "Qfactor"] = 0
+        self._mark_dirty("efdc.inp", "C08")
 
     def select_flow(self, idx_list: List[int], mode="hard"):
         # return self.select_flow_soft()
@@ -227,14 +261,22 @@ class Actioner:
         data_map = self.data_map.copy()
         actioner = Actioner(data_map, {}, {})
         for key in dumpable_list:
+            if key == "qser.inp" and self.flow_store is not None:
+                actioner.flow_store, actioner.data_map[key] = self.flow_store.copy(self.data_map[key])
+                continue
             actioner.data_map[key] = deepcopy(self.data_map[key])
         actioner._sync_from_data_map()
         return actioner
 
     def deepcopy(self):
-        return deepcopy(self)
+        actioner = deepcopy(self)
+        if actioner.flow_store is not None:
+            # deepcopy copies every view independently, re-bind them to the copied matrix.
+            actioner.flow_store.bind()
+            actioner._sync_from_data_map()
+        return actioner
 
-    def _get_df_index(self, flow_key, time_begin, time_end):
+    def _get_idx_range(self, flow_key, time_begin, time_end):
         df = self.df_map_map["qser.inp"][flow_key]
 
         if time_begin is None:
@@ -249,12 +291,22 @@ class Actioner:
         idx_begin = 2 * time_begin
         idx_end = 2 * time_end
 
+        return df, idx_begin, idx_end
+
+    def _get_df_index(self, flow_key, time_begin, time_end):
+        df, idx_begin, idx_end = self._get_idx_range(flow_key, time_begin, time_end)
+
         index = df.index[idx_begin: idx_end]
 
         return df, index
 
     def set_flow_range(self, flow_key, value, time_begin, time_end):
-        
+        self._mark_dirty("qser.inp", flow_key)
+        if self.flow_store is not None:
+            _, idx_begin, idx_end = self._get_idx_range(flow_key, time_begin, time_end)
+            self.flow_store.matrix[idx_begin: idx_end, self.flow_store.get_col(flow_key)] = value
+            return
+
         df, index = self._get_df_index(flow_key, time_begin, time_end)
         
         df.loc[index, "flow"] = value
@@ -264,11 +316,25 @@ class Actioner:
 
     def set_flow_range_from_actioner(self, flow_key, actioner, time_begin, time_end):
         df_target = actioner.df_map_map["qser.inp"][flow_key]
+        self._mark_dirty("qser.inp", flow_key)
+
+        if self.flow_store is not None:
+            _, idx_begin, idx_end = self._get_idx_range(flow_key, time_begin, time_end)
+            col = self.flow_store.get_col(flow_key)
+            self.flow_store.matrix[idx_begin: idx_end, col] = df_target["flow"].to_numpy()[idx_begin: idx_end]
+            return
 
         df, index = self._get_df_index(flow_key, time_begin, time_end)
         df.loc[index, "flow"] = df_target.loc[index, "flow"]
 
     def set_flow_range_from_vector(self, flow_key, vector, time_begin, time_end):
+        self._mark_dirty("qser.inp", flow_key)
+        if self.flow_store is not None:
+            _, idx_begin, idx_end = self._get_idx_range(flow_key, time_begin, time_end)
+            col = self.flow_store.get_col(flow_key)
+            self.flow_store.matrix[idx_begin: idx_end, col] *= vector.to_numpy().repeat(2, axis=0)[idx_begin: idx_end]
+            return
+
         df, index = self._get_df_index(flow_key, time_begin, time_end)
         df.loc[index, "flow"] = df.loc[index, "flow"] * vector.to_numpy().repeat(2, axis=0)[index]
 
@@ -281,6 +347,16 @@ class Actioner:
         return cloned
 
     def set_flow_by_decision_df(self, decision_df: pd.DataFrame, time_begin=None, time_end=None):
+        if self.flow_store is not None and decision_df.shape[1] > 0:
+            # one array operation for the whole decision matrix
+            _, idx_begin, idx_end = self._get_idx_range(decision_df.columns[0], time_begin, time_end)
+            col_list = [self.flow_store.get_col(flow_key) for flow_key in decision_df.columns]
+            for flow_key in decision_df.columns:
+                self._mark_dirty("qser.inp", flow_key)
+            factor = decision_df.to_numpy().repeat(2, axis=0)[idx_begin: idx_end]
+            self.flow_store.matrix[idx_begin: idx_end, col_list] *= factor
+            return
+
         for flow_key, vec in decision_df.items():
             self.set_flow_range_from_vector(flow_key, vec, time_begin, time_end)
 
@@ -304,4 +380,10 @@ class Actioner:
         self.set_flow_by_decision_df(ddf)
 
     def set_flow_df_direct(self, flow_key, df):
+        self._mark_dirty("qser.inp", flow_key)
+        if self.flow_store is not None:
+            if not np.array_equal(df["time"].to_numpy(), self.flow_store.time):
+                raise ValueError(f"time of {flow_key} doesn't match the shared time of the flow store")
+            self.flow_store.matrix[:, self.flow_store.get_col(flow_key)] = df["flow"].to_numpy()
+            return
         self.df_map_map["qser.inp"][flow_key][:] = df
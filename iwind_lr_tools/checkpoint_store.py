@@ -0,0 +1,171 @@
+"""
+On-disk store of restart states keyed by their chain of steps, see `start_iterator(..., checkpoint_store=...)`.
+"""
+
+import hashlib
+import os
+import pickle
+import shutil
+from pathlib import Path
+from tempfile import mkdtemp
+from typing import List
+import logging
+
+import numpy as np
+
+from .parse_cache import ParseCache, cache_version, hash_file
+from .result_cache import get_root_hash, _HashWriter
+from .collector import dumpable_list
+from .io.common import Node, FlowNode, ConcentrationNode, _hash_update_df
+
+restart_out_to_inp = {
+    "RESTART.OUT": "RESTART.INP",
+    "TEMPBRST.OUT": "TEMPB.RST",
+    "WQWCRST.OUT": "wqini.inp"
+}
+
+staging_prefix = ".staging-"
+
+
+def _hash_update_step_df(h, df, begin, end):
+    # rows inside [begin, end] and one row on each side, which the model interpolates from
+    time = df.iloc[:, 0].to_numpy()
+    lo = max(np.searchsorted(time, begin, side="right") - 1, 0)
+    hi = min(np.searchsorted(time, end, side="left") + 1, len(time))
+    _hash_update_df(h, df.iloc[lo:hi])
+
+
+def hash_step_inputs(h, data_map: dict, begin_day, length):
+    end_day = begin_day + length
+    for fname in dumpable_list:
+        node_list: List[Node] = data_map.get(fname)
+        h.update(repr((fname, node_list is None)).encode("utf8"))
+        if node_list is None:
+            continue # the base file, covered by the key the chain starts from
+        for node in node_list:
+            if isinstance(node, FlowNode):
+                h.update(repr((node.spec, node.depth_line)).encode("utf8"))
+                _hash_update_step_df(h, node.get_df(), begin_day, end_day)
+            elif isinstance(node, ConcentrationNode):
+                h.update(repr(node.spec).encode("utf8"))
+                _hash_update_step_df(h, node.get_df(), begin_day, end_day)
+            else:
+                node.write_cached(_HashWriter(h))
+
+
+class CheckpointStore(ParseCache):
+    # use a directory different from the ones of `ParseCache` and `ResultCache`
+    def __init__(self, store_dir, max_bytes=None):
+        """
+        max_bytes: bound of the stored checkpoints, least recently used ones are evicted first. `None` means unbounded.
+        """
+        super().__init__(store_dir)
+        self.max_bytes = max_bytes
+
+    def get_start_key(self, root):
+        # state before a fresh (not restarting) simulation in a directory created from `root`
+        return self._hash("start", get_root_hash(self, root))
+
+    def get_state_key(self, dst_root):
+        # state held by the restart outputs of a completed simulation directory, when its key is not known
+        dst_root = Path(dst_root)
+        exclude = dumpable_list + list(restart_out_to_inp.values())
+        return self._hash("state", get_root_hash(self, dst_root, exclude=exclude),
+                          [hash_file(dst_root / out_s) for out_s in restart_out_to_inp])
+
+    def get_step_key(self, prev_key, data_map: dict, begin_day, length, out_kwargs_map=None):
+        # time series are hashed only inside the step (time columns in days), so shared prefixes share keys
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((cache_version, "step", prev_key, float(begin_day), float(length))).encode("utf8"))
+        hash_step_inputs(h, data_map, begin_day, length)
+        out_kwargs_map = out_kwargs_map or {}
+        h.update(repr(sorted((k, sorted(v.items())) for k, v in out_kwargs_map.items())).encode("utf8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _hash(*args):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((cache_version,) + args).encode("utf8"))
+        return h.hexdigest()
+
+    def _get_entry(self, key) -> Path:
+        return self.cache_dir / key
+
+    def load(self, key):
+        # the out map of the step ending at checkpoint `key`, `None` if it's not stored
+        entry = self._get_entry(key)
+        try:
+            with open(entry / "out_map.pkl", "rb") as f:
+                out_map = pickle.load(f)
+            os.utime(entry) # mtime is the clock of LRU eviction
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except Exception as e:
+            logging.warning(f"Ignore broken checkpoint {entry}: {e}")
+            return None
+        logging.debug(f"checkpoint hit: {key}")
+        return out_map
+
+    def restore(self, key, dst_root):
+        """
+        Put the restart outputs of checkpoint `key` into `dst_root` (as if it has just simulated the step).
+        All or none of the files are replaced, returns whether the checkpoint is still there.
+        """
+        entry = self._get_entry(key)
+        dst_root = Path(dst_root)
+        tmp_list = []
+        try:
+            for out_s in restart_out_to_inp:
+                tmp_p = dst_root / f".{out_s}.restore"
+                shutil.copy(entry / out_s, tmp_p)
+                tmp_list.append((tmp_p, dst_root / out_s))
+        except FileNotFoundError:
+            for tmp_p, _ in tmp_list:
+                os.unlink(tmp_p)
+            return False
+        for tmp_p, p in tmp_list:
+            os.replace(tmp_p, p)
+        return True
+
+    def save(self, key, src_root, out_map: dict):
+        entry = self._get_entry(key)
+        if entry.exists():
+            return
+        src_root = Path(src_root)
+        staging = Path(mkdtemp(prefix=staging_prefix, dir=self.cache_dir))
+        try:
+            for out_s in restart_out_to_inp:
+                shutil.copy(src_root / out_s, staging / out_s)
+            with open(staging / "out_map.pkl", "wb") as f:
+                pickle.dump(out_map, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            if not entry.exists():
+                raise
+            # saved by another runner in the meantime
+        logging.debug(f"checkpoint saved: {key}")
+        self.evict()
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+
+        entry_list = []
+        for entry in self.cache_dir.iterdir():
+            if not entry.is_dir() or entry.name.startswith(staging_prefix):
+                continue
+            try:
+                size = sum(p.stat().st_size for p in entry.iterdir())
+                entry_list.append((entry.stat().st_mtime_ns, size, entry))
+            except FileNotFoundError:
+                continue
+        entry_list.sort()
+
+        total_bytes = sum(size for _, size, _ in entry_list)
+        for _, size, entry in entry_list:
+            if total_bytes <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total_bytes -= size
+            logging.debug(f"checkpoint evict: {entry}")
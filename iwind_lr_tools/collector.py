@@ -3,12 +3,15 @@ Collect interested files
 """
 
 from iwind_lr_tools.io import cumu_struct_outflow_out
-from iwind_lr_tools.io.common import DataFrameNode, FlowNode, ConcentrationNode
+from iwind_lr_tools.io.common import DataFrameNode, FlowNode, ConcentrationNode, LazyDfMap, set_source
 from pathlib import Path
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+import importlib
 
 from .io import aser_inp, efdc_inp, qbal_out, qser_inp, wqpsc_inp, WQWCTS_OUT, wq3dwc_inp, conc_adjust_inp
+from .parse_cache import ParseCache
 
 class ModelXML:
     def __init__(self, xml_path: str):
@@ -64,6 +67,12 @@ node_cls_map = {
     "wq3dwc.inp": DataFrameNode
 }
 
+# time series accepting `time_begin`/`time_end`
+time_window_list = ["aser.inp", "qser.inp", "wqpsc.inp"]
+
+# cards of master input files are parsed on access, see `LazyDataFrameNode`
+lazy_df_map_list = ["efdc.inp", "wq3dwc.inp"]
+
 dumpable_list = ["efdc.inp", "qser.inp", "wqpsc.inp", "wq3dwc.inp", "conc_adjust.inp"]
 
 # dependences and extra_length_map
@@ -90,37 +99,99 @@ def parse_all(root):
     return parse_map(root, inp_out_map)
 """
 
-def parse_with_resolve(root, io_module_map, max_loop=1000):
-    data_map = {}
-    remain_list = list(io_module_map.keys())
-    for _ in range(max_loop):
-        if len(remain_list) == 0:
-            return data_map
-        
-        for key in remain_list:
-            new_remain_list = []
-            module = io_module_map[key]
-            if key not in dep_map:
-                data_map[key] = module.parse(root / key)
-            else:
-                dep_list, extra_length_map_callback = dep_map[key]
-                for dep in dep_list:
-                    if dep not in dep_list:
-                        break
-                else:
-                    kwargs = extra_length_map_callback(data_map)
-                    data_map[key] = module.parse(root / key, **kwargs)
-                    continue
-                new_remain_list.append(key)
-        remain_list = new_remain_list
-    
-    raise ValueError("max_loop reached, is resolve graph too large or circular reference appear?")
+def _parse_task(module_name, p, kwargs, cache_dir):
+    # module is passed by name so the task can be shipped to a process pool
+    module = importlib.import_module(module_name)
+    if cache_dir is None:
+        return module.parse(p, **kwargs)
+    return ParseCache(cache_dir).parse(module, p, **kwargs)
 
-def parse_all(root):
-    return parse_with_resolve(root, inp_out_map)
+executor_cls_map = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
 
-def parse_out(root):
-    return parse_with_resolve(root, out_map)
+def _pop_ready(waiting_map, data_map):
+    ready_list = [key for key, dep_set in waiting_map.items() if dep_set.issubset(data_map)]
+    for key in ready_list:
+        del waiting_map[key]
+    return ready_list
+
+def parse_with_resolve(root, io_module_map, kwargs_map=None, cache_dir=None, parallel=None, max_workers=None):
+    """
+    Parse files in the order given by `dep_map`, a file is parsed as soon as the files it depends on are parsed.
+
+    kwargs_map: extra keyword arguments passed to some parsers,
+        ex: `{"WQWCTS.OUT": dict(columns=["ROP"], cells=[(3, 4, 1)])}`
+    cache_dir: if given, parsed input files (not output files) are cached there, see `parse_cache`.
+    parallel: `None` parses files one by one, "thread" or "process" parses independent files concurrently
+        in a pool of `max_workers`. "process" sidesteps the GIL but pays for pickling the parsed objects back.
+    """
+    if kwargs_map is None:
+        kwargs_map = {}
+
+    waiting_map = {}
+    for key in io_module_map:
+        dep_list = dep_map[key][0] if key in dep_map else []
+        for dep in dep_list:
+            if dep not in io_module_map:
+                raise ValueError(f"{key} depends on {dep} which is not going to be parsed")
+        waiting_map[key] = set(dep_list)
+
+    data_map = {}
+
+    def get_task(key):
+        kwargs = {}
+        if key in dep_map:
+            _, extra_length_map_callback = dep_map[key]
+            kwargs.update(extra_length_map_callback(data_map))
+        kwargs.update(kwargs_map.get(key, {}))
+        key_cache_dir = cache_dir if key in inp_map else None
+        return _parse_task, io_module_map[key].__name__, root / key, kwargs, key_cache_dir
+
+    def set_result(key, obj):
+        data_map[key] = obj
+        if isinstance(obj, list):
+            set_source(obj, root / key)
+
+    circular_msg = "circular reference in dep_map: {}"
+
+    if parallel is None:
+        while len(waiting_map) > 0:
+            ready_list = _pop_ready(waiting_map, data_map)
+            if len(ready_list) == 0:
+                raise ValueError(circular_msg.format(list(waiting_map)))
+            for key in ready_list:
+                func, *args = get_task(key)
+                set_result(key, func(*args))
+        return data_map
+
+    with executor_cls_map[parallel](max_workers=max_workers) as executor:
+        future_map = {}
+        while len(waiting_map) > 0 or len(future_map) > 0:
+            for key in _pop_ready(waiting_map, data_map):
+                future_map[executor.submit(*get_task(key))] = key
+            if len(future_map) == 0:
+                raise ValueError(circular_msg.format(list(waiting_map)))
+            done, _ = wait(future_map, return_when=FIRST_COMPLETED)
+            for future in done:
+                set_result(future_map.pop(future), future.result())
+    return data_map
+
+def parse_all(root, cache_dir=None, parallel=None, max_workers=None, kwargs_map=None):
+    return parse_with_resolve(root, inp_out_map, kwargs_map=kwargs_map, cache_dir=cache_dir, parallel=parallel, max_workers=max_workers)
+
+def parse_out(root, kwargs_map=None, parallel=None, max_workers=None):
+    return parse_with_resolve(root, out_map, kwargs_map=kwargs_map, parallel=parallel, max_workers=max_workers)
+
+
+def tail_out(root, kwargs_map=None):
+    """
+    A `io.tail.TailReader` for every output file, to read outputs while the model is running.
+    """
+    if kwargs_map is None:
+        kwargs_map = {}
+    return {key: module.tail(Path(root) / key, **kwargs_map.get(key, {})) for key, module in out_map.items()}
 
 
 def get_df_node_map_map_and_df_map_map(data_map):
@@ -128,13 +199,26 @@ def get_df_node_map_map_and_df_map_map(data_map):
     df_map_map = {}
     for key in has_df_map_list:
         df_node_map = node_cls_map[key].get_df_node_map(data_map[key])
-        df_map = {k: v.get_df() for k, v in df_node_map.items()}
+        if key in lazy_df_map_list:
+            df_map = LazyDfMap(df_node_map)
+        else:
+            df_map = {k: v.get_df() for k, v in df_node_map.items()}
         df_node_map_map[key] = df_node_map
         df_map_map[key] = df_map
     return df_node_map_map, df_map_map
 
-def get_all(root):
-    data_map = parse_all(root)
+def get_window_kwargs_map(time_begin=None, time_end=None):
+    return {key: dict(time_begin=time_begin, time_end=time_end) for key in time_window_list}
+
+def get_all(root, cache_dir=None, parallel=None, max_workers=None, time_begin=None, time_end=None):
+    """
+    cache_dir: directory of the persistent parsed-input cache, `None` disables it.
+    parallel: `None`, "thread" or "process", see `parse_with_resolve`.
+    time_begin, time_end: parse only rows in [time_begin, time_end] (days) of the time series in `time_window_list`,
+        for analysis. Their modified nodes can't be dumped.
+    """
+    kwargs_map = get_window_kwargs_map(time_begin, time_end) if (time_begin is not None or time_end is not None) else None
+    data_map = parse_all(root, cache_dir=cache_dir, parallel=parallel, max_workers=max_workers, kwargs_map=kwargs_map)
     df_node_map_map, df_map_map = get_df_node_map_map_and_df_map_map(data_map)
     return data_map, df_node_map_map, df_map_map
 
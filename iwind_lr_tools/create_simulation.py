@@ -2,9 +2,13 @@
 This module provide both function which should be called from REPL and a CLI based on `clize`
 """
 
-from .utils import copy_locked, symlink_locked
+from .utils import copy_locked, symlink_locked, link_file
 from os import symlink
+import os
+import errno
 from pathlib import Path
+from tempfile import mkdtemp
+from shutil import rmtree
 # import shutil
 # import datetime
 # import time
@@ -22,7 +26,10 @@ else:
     selected_name_list_default = None
     warn("selectd_name_list_path_default doesn't existed, run `extract_non_modified_files` to create it")
 
-def create_simulation(origin_root:str, target_root:str, selected_name_list=None):
+def create_simulation(origin_root:str, target_root:str, selected_name_list=None, link_mode="symlink"):
+    """
+    link_mode: "symlink", "hardlink" or "reflink" (copy-on-write copy where supported, otherwise a copy).
+    """
     if selected_name_list is None:
         selected_name_list = selected_name_list_default
 
@@ -48,7 +55,8 @@ def create_simulation(origin_root:str, target_root:str, selected_name_list=None)
         #dst.symlink_to(src)
         # This race-condition shit waste my a lot of time. 
         #"""
-        symlink_locked(src, dst)
+        # link the base file itself rather than a link of a forked directory, so forks outlive their parents
+        link_file(src, Path(os.path.realpath(dst)), link_mode)
         assert src.is_file(), "Created symlink failed?????"
         #"""
         #"""
@@ -64,7 +72,32 @@ def create_simulation(origin_root:str, target_root:str, selected_name_list=None)
         # shutil.copy(src, dst)
         # copy_locked(dst, src)
 
-    logging.info(f"Base Env symbol link {target_root} -> {origin_root}")
+    logging.info(f"Base Env {link_mode} {target_root} -> {origin_root}")
+
+staging_prefix = ".staging-"
+sandbox_prefix = "iwind-"
+
+def create_simulation_atomic(origin_root:str, scratch_root:str=None, selected_name_list=None, link_mode="symlink") -> Path:
+    """
+    Create a new simulation directory in `scratch_root` (system temp directory if `None`) without any global lock.
+    """
+    # links are created in a private staging directory renamed once complete, a half-created one is never visible
+    while True:
+        staging_root = Path(mkdtemp(prefix=staging_prefix + sandbox_prefix, dir=scratch_root))
+        target_root = staging_root.with_name(staging_root.name[len(staging_prefix):])
+        try:
+            create_simulation(origin_root, staging_root, selected_name_list=selected_name_list, link_mode=link_mode)
+        except BaseException:
+            rmtree(staging_root, ignore_errors=True)
+            raise
+        try:
+            os.rename(staging_root, target_root)
+            return target_root
+        except OSError as e:
+            rmtree(staging_root, ignore_errors=True)
+            if e.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                raise
+            # a sandbox got the same random name before, try another one
     
 
 if __name__ == "__main__":
@@ -4,11 +4,34 @@ from warnings import warn
 from multiprocessing.dummy import Pool
 import multiprocessing.dummy
 from queue import Queue
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import Executor, Future, wait, FIRST_EXCEPTION
+import time
 
 class YPoolFailed(Exception):
     pass
 
+class TaskReport:
+    """
+    Attempts used by a task and the errors (failure causes) of its failed attempts.
+    """
+    def __init__(self, idx, attempts, error_list):
+        self.idx = idx
+        self.attempts = attempts
+        self.error_list = error_list
+
+    def is_success(self):
+        return len(self.error_list) < self.attempts
+
+    def __repr__(self):
+        return f"TaskReport(idx={self.idx}, attempts={self.attempts}, error_list={self.error_list!r})"
+
+def get_backoff_delay(backoff, used_quota):
+    # exponential backoff: 0, backoff, 2 * backoff, 4 * backoff, ...
+    if used_quota == 0 or backoff <= 0:
+        return 0.0
+    return backoff * 2 ** (used_quota - 1)
+
 class FAIL:
     def __init__(self, error):
         self.error=error
@@ -41,11 +64,12 @@ def ypool_worker(thread_idx, in_queue, out_queue):
 """
 
 class YPoolThread(Thread):
-    def __init__(self, thread_idx, in_queue, out_queue):
+    def __init__(self, thread_idx, in_queue, out_queue, backoff=0.0):
         super().__init__()
         self.thread_idx = thread_idx
         self.in_queue = in_queue
         self.out_queue = out_queue
+        self.backoff = backoff
 
         self.stoped = False
 
@@ -54,7 +78,6 @@ class YPoolThread(Thread):
 
     def run(self):
         thread_idx, in_queue, out_queue = self.thread_idx, self.in_queue, self.out_queue
-        error = None
 
         while not self.stoped:
             _in = in_queue.get()
@@ -62,24 +85,32 @@ class YPoolThread(Thread):
                 return
             idx, quota, func, arg = _in
             # idx, quota, func, arg = in_queue.get()
+            error_list = []
             for used_quota in range(quota):
+                time.sleep(get_backoff_delay(self.backoff, used_quota))
                 try:
                     res = func(arg)
                 except Exception as e: # TODO: Add some limitation
                     warn(f"worker {thread_idx} task: {idx} (quota:{quota-used_quota-1}/{quota}) fail due to: {e}")
-                    error = e
+                    error_list.append(e)
                     continue
-                out_queue.put((idx, res))
+                out_queue.put((idx, res, TaskReport(idx, used_quota + 1, error_list)))
                 break
             else:
-                out_queue.put((idx, FAIL(error)))
+                out_queue.put((idx, FAIL(error_list[-1]), TaskReport(idx, quota, error_list)))
 
 
 class YPool:
     # dedicated to a shity implemented fortran program
-    def __init__(self, pool_size, quota=3, use_sequential=False, use_dummy_pool=False, use_process=False):
+    def __init__(self, pool_size, quota=3, use_sequential=False, use_dummy_pool=False, use_process=False, backoff=0.0):
+        """
+        backoff: a failed task is retried after `backoff`, `2 * backoff`, `4 * backoff`... seconds.
+        After `map`, `report_list` holds a `TaskReport` for every task (`None` for a task not finished when the pool failed).
+        """
         self.pool_size = pool_size
         self.quota = quota
+        self.backoff = backoff
+        self.report_list = []
 
         self.use_sequential = use_sequential
         self.use_dummy_pool = use_dummy_pool
@@ -93,26 +124,35 @@ class YPool:
 
     def map_sequential(self, func, iterable):
         res_list = []
+        self.report_list = []
         for idx, arg in enumerate(iterable):
+            error_list = []
             for used_quota in range(self.quota):
+                time.sleep(get_backoff_delay(self.backoff, used_quota))
                 try:
                     res = func(arg)
-                    res_list.append(res_list)
                 except Exception as e:
                     warn(f"sequential ({self.quota-used_quota-1}/{self.quota}) fail at {idx} due to {e}")
+                    error_list.append(e)
+                    continue
+                res_list.append(res)
+                self.report_list.append(TaskReport(idx, used_quota + 1, error_list))
+                break
             else:
-                raise YPoolFailed(f"YPool (sequential) failed: {res.error}")
+                self.report_list.append(TaskReport(idx, self.quota, error_list))
+                raise YPoolFailed(f"YPool (sequential) failed at task {idx} after {self.quota} attempts: {error_list}")
         return res_list
 
     def map_threading(self, func, iterable):
         in_queue = Queue()
         out_queue = Queue()
         res_list = [WAIT() for _ in iterable]
+        self.report_list = [None for _ in iterable]
 
         thread_list = []
         for thread_idx in range(self.pool_size):
             # thread = Thread(target=ypool_worker, args=(thread_idx, in_queue, out_queue))
-            thread = YPoolThread(thread_idx, in_queue, out_queue)
+            thread = YPoolThread(thread_idx, in_queue, out_queue, backoff=self.backoff)
             thread.start()
             thread_list.append(thread)
 
@@ -124,9 +164,10 @@ class YPool:
         try:
             completed = 0
             while completed < len(iterable):
-                idx, res = out_queue.get()
+                idx, res, report = out_queue.get()
+                self.report_list[idx] = report
                 if isinstance(res, FAIL):
-                    raise YPoolFailed(f"YPool failed: {res.error}")
+                    raise YPoolFailed(f"YPool failed at task {idx} after {report.attempts} attempts: {report.error_list}")
                 res_list[idx] = res
                 completed += 1
         finally:
@@ -153,3 +194,116 @@ class YPool:
         else:
             return self.map_threading(func, iterable)
                 
+
+
+class BatchExecutor(Executor):
+    """
+    Long-lived `YPool`: the worker threads are started once and shared by the batches of the runner functions
+    (`run_batch(..., batch_executor=ex)`, `restart_batch`, `restart_list_iterator`...) instead of starting
+    `pool_size` threads for every batch. As an `Executor`, plain tasks can be submitted as well.
+
+    with BatchExecutor(pool_size) as ex:
+        for ... in restart_list_iterator(..., batch_executor=ex):
+            ...
+        future = ex.submit(func, *args)
+    """
+    def __init__(self, pool_size, quota=3, backoff=0.0):
+        # quota, backoff: see `YPool`, used by `map_batch`
+        self.pool_size = pool_size
+        self.quota = quota
+        self.backoff = backoff
+
+        self.in_queue = Queue()
+        self.shutdown_lock = Lock()
+        self.is_shutdown = False
+        self.thread_list = []
+        for thread_idx in range(pool_size):
+            thread = Thread(target=self._worker, args=(thread_idx,), daemon=True)
+            thread.start()
+            self.thread_list.append(thread)
+
+    def _worker(self, thread_idx):
+        while True:
+            _in = self.in_queue.get()
+            if isinstance(_in, STOP):
+                return
+            future, func, args, kwargs = _in
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                res = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(res)
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        with self.shutdown_lock:
+            if self.is_shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            future = Future()
+            self.in_queue.put((future, fn, args, kwargs))
+        return future
+
+    def _run_with_quota(self, idx, func, arg):
+        error_list = []
+        for used_quota in range(self.quota):
+            time.sleep(get_backoff_delay(self.backoff, used_quota))
+            try:
+                res = func(arg)
+            except Exception as e:
+                warn(f"task: {idx} (quota:{self.quota-used_quota-1}/{self.quota}) fail due to: {e}")
+                error_list.append(e)
+                continue
+            return res, TaskReport(idx, used_quota + 1, error_list)
+        error = YPoolFailed(f"BatchExecutor failed at task {idx} after {self.quota} attempts: {error_list}")
+        error.report = TaskReport(idx, self.quota, error_list)
+        raise error
+
+    def map_batch(self, func, iterable, report_list=None):
+        """
+        `YPool.map` on the shared threads: results in order, every task is retried within the quota,
+        `YPoolFailed` is raised when a task runs out of it (after the running tasks of the batch finish,
+        the others are cancelled). `report_list` is extended with a `TaskReport` for every task as in `YPool`.
+        Don't call it from a task of the same executor, it would wait for threads it occupies.
+        """
+        future_list = [self.submit(self._run_with_quota, idx, func, arg) for idx, arg in enumerate(iterable)]
+        wait(future_list, return_when=FIRST_EXCEPTION)
+        failed = [future for future in future_list
+                  if future.done() and not future.cancelled() and future.exception() is not None]
+        if len(failed) > 0:
+            for future in future_list:
+                future.cancel()
+            wait(future_list)
+
+        res_list = []
+        for future in future_list:
+            if future.cancelled():
+                report = None
+            elif future.exception() is not None:
+                report = getattr(future.exception(), "report", None)
+            else:
+                res, report = future.result()
+                res_list.append(res)
+            if report_list is not None:
+                report_list.append(report)
+
+        if len(failed) > 0:
+            raise failed[0].exception()
+        return res_list
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self.shutdown_lock:
+            if self.is_shutdown:
+                return
+            self.is_shutdown = True
+            if cancel_futures:
+                while not self.in_queue.empty():
+                    _in = self.in_queue.get_nowait()
+                    if not isinstance(_in, STOP):
+                        _in[0].cancel()
+            for _ in self.thread_list:
+                self.in_queue.put(STOP())
+        if wait:
+            for thread in self.thread_list:
+                thread.join()
@@ -1,5 +1,50 @@
-
 import pandas as pd
 
-def parse(p):
-    return pd.read_csv(p, delim_whitespace=True)
+from .tail import TailReader
+
+index_keys = ["TIME", "I", "J", "K"]
+cell_keys = ["I", "J", "K"]
+
+def parse(p, *, columns=None, cells=None, chunksize=100_000):
+    """
+    columns: water quality keys to keep (ex: `["ROP"]`), `None` keeps all of them. TIME, I, J, K are always kept.
+    cells: (I, J, K) tuples to keep, `None` keeps all cells. Rows are filtered chunk by chunk,
+        so peak memory is bounded by `chunksize` rather than the size of the file.
+    """
+    usecols = _get_usecols(columns)
+
+    if cells is None:
+        return pd.read_csv(p, delim_whitespace=True, usecols=usecols)
+
+    cells = _get_cell_index(cells)
+    df_list = []
+    for df in pd.read_csv(p, delim_whitespace=True, usecols=usecols, chunksize=chunksize):
+        df_list.append(_select_cells(df, cells))
+    return pd.concat(df_list, ignore_index=True)
+
+def _get_usecols(columns):
+    return None if columns is None else index_keys + [key for key in columns if key not in index_keys]
+
+def _get_cell_index(cells):
+    return pd.MultiIndex.from_tuples([tuple(cell) for cell in cells], names=cell_keys)
+
+def _select_cells(df, cell_index):
+    mask = pd.MultiIndex.from_frame(df[cell_keys]).isin(cell_index)
+    return df[mask]
+
+def tail(p, *, columns=None, cells=None, chunksize=None):
+    """
+    Follow a WQWCTS.OUT being written, see `io.tail.TailReader`. `columns` and `cells` are same as `parse`,
+    `chunksize` is accepted so the same `kwargs_map` works for both.
+    """
+    usecols = _get_usecols(columns)
+    cell_index = None if cells is None else _get_cell_index(cells)
+
+    def select(df):
+        if usecols is not None:
+            df = df[[key for key in df.columns if key in usecols]] # keep file order as `read_csv(usecols=...)`
+        if cell_index is not None:
+            df = _select_cells(df, cell_index)
+        return df
+
+    return TailReader(p, select=select)
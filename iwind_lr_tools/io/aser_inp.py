@@ -2,7 +2,7 @@
 from io import StringIO
 import pandas as pd
 
-from .utils import path_to_lines
+from .utils import path_to_lines, slice_lines_by_time, is_windowed
 
 aser_header_txt = "time	pressure	temperature	humidity	rain	evaporate	sun	cloud"
 aser_header = aser_header_txt.split("\t")   
@@ -14,8 +14,17 @@ def parse_aser_py(p):
 """
 
 @path_to_lines
-def parse(lines):
-    df = pd.read_csv(StringIO("\n".join(lines[:-1])), comment="#", sep="\t", header=None, names=aser_header)
+def parse(lines, *, time_begin=None, time_end=None):
+    """
+    time_begin, time_end: keep only rows in [time_begin, time_end] (days), other rows are not parsed.
+    """
+    lines = lines[:-1]
+    if is_windowed(time_begin, time_end):
+        num_comment = 0
+        while num_comment < len(lines) and lines[num_comment].startswith("#"):
+            num_comment += 1
+        lines = slice_lines_by_time(lines[num_comment:], time_begin, time_end)
+    df = pd.read_csv(StringIO("\n".join(lines)), comment="#", sep="\t", header=None, names=aser_header)
     return df
 
 """
@@ -1,6 +1,13 @@
 import pandas as pd
+import numpy as np
 from typing import List
 from io import StringIO
+from pathlib import Path
+from collections.abc import Mapping
+import hashlib
+import os
+
+from .utils import slice_lines_by_time, is_windowed
 
 def df_to_str(df, index=False, header=False, **kwargs):
     buf = StringIO()
@@ -8,8 +15,77 @@ def df_to_str(df, index=False, header=False, **kwargs):
     buf.seek(0)
     return buf.read()
 
+def _format_column(values: np.ndarray):
+    # format every distinct value once like `DataFrame.to_csv` (`repr` for float64)
+    if values.dtype == np.float64:
+        if np.isnan(values).any():
+            return None # to_csv writes NaN as empty string
+        uniq, inv = np.unique(values.view(np.int64), return_inverse=True) # bitwise, keep -0.0 apart from 0.0
+        uniq_str = [repr(value) for value in uniq.view(np.float64).tolist()]
+    elif values.dtype.kind in {"i", "u"}:
+        uniq, inv = np.unique(values, return_inverse=True)
+        uniq_str = [str(value) for value in uniq.tolist()]
+    else:
+        return None
+    return np.array(uniq_str, dtype=object)[inv.reshape(-1)]
+
+def fast_df_to_str(df: pd.DataFrame, sep: str):
+    """
+    Same text as `df_to_str(df, sep=sep)` without `DataFrame.to_csv` for numeric tables.
+    """
+    nrows, ncols = df.shape
+    if nrows == 0 or ncols == 0:
+        return df_to_str(df, sep=sep)
+
+    table = np.empty((nrows, ncols), dtype=object)
+    for col, (_, ser) in enumerate(df.items()):
+        formatted = _format_column(ser.to_numpy())
+        if formatted is None:
+            return df_to_str(df, sep=sep)
+        table[:, col] = formatted
+
+    row_format = sep.join(["%s"] * ncols) + "\n"
+    return (row_format * nrows) % tuple(table.ravel().tolist())
+
+def join_lines(lines: List[str]) -> str:
+    return "\n".join(line.rstrip("\n") for line in lines)
+
+def _hash_update_df(h, df: pd.DataFrame):
+    # Column names are not dumped (header=False), so they're not hashed.
+    h.update(repr((df.shape, [str(dtype) for dtype in df.dtypes])).encode())
+    for _, ser in df.items():
+        values = ser.to_numpy()
+        if values.dtype.kind in {"i", "u", "f", "b"}:
+            h.update(np.ascontiguousarray(values).tobytes())
+        else:
+            h.update(repr(values.tolist()).encode())
+
+def get_source(p):
+    """
+    Identity of the file which `p` finally points to, used to decide whether a symbolic link (or a hard link)
+    still shows the parsed text.
+    """
+    stat = os.stat(p)
+    return (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def set_source(node_list: List["Node"], p):
+    source = get_source(p)
+    for idx, node in enumerate(node_list):
+        node.source = (source, idx, len(node_list))
+
 
 class Node:
+    """
+    A node parsed from text remembers that text (`raw_text`), `dumps` reuses it while the node is clean.
+    A node is dirty when it's flagged by `mark_dirty` (`set_df` and the `Actioner` setters do it)
+    or when its content no longer matches the fingerprint taken at parse time (ex: `df.loc[...] = ...`).
+    """
+    raw_text = None
+    dirty = True
+    source = None # ((st_dev, st_ino, mtime_ns, size), index in file, number of nodes in file), see `set_source`
+    _fingerprint = None
+    window = None # (time_begin, time_end) if only a time window of the table is parsed
+
     @staticmethod
     def from_str_list(str_list: List[str]):
         raise NotImplementedError
@@ -23,6 +99,46 @@ class Node:
         
     def to_str(self) -> str:
         return "\n".join(self.to_str_list())
+
+    def write(self, f):
+        # Subclasses holding a numeric table override it with `fast_df_to_str`.
+        f.write(self.to_str())
+
+    def fingerprint(self):
+        h = hashlib.blake2b(digest_size=16)
+        self._hash_update(h)
+        return h.digest()
+
+    def _hash_update(self, h):
+        h.update(self.to_str().encode())
+
+    def set_raw_text(self, raw_text: str):
+        self.raw_text = raw_text
+        self._fingerprint = self.fingerprint()
+        self.dirty = False
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def is_dirty(self):
+        return self.dirty or self.raw_text is None or self.fingerprint() != self._fingerprint
+
+    def to_str_cached(self) -> str:
+        if self.is_dirty():
+            self._check_serializable()
+            return self.to_str()
+        return self.raw_text
+
+    def write_cached(self, f):
+        if self.is_dirty():
+            self._check_serializable()
+            self.write(f)
+        else:
+            f.write(self.raw_text)
+
+    def _check_serializable(self):
+        if self.window is not None:
+            raise ValueError(f"{self.__class__.__name__} parsed in time window {self.window} is modified, only the unmodified text can be dumped.")
     
     def __str__(self):
         return f"{self.__class__}:\n {self.obj.__str__()}" 
@@ -43,6 +159,15 @@ class CommentNode(Node):
     def to_str_list(self) -> List[str]:
         return self.obj
 
+    def is_dirty(self):
+        return False
+
+    def to_str_cached(self) -> str:
+        return self.to_str()
+
+    def write_cached(self, f):
+        f.write(self.to_str())
+
 def _read_csv_from_row_list(row_list):
     return pd.read_csv(StringIO("\n".join(row_list)), header=None, delim_whitespace=True)
 
@@ -77,7 +202,9 @@ class DataFrameNode(AbstractDataFrameNode):
         if len(str_list) == 1 and str_list[0] == "":
             return DataFrameNode(None) # "empty" dataframe
         """
-        return DataFrameNode(_read_csv_from_row_list(str_list))
+        node = DataFrameNode(_read_csv_from_row_list(str_list))
+        node.set_raw_text(join_lines(str_list))
+        return node
 
     @staticmethod
     def from_dataframe(df: pd.DataFrame):
@@ -101,6 +228,16 @@ class DataFrameNode(AbstractDataFrameNode):
             text = text[:-1]
         return text
 
+    def write(self, f):
+        text = fast_df_to_str(self.obj, sep=" ")
+        if len(text) > 0:
+            assert text[-1] == "\n"
+            text = text[:-1]
+        f.write(text)
+
+    def _hash_update(self, h):
+        _hash_update_df(h, self.obj)
+
     def set_header(self, header):
         self.obj.columns = header
 
@@ -110,6 +247,7 @@ class DataFrameNode(AbstractDataFrameNode):
     def set_df(self, df):
         # self.obj[:] = df
         self.obj = df
+        self.mark_dirty()
 
     def set_name(self, name:str):
         self._name = name
@@ -117,29 +255,112 @@ class DataFrameNode(AbstractDataFrameNode):
     def get_name(self):
         return self._name
 
+class LazyDataFrameNode(DataFrameNode):
+    """
+    Card of a master input file (efdc.inp, wq3dwc.inp). The raw lines are kept and the DataFrame is built
+    by `pd.read_csv` on the first `get_df()`, so a card which is never touched costs no pandas call
+    and is dumped verbatim.
+    """
+    def __init__(self, str_list: List[str], header=None, name=None):
+        self._str_list = str_list
+        self._obj = None
+        self._header = header
+        self._name = name
+        self.raw_text = join_lines(str_list)
+        self.dirty = False
+
+    @property
+    def obj(self):
+        if self._obj is None:
+            df = _read_csv_from_row_list(self._str_list)
+            if self._header is not None:
+                df.columns = self._header
+            self._obj = df
+            self._fingerprint = self.fingerprint()
+        return self._obj
+
+    @obj.setter
+    def obj(self, df):
+        self._obj = df
+
+    def is_loaded(self):
+        return self._obj is not None
+
+    def is_dirty(self):
+        if self.dirty:
+            return True
+        return self.is_loaded() and self.fingerprint() != self._fingerprint
+
+    def set_header(self, header):
+        self._header = header
+        if self.is_loaded():
+            self._obj.columns = header
+
+
+class LazyDfMap(Mapping):
+    """
+    `{name: node.get_df()}` view over a node map, a frame is fetched (and built for `LazyDataFrameNode`) on access.
+    """
+    def __init__(self, df_node_map: dict):
+        self.df_node_map = df_node_map
+
+    def __getitem__(self, key):
+        return self.df_node_map[key].get_df()
+
+    def __iter__(self):
+        return iter(self.df_node_map)
+
+    def __len__(self):
+        return len(self.df_node_map)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({list(self.df_node_map)})"
+
+
 class FlowNode(AbstractDataFrameNode): # qser main data
-    def __init__(self, lines):
-        
-        self.spec = lines[0].strip().split()
-        assert len(self.spec) == 8, f"wrong flow spec, {self.spec}"
-        self.depth_line = lines[1].strip()
-        assert int(self.depth_line.strip()) == 1, f"This version assume target has only 1 depth, but found {self.depth_line}"
-        
+    def __init__(self, lines, *, time_begin=None, time_end=None):
+
+        spec = lines[0].strip().split()
+        depth_line = lines[1].strip()
+
         table_data = lines[2:]
+        if is_windowed(time_begin, time_end):
+            table_data = slice_lines_by_time(table_data, time_begin, time_end)
+            self.window = (time_begin, time_end)
         buf = StringIO('\n'.join(table_data))
-        self.df = pd.read_csv(buf, header=None, names=["time", "flow"], delim_whitespace=True)
-        
-        self.length = len(lines) - 2
+        df = pd.read_csv(buf, header=None, names=["time", "flow"], delim_whitespace=True)
+
+        self._setup(spec, depth_line, df, len(table_data))
+        self.set_raw_text(join_lines(lines))
+
+    def _setup(self, spec, depth_line, df, length):
+        self.spec = spec
+        assert len(self.spec) == 8, f"wrong flow spec, {self.spec}"
+        self.depth_line = depth_line
+        assert int(self.depth_line.strip()) == 1, f"This version assume target has only 1 depth, but found {self.depth_line}"
+
+        self.df = df
+
+        self.length = length
         self.somewhat_length = int(self.spec[1]) # 0 or something like 5856
-        
+
         # if self.somewhat_length != 0:
         #     assert self.somewhat_length == self.length
-            
+
         self.obj = (self.spec, self.depth_line, self.df)
-            
+
     @staticmethod
-    def from_str_list(str_list: List[str]):
-        return FlowNode(str_list)
+    def from_str_list(str_list: List[str], *, time_begin=None, time_end=None):
+        return FlowNode(str_list, time_begin=time_begin, time_end=time_end)
+
+    @staticmethod
+    def from_dataframe(spec: List[str], depth_line: str, df: pd.DataFrame):
+        """
+        Build a node from an already parsed table (see `qser_inp.parse_vectorized`), skipping `pd.read_csv`.
+        """
+        node = FlowNode.__new__(FlowNode)
+        node._setup(spec, depth_line, df, df.shape[0])
+        return node
     
     def to_str(self):
         # TODO: Is leftpad 2 tabs necessary?
@@ -152,11 +373,25 @@ class FlowNode(AbstractDataFrameNode): # qser main data
         """
         s = df_to_str(df, sep="\t")
         return "\n".join(["\t".join(self.spec), self.depth_line, s])
+
+    def write(self, f):
+        f.write("\t".join(self.spec) + "\n" + self.depth_line + "\n")
+        f.write(fast_df_to_str(self.df, sep="\t"))
         
     
     def get_df(self):
         return self.df
 
+    def set_df(self, df):
+        self.df = df
+        self.length = df.shape[0]
+        self.obj = (self.spec, self.depth_line, self.df)
+        self.mark_dirty()
+
+    def _hash_update(self, h):
+        h.update(repr((self.spec, self.depth_line)).encode())
+        _hash_update_df(h, self.df)
+
     def get_name(self):
         return self.spec[-1]
 
@@ -165,28 +400,41 @@ class ConcentrationNode(AbstractDataFrameNode):
     While we can extract some common parts from `FlowNode` and `ConcentrationNode`,
     the benefit to do it is too small so the code is just copied and modified.
     """
-    def __init__(self, lines, *, names):
+    def __init__(self, lines, *, names, time_begin=None, time_end=None):
         self.spec = lines[0].strip().split()
         assert len(self.spec) == 7, f"wrong concentration spec, {self.spec}"
 
         table_data = lines[1:]
+        if is_windowed(time_begin, time_end):
+            table_data = slice_lines_by_time(table_data, time_begin, time_end)
+            self.window = (time_begin, time_end)
 
         buf = StringIO('\n'.join(table_data))
         self.df = pd.read_csv(buf, header=None, names=names, delim_whitespace=True)
         
-        self.length = len(lines) - 1
+        self.length = len(table_data)
 
         self.obj = (self.spec, self.df)
 
+        self.set_raw_text(join_lines(lines))
+
     @staticmethod
-    def from_str_list(str_list: List[str], *, names):
-        return ConcentrationNode(str_list, names=names)
+    def from_str_list(str_list: List[str], *, names, time_begin=None, time_end=None):
+        return ConcentrationNode(str_list, names=names, time_begin=time_begin, time_end=time_end)
     
     def to_str(self):
         # TODO: Is leftpad 2 tabs necessary?
         df = self.df
         s = df_to_str(df, sep="\t")
         return "\n".join(["\t".join(self.spec), s])
+
+    def write(self, f):
+        f.write("\t".join(self.spec) + "\n")
+        f.write(fast_df_to_str(self.df, sep="\t"))
+
+    def _hash_update(self, h):
+        h.update(repr(self.spec).encode())
+        _hash_update_df(h, self.df)
         
     def get_df(self):
         return self.df
@@ -207,6 +455,8 @@ class FlowAdjustMatrixNode(Node):
         self.df = pd.read_csv(buf, header=None, names=names, delim_whitespace=True)
         self.obj = (self.time, self.df)
 
+        self.set_raw_text(join_lines(lines))
+
     def get_df(self):
         return self.df
 
@@ -219,16 +469,51 @@ class FlowAdjustMatrixNode(Node):
         s = df_to_str(df, sep="\t")
         return "\n".join([f"{self.time}", s])
 
+    def write(self, f):
+        f.write(f"{self.time}\n")
+        f.write(fast_df_to_str(self.df, sep="\t"))
+
+    def _hash_update(self, h):
+        h.update(self.time.encode())
+        _hash_update_df(h, self.df)
+
     def set_df(self, df):
         self.df = df
         #self.df[:] = df
+        self.obj = (self.time, self.df)
+        self.mark_dirty()
 
 
 def dumps(node_list: List[Node]):
     """
     All "projection" files should follow List[Node] format to prevent fragile code somewhat.
+    Clean nodes emit the text they were parsed from.
+    """
+    return "\n".join(node.to_str_cached() for node in node_list)
+
+def dump(node_list: List[Node], f):
+    """
+    Streaming counterpart of `dumps`, write node by node into an opened text file `f`, the text is identical.
+    """
+    for idx, node in enumerate(node_list):
+        if idx > 0:
+            f.write("\n")
+        node.write_cached(f)
+
+def is_clean_link(node_list: List[Node], p):
+    """
+    Whether file `p` (typically a link created by `create_simulation`) already holds exactly
+    what `node_list` would dump: every node is clean and the list is the unchanged node list parsed from
+    the same, unmodified file.
     """
-    return "\n".join(node.to_str() for node in node_list)
+    p = Path(p)
+    if not p.exists() or len(node_list) == 0:
+        return False
+    source = get_source(p)
+    for idx, node in enumerate(node_list):
+        if node.source != (source, idx, len(node_list)):
+            return False
+    return not any(node.is_dirty() for node in node_list)
 
 """
 class NodeListSuit:
@@ -29,6 +29,7 @@ def parse(lines, *, nrows):
     assert num_matrix_str.isdigit()
     num_matrix = int(num_matrix_str)
     node = DataFrameNode(pd.DataFrame({"num_matrix": [num_matrix]}))
+    node.set_raw_text(num_matrix_str)
     node_list.append(node)
 
     for _ in range(num_matrix):
@@ -42,7 +43,7 @@ def parse(lines, *, nrows):
     return node_list
 
 def parse_dep(data_map):
-    C07 = DataFrameNode.get_df_map(data_map["efdc.inp"])["C07"]
+    C07 = DataFrameNode.get_df_node_map(data_map["efdc.inp"])["C07"].get_df()
     NQSIJ = C07["NQSIJ"].iloc[0]
     NQSER = C07["NQSER"].iloc[0]
     assert NQSIJ == NQSER
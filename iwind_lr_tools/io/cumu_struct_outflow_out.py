@@ -1,4 +1,9 @@
 import pandas as pd
 
+from .tail import TailReader
+
 def parse(p):
     return pd.read_csv(p, delim_whitespace=True)
+
+def tail(p):
+    return TailReader(p)
@@ -8,7 +8,7 @@ import pandas as pd
 from copy import deepcopy
 from collections import OrderedDict
 
-from .common import DataFrameNode, CommentNode
+from .common import DataFrameNode, LazyDataFrameNode, CommentNode
 
 
 def generate_parse(card_info_dsl, forward_lookup_map, length_map_init):
@@ -54,6 +54,7 @@ def generate_parse(card_info_dsl, forward_lookup_map, length_map_init):
             if length_map[key] == 0:
                 df = pd.DataFrame([], columns=fields)
                 df_node = DataFrameNode.from_dataframe(df)
+                df_node.set_raw_text("") # the empty card is dumped as an empty line
                 node_list.append(df_node)
                 continue
             for line in it_lines:
@@ -63,17 +64,16 @@ def generate_parse(card_info_dsl, forward_lookup_map, length_map_init):
                 df_remain.append(line)
                 if len(df_remain) == length_map[key]:
                     
-                    df_node = DataFrameNode.from_str_list(df_remain)
+                    # The frame is built lazily, only cards driving a forward lookup are parsed here.
+                    df_node = LazyDataFrameNode(df_remain, header=fields, name=key)
                     comment_node = CommentNode.from_str_list(comment_remain)
                     df_remain = []
                     comment_remain = []
                     node_list.append(comment_node)
                     node_list.append(df_node)
                     
-                    df_node.set_header(fields)
-                    df_node.set_name(key)
-                    df = df_node.get_df()
                     if key in forward_lookup_map:
+                        df = df_node.get_df()
                         for field, set_cards in forward_lookup_map[key].items():
                             value = df[field].iloc[0]
                             for set_card in set_cards:
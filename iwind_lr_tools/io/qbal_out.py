@@ -4,6 +4,8 @@ from typing import List
 from warnings import warn
 from io import StringIO
 
+from .tail import TailReader
+
 qbac_header_text_raw = "                                                 jday elev(m) qin(million-m3)qou(million-m3)  qctlo(million-m3)  qin(m) qou(m) qctlo(m) rain(m) eva(m)\n"
 
 # "qin(million-m3)qou(million-m3)" -> "qin(million-m3) qou(million-m3)"
@@ -17,3 +19,6 @@ def parse(lines: List[str]):
         # assert False
     buf = StringIO("\n".join(lines[1:]))
     return pd.read_csv(buf, header=None, delim_whitespace=True, names=qbac_header)
+
+def tail(p):
+    return TailReader(p, names=qbac_header, skip_lines=1)
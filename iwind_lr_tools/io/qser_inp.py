@@ -1,13 +1,28 @@
 
 from typing import List
+from copy import deepcopy
+import numpy as np
+import pandas as pd
 
-from .utils import path_to_lines, iter_strip
+from .utils import path_to_lines, iter_strip, slice_array_by_time, is_windowed
 from .common import Node, FlowNode, CommentNode #, NodeListSuit
 
+flow_header = ["time", "flow"]
 
 
 @path_to_lines
-def parse(lines: List[str]):
+def parse(lines: List[str], *, vectorized=True, time_begin=None, time_end=None):
+    """
+    `vectorized=False` falls back to the line-by-line parser, which calls `pd.read_csv` once per flow.
+    time_begin, time_end: frames hold only rows in [time_begin, time_end] (days).
+        The nodes still dump the full text while they're unmodified, a modified node refuses to be dumped.
+    """
+    if vectorized:
+        return parse_vectorized(lines, time_begin=time_begin, time_end=time_end)
+    return parse_line_by_line(lines, time_begin=time_begin, time_end=time_end)
+
+
+def parse_line_by_line(lines: List[str], *, time_begin=None, time_end=None):
     comment_lines = []
 
     # it_lines = iter(lines)
@@ -27,18 +42,224 @@ def parse(lines: List[str]):
     flow_node_list = []
     for line in it_lines:
         if len(line.strip().split()) == 8:
-            flow_node = FlowNode(content_lines)
+            flow_node = FlowNode(content_lines, time_begin=time_begin, time_end=time_end)
             flow_node_list.append(flow_node)
             content_lines = [line]
         else:
             content_lines.append(line)
     if len(content_lines) > 0:
-        flow_node_list.append(FlowNode(content_lines))
+        flow_node_list.append(FlowNode(content_lines, time_begin=time_begin, time_end=time_end))
+
+    node_list = [comment_node] + flow_node_list
+
+    return node_list
+
+
+_whitespace_table = np.zeros(256, dtype=bool)
+_whitespace_table[[ord(c) for c in " \t\n\r\v\f"]] = True
+
+
+# a token holding none of them is an integer literal for `pd.read_csv`
+_non_int_table = np.zeros(256, dtype=bool)
+_non_int_table[list(b".eEnNiI")] = True
+
+
+def parse_vectorized(lines: List[str], *, time_begin=None, time_end=None):
+    """
+    Tokenize the whole file once with NumPy, locate 8-field spec lines by position and parse
+    all flow tables with a single `np.fromstring` call instead of one `pd.read_csv` per flow.
+    `dumps` output is identical to `parse_line_by_line`: like it, the raw text of a node holds stripped lines.
+    """
+    it_lines = iter_strip(lines)
+
+    comment_lines = []
+    for line in it_lines:
+        if line[0] == "#":
+            comment_lines.append(line)
+        else:
+            break
+    comment_node = CommentNode.from_str_list(comment_lines)
+
+    content_lines = lines[len(comment_lines):]
+    buf = "".join(content_lines).encode("utf8")
+    arr = np.frombuffer(buf, dtype=np.uint8)
+
+    # number of whitespace-separated fields in every line
+    is_ws = _whitespace_table[arr]
+    token_begin = np.flatnonzero(~is_ws[1:] & is_ws[:-1]) + 1
+    if len(arr) > 0 and not is_ws[0]:
+        token_begin = np.insert(token_begin, 0, 0)
+    token_end = np.flatnonzero(is_ws[1:] & ~is_ws[:-1]) + 1
+    if len(arr) > 0 and not is_ws[-1]:
+        token_end = np.append(token_end, len(arr))
+    non_int_cumsum = np.append(0, np.cumsum(_non_int_table[arr]))
+    token_is_int = non_int_cumsum[token_end] == non_int_cumsum[token_begin]
+    newline_pos = np.flatnonzero(arr == ord("\n"))
+    line_begin = np.append(0, newline_pos + 1)
+    num_lines = len(line_begin)
+    num_fields = np.bincount(np.searchsorted(newline_pos, token_begin), minlength=num_lines)
+    line_stop = np.append(newline_pos, len(buf)) # "\n" excluded
+    # lines already stripped (ex: written by `dump`) are sliced from the buffer as is for the raw text
+    is_empty = line_stop == line_begin
+    last = max(len(arr) - 1, 0)
+    line_is_stripped = is_empty | ~(is_ws[np.minimum(line_begin, last)] | is_ws[np.maximum(line_stop - 1, 0)])
+    line_begin = np.append(line_begin, len(buf))
+
+    spec_idx = np.flatnonzero(num_fields == 8)
+    assert len(spec_idx) > 0 and spec_idx[0] == 0, f"wrong flow spec, {content_lines[0].split()}"
+    table_end = np.append(spec_idx[1:], num_lines)
+    table_begin = np.minimum(spec_idx + 2, table_end) # skip spec line and depth line
+
+    table_buf_list = []
+    table_size_list = []
+    table_token_list = [] # token range of every table
+    for i, begin, end in zip(spec_idx, table_begin, table_end):
+        table_num_fields = num_fields[begin: end]
+        # blank lines are skipped by `pd.read_csv` as well
+        assert np.all((table_num_fields == 2) | (table_num_fields == 0)), f"wrong qser table in {content_lines[i].split()}"
+        table_buf_list.append(buf[line_begin[begin]: line_begin[end]])
+        table_size_list.append(table_num_fields.sum() // 2)
+        table_token_list.append(np.searchsorted(token_begin, [line_begin[begin], line_begin[end]]))
+
+    # One big (row, 2) array, every flow table is a view into it.
+    data = np.fromstring(b"\n".join(table_buf_list), sep=" ")
+    assert len(data) == 2 * sum(table_size_list), "non-numeric value found in qser table"
+    data = data.reshape(-1, 2)
+    table_offset = np.append(0, np.cumsum(table_size_list))
+
+    flow_node_list = []
+    for idx, i in enumerate(spec_idx):
+        spec = content_lines[i].strip().split()
+        depth_line = content_lines[i + 1].strip() if i + 1 < len(content_lines) else ""
+
+        table = data[table_offset[idx]: table_offset[idx + 1]]
+        token_lo, token_hi = table_token_list[idx]
+        table_is_int = token_is_int[token_lo: token_hi].reshape(-1, 2)
+        if is_windowed(time_begin, time_end):
+            row_slice = slice_array_by_time(table[:, 0], time_begin, time_end)
+            table = table[row_slice]
+            table_is_int = table_is_int[row_slice]
+        df = pd.DataFrame(table, columns=flow_header, copy=False)
+
+        # `pd.read_csv` infers int64 for a column holding integer literals only (ex: a pump with "0" flow),
+        # this is reproduced to keep `dumps` byte-identical.
+        for col, key in enumerate(flow_header):
+            values = df[key].to_numpy()
+            if len(values) > 0 and np.all(np.isfinite(values) & (values == np.floor(values))):
+                if np.all(table_is_int[:, col]):
+                    df[key] = values.astype(np.int64)
+
+        flow_node = FlowNode.from_dataframe(spec, depth_line, df)
+        if is_windowed(time_begin, time_end):
+            flow_node.window = (time_begin, time_end)
+        end = table_end[idx]
+        if np.all(line_is_stripped[i: end]):
+            raw_text = buf[line_begin[i]: line_begin[end]].decode("utf8")
+            raw_text = raw_text[:-1] if raw_text.endswith("\n") else raw_text # as `join_lines`
+        else:
+            raw_text = "\n".join([line.strip() for line in content_lines[i: end]])
+        flow_node.set_raw_text(raw_text)
+        flow_node_list.append(flow_node)
 
     node_list = [comment_node] + flow_node_list
 
     return node_list
 
+
+def _set_df_keep_clean(node: FlowNode, df: pd.DataFrame):
+    # `set_df` which leaves a clean node clean when the values are unchanged, so its parsed text is still dumped
+    was_clean = not node.is_dirty()
+    df_old = node.get_df()
+    node.set_df(df)
+    if was_clean and all(np.array_equal(df_old[key].to_numpy(), df[key].to_numpy()) for key in flow_header):
+        node._fingerprint = node.fingerprint()
+        node.dirty = False
+
+
+def _bind_view(node: FlowNode, time: np.ndarray, flow: np.ndarray):
+    _set_df_keep_clean(node, pd.DataFrame({"time": time, "flow": flow}, copy=False))
+
+
+class FlowStore:
+    """
+    Columnar backend for qser.inp: one contiguous (time, flow) float64 matrix plus a shared time vector.
+    The frame of every bound `FlowNode` is a view into them, so writing `matrix` is reflected in `get_df()` and `dumps`.
+
+    Replacing a column of a bound frame (ex: `df["flow"] = 0`) detaches it, write through `matrix` instead.
+    Bound flow columns are float64, binding doesn't make a node dirty though: unmodified flows are still dumped
+    (or linked) as parsed, and `detach` restores the integer columns whose values are still integers.
+    """
+    def __init__(self, flow_node_list: List[FlowNode], time: np.ndarray, matrix: np.ndarray, dtype_list=None):
+        # dtype_list: original dtypes of the flow columns
+        self.flow_node_list = flow_node_list
+        self.time = time
+        self.matrix = matrix
+        self.dtype_list = dtype_list if dtype_list is not None else [matrix.dtype] * matrix.shape[1]
+        self.col_map = {node.get_name(): col for col, node in enumerate(flow_node_list)}
+        self.bind()
+
+    @staticmethod
+    def from_node_list(node_list: List[Node]):
+        flow_node_list = FlowNode.get_df_node_list(node_list)
+        assert len(flow_node_list) > 0, "qser.inp has no flow"
+
+        time = flow_node_list[0].get_df()["time"].to_numpy()
+        for node in flow_node_list[1:]:
+            node_time = node.get_df()["time"].to_numpy()
+            if node_time.dtype != time.dtype or not np.array_equal(node_time, time):
+                raise ValueError(f"Flow {node.get_name()} doesn't share time with {flow_node_list[0].get_name()}, columnar store requires aligned flows.")
+
+        matrix = np.empty((len(time), len(flow_node_list)), dtype=np.float64)
+        for col, node in enumerate(flow_node_list):
+            matrix[:, col] = node.get_df()["flow"].to_numpy()
+
+        dtype_list = [node.get_df()["flow"].dtype for node in flow_node_list]
+        return FlowStore(flow_node_list, time.copy(), matrix, dtype_list)
+
+    def bind(self):
+        for col, node in enumerate(self.flow_node_list):
+            _bind_view(node, self.time, self.matrix[:, col])
+
+    def detach(self):
+        for node, dtype in zip(self.flow_node_list, self.dtype_list):
+            df = node.get_df().copy()
+            flow = df["flow"].to_numpy()
+            if dtype.kind in {"i", "u"} and np.all(flow == np.floor(flow)):
+                df["flow"] = flow.astype(dtype)
+            _set_df_keep_clean(node, df)
+
+    def get_col(self, flow_key):
+        return self.col_map[flow_key]
+
+    def copy(self, node_list: List[Node]):
+        """
+        Copy `node_list` (`data_map["qser.inp"]`) whose flow nodes are bound to this store,
+        flow data is copied in one shot rather than a frame per flow.
+        """
+        col_of = {id(node): col for col, node in enumerate(self.flow_node_list)}
+        col_list = [col_of[id(node)] for node in node_list if isinstance(node, FlowNode)]
+        if col_list == list(range(self.matrix.shape[1])):
+            matrix = self.matrix.copy()
+        else:
+            matrix = self.matrix[:, col_list] # fancy indexing returns a contiguous copy
+
+        new_node_list = []
+        flow_node_list = []
+        for node in node_list:
+            if isinstance(node, FlowNode):
+                node_copied = FlowNode.from_dataframe(list(node.spec), node.depth_line, node.get_df())
+                # the copy is as clean as `node` is, see `_set_df_keep_clean`
+                for attr in ["window", "source", "raw_text", "_fingerprint", "dirty"]:
+                    setattr(node_copied, attr, getattr(node, attr))
+                node = node_copied
+                flow_node_list.append(node)
+            else:
+                node = deepcopy(node)
+            new_node_list.append(node)
+
+        dtype_list = [self.dtype_list[col] for col in col_list]
+        return FlowStore(flow_node_list, self.time.copy(), matrix, dtype_list), new_node_list
+
 """
 def get_df_node_list(node_list: List[Node]):
     return [node for node in node_list if isinstance(node, FlowNode)]
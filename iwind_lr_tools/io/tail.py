@@ -0,0 +1,92 @@
+"""
+Follow whitespace-separated output tables (qbal.out, WQWCTS.OUT, cumu_struct_outflow.out) while the model is still writing them.
+"""
+
+import os
+from io import StringIO
+from typing import Callable, List
+import pandas as pd
+
+
+def _stat_key(stat: os.stat_result):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class TailReader:
+    """
+    `read()` parses the complete lines appended since the last call into a DataFrame chunk.
+
+    names: column names, `None` takes them from the first line (the header of WQWCTS.OUT).
+    skip_lines: leading lines to drop, ex: the irregular header of qbal.out.
+    select: applied to every chunk, ex: the column/cell projection of WQWCTS.OUT.
+
+    A file left by a previous run in the same directory is ignored until the model touches it,
+    and a file rewritten from the beginning discards the rows read so far.
+    """
+    def __init__(self, p, *, names: List[str]=None, skip_lines=0, select: Callable[[pd.DataFrame], pd.DataFrame]=None):
+        self.p = p
+        self.names_init = names
+        self.skip_lines_init = skip_lines
+        self.select = select
+
+        try:
+            self.stale_key = _stat_key(os.stat(p))
+        except FileNotFoundError:
+            self.stale_key = None
+
+        self.reset()
+
+    def reset(self):
+        self.offset = 0
+        self.names = self.names_init
+        self.skip_lines = self.skip_lines_init
+        self.chunk_list = []
+
+    def read(self):
+        """
+        Return a DataFrame of new rows, or `None` if there's no new complete line.
+        """
+        try:
+            stat = os.stat(self.p)
+        except FileNotFoundError:
+            return None
+        if self.stale_key is not None:
+            if _stat_key(stat) == self.stale_key:
+                return None
+            self.stale_key = None
+        if stat.st_size < self.offset:
+            self.reset() # truncated and rewritten
+        if stat.st_size == self.offset:
+            return None
+
+        with open(self.p, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(stat.st_size - self.offset)
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return None # a line is being written
+        self.offset += end
+
+        lines = data[:end].decode("utf8").splitlines()
+        while self.skip_lines > 0 and len(lines) > 0:
+            lines.pop(0)
+            self.skip_lines -= 1
+        if self.names is None and len(lines) > 0:
+            self.names = lines.pop(0).split()
+        lines = [line for line in lines if len(line.strip()) > 0]
+        if len(lines) == 0:
+            return None
+
+        df = pd.read_csv(StringIO("\n".join(lines)), header=None, names=self.names, delim_whitespace=True)
+        if self.select is not None:
+            df = self.select(df)
+        self.chunk_list.append(df)
+        return df
+
+    def get_df(self):
+        """
+        All rows read so far, `None` if no row is read.
+        """
+        if len(self.chunk_list) == 0:
+            return None
+        return pd.concat(self.chunk_list, ignore_index=True)
@@ -1,3 +1,5 @@
+import numpy as np
+
 
 def path_to_lines(func):
     def _func(p, **kwargs):
@@ -16,3 +18,32 @@ def path_to_text(func):
 def iter_strip(lines):
     for line in lines:
         yield line.strip()
+
+def _bisect_time(lines, value, right):
+    lo, hi = 0, len(lines)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        t = float(lines[mid].split(None, 1)[0])
+        if t < value or (right and t == value):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+def slice_lines_by_time(lines, time_begin=None, time_end=None):
+    """
+    Rows of a time-sorted table (time is the first field) inside [time_begin, time_end],
+    located by binary search so rows outside the window are never split.
+    """
+    lines = [line for line in lines if len(line.strip()) > 0] # blank lines are skipped by `pd.read_csv` as well
+    begin = 0 if time_begin is None else _bisect_time(lines, time_begin, right=False)
+    end = len(lines) if time_end is None else _bisect_time(lines, time_end, right=True)
+    return lines[begin: end]
+
+def slice_array_by_time(time, time_begin=None, time_end=None) -> slice:
+    begin = 0 if time_begin is None else np.searchsorted(time, time_begin, side="left")
+    end = len(time) if time_end is None else np.searchsorted(time, time_end, side="right")
+    return slice(begin, end)
+
+def is_windowed(time_begin, time_end):
+    return time_begin is not None or time_end is not None
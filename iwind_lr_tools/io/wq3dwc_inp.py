@@ -109,5 +109,5 @@ parse = generate_parse(card_info_dsl, forward_lookup_map, length_map_init)
 
 def parse_dep(data_map: List[Node]):
     node_list = data_map["efdc.inp"]
-    nqwr = DataFrameNode.get_df_map(node_list)["C07"]["NQWR"].iloc[0]
+    nqwr = DataFrameNode.get_df_node_map(node_list)["C07"].get_df()["NQWR"].iloc[0]
     return dict(extra_length_map=dict(C40=nqwr))
\ No newline at end of file
@@ -15,12 +15,16 @@ wqpsc_header_txt2 = "SU      SA    COD     DO    TAM    FCB   DSE   PSE"
 wqpsc_header_txt = wqpsc_header_txt1 + " " + wqpsc_header_txt2
 wqpsc_header = wqpsc_header_txt.split()
 
-def _build_node(lines):
-    return ConcentrationNode.from_str_list(lines, names=wqpsc_header)
+def _build_node(lines, time_begin=None, time_end=None):
+    return ConcentrationNode.from_str_list(lines, names=wqpsc_header, time_begin=time_begin, time_end=time_end)
 
 
 @path_to_lines
-def parse(lines: List[str]):
+def parse(lines: List[str], *, time_begin=None, time_end=None):
+    """
+    time_begin, time_end: build frames only for rows in [time_begin, time_end] (days).
+        The nodes still dump the full text while they're unmodified, a modified node refuses to be dumped.
+    """
     """
     assert len(lines) >= 1
     it_lines = iter_strip(lines)
@@ -55,7 +59,7 @@ def parse(lines: List[str]):
         ls = l.split("\t")
         nlines = int(ls[0])
         content_lines = lines[i: i + nlines + 1]
-        node = _build_node(content_lines)
+        node = _build_node(content_lines, time_begin, time_end)
         node_list.append(node)
 
         i = i + nlines + 1
@@ -262,6 +262,14 @@ class Pedant:
         return stats_load(df, self.df_limit, self.wq_key, self.flow_keys + self.flow_fixed_keys, 
             qctlo_key=self.qctlo_key, pump_key=self.pump_key)
 
+    def get_out_kwargs_map(self, cells=None):
+        """
+        Keyword arguments for `Runner(out_kwargs_map=...)` / `run_batch`, so only used water quality keys
+        (and cells) of WQWCTS.OUT are parsed.
+        """
+        wq_keys = self.wq_keys if self.wq_keys is not None else ["ROP"]
+        return {"WQWCTS.OUT": dict(columns=wq_keys, cells=cells)}
+
     def get_load_df_ready(self):
         return self.df_limit is not None and self.wq_key is not None and self.flow_keys is not None
 
@@ -0,0 +1,121 @@
+"""
+On-disk cache of parsed input files keyed by content hash, see `collector.get_all(root, cache_dir=...)`.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from threading import Lock
+import logging
+
+cache_version = 1 # bump it when parsed objects change their layout
+
+
+def hash_file(p, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_atomic(p: Path, data: bytes):
+    # Several worker processes may fill the same cache, rename makes every file complete or absent.
+    with NamedTemporaryFile(dir=p.parent, delete=False) as f:
+        f.write(data)
+    os.replace(f.name, p)
+
+
+class ParseCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / "index.json" # content hashes by (size, mtime), not to re-hash unchanged files
+        self.index = None
+        self.index_stamp = None # identity of index.json when `index` was read or written
+        self.index_lock = Lock()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, encoding="utf8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _get_index_stamp(self):
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _get_index(self):
+        # `index` is replaced rather than modified, so a returned index can be read without the lock
+        with self.index_lock:
+            stamp = self._get_index_stamp()
+            if self.index is None or stamp != self.index_stamp:
+                self.index = self._load_index()
+                self.index_stamp = stamp
+            return self.index
+
+    def get_content_hash_list(self, p_list):
+        """
+        Content hashes of many files (ex: every file of a root), the index is written once for all the misses.
+        """
+        index = self._get_index()
+        hash_list = []
+        miss_map = {}
+        for p in p_list:
+            p = os.path.realpath(p)
+            stat = os.stat(p)
+            entry = index.get(p)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                hash_list.append(entry["hash"])
+                continue
+            content_hash = hash_file(p)
+            miss_map[p] = dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, hash=content_hash)
+            hash_list.append(content_hash)
+
+        if len(miss_map) > 0:
+            with self.index_lock:
+                # merged into the latest index, which may hold entries of other processes
+                index = self._load_index()
+                index.update(miss_map)
+                _write_atomic(self.index_path, json.dumps(index, indent=0).encode("utf8"))
+                self.index = index
+                self.index_stamp = self._get_index_stamp()
+        return hash_list
+
+    def get_content_hash(self, p):
+        return self.get_content_hash_list([p])[0]
+
+    def get_key(self, p, kwargs: dict):
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((cache_version, Path(p).name, self.get_content_hash(p), sorted(kwargs.items()))).encode("utf8"))
+        return h.hexdigest()
+
+    def load(self, key):
+        p = self.cache_dir / f"{key}.pkl"
+        try:
+            with open(p, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Ignore broken cache {p}: {e}")
+            return None
+
+    def dump(self, key, obj):
+        _write_atomic(self.cache_dir / f"{key}.pkl", pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def parse(self, module, p, **kwargs):
+        key = self.get_key(p, kwargs)
+        obj = self.load(key)
+        if obj is None:
+            obj = module.parse(p, **kwargs)
+            self.dump(key, obj)
+            logging.debug(f"parse cache miss: {p}")
+        return obj
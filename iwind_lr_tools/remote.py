@@ -0,0 +1,406 @@
+"""
+Run simulations on other hosts: a worker daemon keeps a copy of the base root and runs the received data maps
+with the local `Runner`, `RemoteExecutor` schedules a batch over many daemons.
+
+On every host, with the same secret key (ex: from `python -c "import secrets; print(secrets.token_hex(32))"`):
+
+IWIND_AUTHKEY=<secret> python -m iwind_lr_tools.remote path/to/root --host 10.0.0.2 --port 6000 --slots 16
+
+On the scheduling host (with IWIND_AUTHKEY set as well, or `authkey=`):
+
+with RemoteExecutor([("10.0.0.2", 6000), ("10.0.0.3", 6000)]) as executor:
+    out_map_list = run_batch(root, actioner_list, executor=executor)
+
+Objects are exchanged by pickle over `multiprocessing.connection`, so whoever knows the authkey can run code
+on the daemons: there's no default key, keep it secret and bind daemons to trusted networks only.
+Entries of a data map left to `None` are read from the daemon's base root, so only the modified files are sent.
+"""
+
+import os
+import time
+import itertools
+import logging
+from multiprocessing.connection import Listener, Client
+from threading import Thread, Lock, Semaphore, Condition
+from queue import Queue
+from warnings import warn
+
+from .fault_tolerant_pool import YPoolFailed, TaskReport, get_backoff_delay
+from .runner import Runner, fork, data_map_fill
+
+
+def get_authkey(authkey=None) -> bytes:
+    # `authkey` or the environment variable IWIND_AUTHKEY, there's no default since the daemons unpickle what they receive
+    if authkey is None:
+        authkey = os.environ.get("IWIND_AUTHKEY")
+    if authkey is None or len(authkey) == 0:
+        raise ValueError("No authkey: pass `authkey` or set the environment variable IWIND_AUTHKEY")
+    return authkey.encode("utf8") if isinstance(authkey, str) else bytes(authkey)
+
+
+class RemoteError(Exception):
+    # an exception raised in the daemon which can't be pickled back
+    pass
+
+
+class WorkerDaemon:
+    """
+    Serve `Runner` jobs on `address`, at most `slots` models run at the same time.
+    Runners of `run(..., keep=True)` and `fork` are kept until `cleanup`, they're referred by an id.
+    """
+    def __init__(self, root, address=("localhost", 0), slots=1, authkey=None,
+                 out_kwargs_map=None, scratch_root=None, link_mode="symlink"):
+        # authkey: see `get_authkey`
+        self.root = root
+        self.slots = slots
+        self.out_kwargs_map = out_kwargs_map
+        self.scratch_root = scratch_root
+        self.link_mode = link_mode
+
+        self.listener = Listener(address, authkey=get_authkey(authkey))
+        self.address = self.listener.address
+        self.semaphore = Semaphore(slots)
+        self.lock = Lock()
+        self.runner_map = {}
+        self.runner_id_iter = itertools.count()
+        self.closed = False
+
+    def _keep(self, runner):
+        with self.lock:
+            runner_id = next(self.runner_id_iter)
+            self.runner_map[runner_id] = runner
+        return runner_id
+
+    def _get_runner(self, runner_id) -> Runner:
+        with self.lock:
+            return self.runner_map[runner_id]
+
+    def handle_run(self, data_map, out_kwargs_map=None, keep=False):
+        # the inputs come from the client, `Runner.write` can't keep links to `self.root` and writes them all
+        runner = Runner(self.root, out_kwargs_map=out_kwargs_map or self.out_kwargs_map,
+                        scratch_root=self.scratch_root, link_mode=self.link_mode)
+        try:
+            with self.semaphore:
+                out = runner.run(data_map)
+        except Exception:
+            runner.cleanup()
+            raise
+        if not keep:
+            runner.cleanup()
+            return out, None
+        return out, self._keep(runner)
+
+    def handle_restart(self, runner_id, data_map):
+        runner = self._get_runner(runner_id)
+        with self.semaphore:
+            return runner.run(data_map)
+
+    def handle_handoff(self, runner_id):
+        self._get_runner(runner_id).handoff()
+
+    def handle_fork(self, runner_id, size):
+        return [self._keep(runner) for runner in fork(self._get_runner(runner_id), size)]
+
+    def handle_cleanup(self, runner_id):
+        with self.lock:
+            runner = self.runner_map.pop(runner_id)
+        runner.cleanup()
+
+    def handle_info(self):
+        return {"slots": self.slots, "root": str(self.root)}
+
+    def serve_connection(self, conn):
+        with conn:
+            while True:
+                try:
+                    command, args = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if command == "close":
+                    return
+                try:
+                    res = getattr(self, f"handle_{command}")(*args)
+                    reply = ("ok", res)
+                except Exception as e:
+                    logging.warning(f"daemon {self.address}: {command} failed due to: {e!r}")
+                    reply = ("error", e)
+                try:
+                    conn.send(reply)
+                except (EOFError, OSError):
+                    return
+                except Exception: # the exception can't be pickled
+                    conn.send(("error", RemoteError(repr(reply[1]))))
+
+    def serve_forever(self):
+        logging.info(f"daemon serving {self.root} on {self.address} with {self.slots} slots")
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self.closed:
+                    return
+                raise
+            except Exception as e: # failed authentication, etc.
+                warn(f"daemon {self.address}: rejected a connection due to: {e!r}")
+                continue
+            Thread(target=self.serve_connection, args=(conn,), daemon=True).start()
+
+    def start(self):
+        # serve in a background thread, used to run daemons on localhost
+        thread = Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def close(self):
+        self.closed = True
+        self.listener.close()
+        with self.lock:
+            runner_list = list(self.runner_map.values())
+            self.runner_map.clear()
+        for runner in runner_list:
+            runner.cleanup()
+
+
+class RemoteRunner:
+    """
+    Handle of a runner kept by a daemon, accepted by `fork`, `restart_batch` and the restart iterators like a `Runner`.
+    """
+    is_remote = True
+
+    def __init__(self, executor: "RemoteExecutor", address, runner_id):
+        self.executor = executor
+        self.address = address
+        self.runner_id = runner_id
+
+    def run_strict(self, data_map: dict):
+        # a restart step, on a connection of its own so steps of many runners run at the same time
+        return self.executor.request_parallel(self.address, "restart", self.runner_id, data_map_fill(data_map))
+
+    def handoff(self):
+        self.executor.request(self.address, "handoff", self.runner_id)
+
+    def cleanup(self):
+        self.executor.request(self.address, "cleanup", self.runner_id)
+
+    def __repr__(self):
+        return f"RemoteRunner(address={self.address}, runner_id={self.runner_id})"
+
+
+class _Task:
+    def __init__(self, idx, command, args, address=None):
+        self.idx = idx
+        self.command = command
+        self.args = args
+        self.address = address # affinity, a restart has to run where its runner lives
+        self.error_list = []
+
+
+class RemoteExecutor:
+    """
+    Open `slots` connections to every daemon, each of them pulls the next task when it's free,
+    so faster or larger hosts take more tasks. A failed task is retried `quota` times, possibly on another host.
+    Batches are dispatched one at a time, don't share an executor between threads.
+    """
+    def __init__(self, address_list, authkey=None, quota=3, backoff=0.0):
+        # authkey: see `get_authkey`
+        self.authkey = authkey = get_authkey(authkey)
+        self.quota = quota
+        self.backoff = backoff
+        self.slots_map = {}
+        self.conn_map = {} # address -> [connection], one for every slot
+        self.request_lock_map = {}
+        for address in address_list:
+            address = tuple(address)
+            conn = Client(address, authkey=authkey)
+            conn.send(("info", ()))
+            status, info = conn.recv()
+            assert status == "ok", info
+            self.slots_map[address] = info["slots"]
+            self.conn_map[address] = [conn] + [Client(address, authkey=authkey) for _ in range(info["slots"] - 1)]
+            self.request_lock_map[address] = Lock()
+        self.report_list = []
+
+    @staticmethod
+    def _call(conn, command, *args):
+        conn.send((command, args))
+        status, res = conn.recv()
+        if status == "error":
+            raise res
+        return res
+
+    def request(self, address, command, *args):
+        # out of the scheduler (cleanup, fork), the first connection of the host is shared
+        with self.request_lock_map[address]:
+            return self._call(self.conn_map[address][0], command, *args)
+
+    def request_parallel(self, address, command, *args):
+        # out of the scheduler on a new connection, so calls from many threads don't wait for each other
+        with Client(address, authkey=self.authkey) as conn:
+            res = self._call(conn, command, *args)
+            conn.send(("close", ()))
+        return res
+
+    def _dispatch(self, task_list):
+        """
+        Yield `(idx, result)` as soon as a task finishes.
+        """
+        pending = list(task_list)
+        cond = Condition()
+        done_queue = Queue()
+        stopped = [False]
+        alive = {address: len(conn_list) for address, conn_list in self.conn_map.items()}
+        report_list = [None for _ in task_list]
+        self.report_list = report_list
+
+        def pick(address):
+            for i, task in enumerate(pending):
+                if task.address is None or task.address == address:
+                    return pending.pop(i)
+            return None
+
+        def slot_worker(address, conn, request_lock):
+            while True:
+                with cond:
+                    while True:
+                        if stopped[0]:
+                            return
+                        task = pick(address)
+                        if task is not None:
+                            break
+                        cond.wait()
+                used_quota = len(task.error_list)
+                time.sleep(get_backoff_delay(self.backoff, used_quota))
+                try:
+                    with request_lock:
+                        res = self._call(conn, task.command, *task.args)
+                except (EOFError, OSError) as e:
+                    # the host is gone, hand the task over to the others and stop this slot
+                    warn(f"daemon {address} is unreachable: {e!r}")
+                    task.error_list.append(e)
+                    with cond:
+                        alive[address] -= 1
+                    done_queue.put((task, None, True))
+                    return
+                except Exception as e:
+                    warn(f"task: {task.idx} on {address} (quota:{self.quota-used_quota-1}/{self.quota}) fail due to: {e!r}")
+                    task.error_list.append(e)
+                    done_queue.put((task, None, True))
+                    continue
+                done_queue.put((task, (address, res), False))
+
+        thread_list = []
+        for address, conn_list in self.conn_map.items():
+            # the first connection is also used by `request`
+            for i, conn in enumerate(conn_list):
+                request_lock = self.request_lock_map[address] if i == 0 else Lock()
+                thread = Thread(target=slot_worker, args=(address, conn, request_lock), daemon=True)
+                thread.start()
+                thread_list.append(thread)
+
+        try:
+            remaining = len(task_list)
+            while remaining > 0:
+                task, res, failed = done_queue.get()
+                if failed:
+                    if len(task.error_list) >= self.quota:
+                        report_list[task.idx] = TaskReport(task.idx, len(task.error_list), task.error_list)
+                        raise YPoolFailed(f"Remote task {task.idx} failed after {len(task.error_list)} attempts: {task.error_list}")
+                    with cond:
+                        if task.address is not None and alive[task.address] == 0:
+                            raise YPoolFailed(f"Remote task {task.idx} requires unreachable daemon {task.address}")
+                        if sum(alive.values()) == 0:
+                            raise YPoolFailed("All daemons are unreachable")
+                        pending.append(task)
+                        cond.notify_all()
+                    continue
+                report_list[task.idx] = TaskReport(task.idx, len(task.error_list) + 1, task.error_list)
+                remaining -= 1
+                yield task.idx, res
+        finally:
+            with cond:
+                stopped[0] = True
+                pending.clear()
+                cond.notify_all()
+            for thread in thread_list:
+                thread.join() # running requests finish, so connections are left in a clean state
+
+    def imap_unordered(self, data_map_list, out_kwargs_map=None, keep=False):
+        """
+        Yield `(idx, out_map)` (`(idx, (out_map, RemoteRunner))` if `keep`) in completion order.
+        """
+        data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
+        task_list = [_Task(idx, "run", (data_map_fill(data_map), out_kwargs_map, keep))
+                     for idx, data_map in enumerate(data_map_list)]
+        for idx, (address, (out, runner_id)) in self._dispatch(task_list):
+            if keep:
+                yield idx, (out, RemoteRunner(self, address, runner_id))
+            else:
+                yield idx, out
+
+    def run_batch(self, data_map_list, out_kwargs_map=None, debug_list=None):
+        # debug_list: filled with `RemoteRunner`, which are kept by the daemons until `cleanup`.
+        keep = debug_list is not None
+        out_list = [None for _ in data_map_list]
+        if keep:
+            assert len(debug_list) == 0, "debug_list is not None or empty list, maybe mistakenly use a previous list?"
+            debug_list.extend([None for _ in data_map_list])
+        for idx, res in self.imap_unordered(data_map_list, out_kwargs_map=out_kwargs_map, keep=keep):
+            if keep:
+                out_list[idx], debug_list[idx] = res
+            else:
+                out_list[idx] = res
+        return out_list
+
+    def restart_batch(self, runner_list, data_map_list):
+        data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
+        task_list = [_Task(idx, "restart", (runner.runner_id, data_map_fill(data_map)), address=runner.address)
+                     for idx, (runner, data_map) in enumerate(zip(runner_list, data_map_list))]
+        out_list = [None for _ in task_list]
+        for idx, (_, out) in self._dispatch(task_list):
+            out_list[idx] = out
+        return out_list
+
+    def fork(self, runner: RemoteRunner, size):
+        # forked runners live on the host of `runner`
+        return [RemoteRunner(self, runner.address, runner_id) for runner_id in self.request(runner.address, "fork", runner.runner_id, size)]
+
+    def close(self):
+        for conn_list in self.conn_map.values():
+            for conn in conn_list:
+                try:
+                    conn.send(("close", ()))
+                except OSError:
+                    pass
+                conn.close()
+        self.conn_map = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def start_local_daemons(root, num=2, slots=1, **kwargs):
+    """
+    Start `num` daemons on localhost (in this process), returns them and their addresses.
+    kwargs: see `WorkerDaemon`, ex: `authkey`.
+    """
+    daemon_list = [WorkerDaemon(root, ("localhost", 0), slots=slots, **kwargs).start() for _ in range(num)]
+    return daemon_list, [daemon.address for daemon in daemon_list]
+
+
+def serve(root: str, *, host: str="localhost", port: int=6000, slots: int=1, scratch_root: str=None, link_mode: str="symlink"):
+    """
+    Run a worker daemon. The authkey is taken from the environment variable IWIND_AUTHKEY, which is required.
+    """
+    daemon = WorkerDaemon(root, (host, port), slots=slots, scratch_root=scratch_root, link_mode=link_mode)
+    try:
+        daemon.serve_forever()
+    finally:
+        daemon.close()
+
+
+if __name__ == "__main__":
+    import clize
+    clize.run(serve)
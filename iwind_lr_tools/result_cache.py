@@ -0,0 +1,136 @@
+"""
+On-disk cache of simulation results, see `run_batch(..., result_cache=ResultCache(cache_dir))`.
+
+A result is keyed by what the model would read: the dumped text of the proposed input files,
+the content of the other input files of the base root and the exe, and the output parser arguments.
+The pickled out maps are evicted in least recently used order once the cache exceeds its bounds.
+Use a directory different from the one of `ParseCache`.
+"""
+
+import hashlib
+import importlib
+import os
+from pathlib import Path
+from typing import List
+import logging
+
+from .parse_cache import ParseCache, cache_version
+from .io.common import Node, dump
+from .collector import dumpable_list
+from .utils import get_exe_p
+
+# restart files are copied into a simulation directory by `fork`, rather than linked from the base root
+restart_inp_list = ["RESTART.INP", "TEMPB.RST"]
+
+
+class _HashWriter:
+    # file-like sink for `dump`, so dumped files are hashed without building the whole text
+    def __init__(self, h):
+        self.h = h
+
+    def write(self, s: str):
+        self.h.update(s.encode("utf8"))
+
+
+def hash_node_list(h, node_list: List[Node]):
+    dump(node_list, _HashWriter(h))
+
+
+def get_root_hash(cache: ParseCache, root, exclude=()):
+    # content hashes of the base files are indexed by (size, mtime), so it's cheap after the first call
+    root = Path(root)
+    name_list = [name for name in get_input_name_list(root) if name not in exclude]
+    h = hashlib.blake2b(digest_size=16)
+    for name, content_hash in zip(name_list, cache.get_content_hash_list([root / name for name in name_list])):
+        h.update(repr((name, content_hash)).encode("utf8"))
+    return h.hexdigest()
+
+
+def get_input_name_list(root):
+    root = Path(root)
+    # `create_simulation` is shadowed by the function in the package namespace
+    selected_name_list = importlib.import_module(".create_simulation", __package__).selected_name_list_default
+    name_list = [get_exe_p(root).name] + list(selected_name_list)
+    name_list += [name for name in restart_inp_list if name not in name_list and (root / name).exists()]
+    return name_list
+
+
+class ResultCache(ParseCache):
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None):
+        """
+        max_bytes, max_entries: bounds of the stored results, `None` means unbounded.
+        """
+        super().__init__(cache_dir)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def get_root_hash(self, root, exclude=()):
+        return get_root_hash(self, root, exclude=exclude)
+
+    def get_key(self, data_map: dict, root, out_kwargs_map=None):
+        """
+        root: the base root (or simulation directory) supplying the files `data_map` leaves to `None`.
+        """
+        proposed_list = [fname for fname in dumpable_list if data_map.get(fname) is not None]
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((cache_version, "result", self.get_root_hash(root, exclude=proposed_list))).encode("utf8"))
+        for fname in proposed_list:
+            h.update(repr(fname).encode("utf8"))
+            hash_node_list(h, data_map[fname])
+        out_kwargs_map = out_kwargs_map or {}
+        h.update(repr(sorted((k, sorted(v.items())) for k, v in out_kwargs_map.items())).encode("utf8"))
+        return h.hexdigest()
+
+    def load(self, key):
+        obj = super().load(key)
+        if obj is not None:
+            try:
+                os.utime(self.cache_dir / f"{key}.pkl") # mtime is the clock of LRU eviction
+            except FileNotFoundError:
+                pass # evicted by another process in the meantime
+            logging.debug(f"result cache hit: {key}")
+        return obj
+
+    def dump(self, key, obj):
+        super().dump(key, obj)
+        self.evict()
+
+    def evict(self):
+        if self.max_bytes is None and self.max_entries is None:
+            return
+
+        entry_list = []
+        for p in self.cache_dir.glob("*.pkl"):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entry_list.append((stat.st_mtime_ns, stat.st_size, p))
+        entry_list.sort()
+
+        total_bytes = sum(size for _, size, _ in entry_list)
+        num_entries = len(entry_list)
+        for _, size, p in entry_list:
+            if (self.max_bytes is None or total_bytes <= self.max_bytes) and \
+                (self.max_entries is None or num_entries <= self.max_entries):
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            num_entries -= 1
+            logging.debug(f"result cache evict: {p}")
+
+    def run_strict(self, runner, data_map: dict):
+        """
+        Memoized `runner.run_strict(data_map)`.
+        On a hit the model is not run, so the directory of `runner` doesn't hold the outputs (ex: to be forked).
+        """
+        key = self.get_key(data_map, runner.dst_root, runner.out_kwargs_map)
+        out = self.load(key)
+        if out is None:
+            out = runner.run_strict(data_map)
+            self.dump(key, out)
+        return out
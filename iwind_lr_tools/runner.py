@@ -13,18 +13,155 @@ from contextlib import contextmanager
 from warnings import warn
 import logging
 import numpy as np
-
-from .fault_tolerant_pool import YPool as Pool
-from .io.common import Node, dumps
-from .utils import copy_locked, open_safe, run_simulation, mkdtemp_locked
-from .create_simulation import create_simulation
-from .collector import parse_out, dumpable_list
+import subprocess
+import time
+import asyncio
+from tempfile import TemporaryFile
+from threading import Lock, Event
+from queue import Queue
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+
+from .fault_tolerant_pool import YPool as Pool, YPoolFailed, FAIL, get_backoff_delay, BatchExecutor, TaskReport
+from .io.common import Node, DataFrameNode, dump, is_clean_link
+from .utils import open_safe, run_simulation, run_simulation_async, link_file, handoff_file
+from .create_simulation import create_simulation, create_simulation_atomic
+from .collector import parse_out, tail_out, out_map, dumpable_list
+from .io import efdc_inp
 from .actioner import Actioner
 from .load_stats import Pedant
+from .result_cache import ResultCache
+from .checkpoint_store import CheckpointStore, restart_out_to_inp
 
 
 def get_default_pool_size():
-    return cpu_count() // 2 # assumes x2 hyper-threads
+    return max(cpu_count() // 2, 1) # assumes x2 hyper-threads, a single core machine still gets a worker
+
+def get_simulation_days(data_map: dict, dst_root):
+    # C03.NTC of the efdc.inp to run, `data_map["efdc.inp"]` is None if the one in `dst_root` is kept.
+    node_list = data_map.get("efdc.inp")
+    if node_list is None:
+        node_list = efdc_inp.parse(Path(dst_root) / "efdc.inp")
+    C03 = DataFrameNode.get_df_node_map(node_list)["C03"].get_df()
+    return float(C03["NTC"].iloc[0])
+
+class TimeoutPolicy:
+    """
+    Wall-clock timeout of a simulation: `overhead + factor * seconds_per_day * days`, days is C03.NTC.
+    Without a given `seconds_per_day`, no timeout is applied until a run finishes.
+    Every finished run updates the rate from the run time of the model process, the slowest rate of the
+    last `window` runs is kept to tolerate busy machines.
+    """
+    def __init__(self, seconds_per_day=None, factor=3.0, overhead=30.0, window=10):
+        self.seconds_per_day = seconds_per_day
+        self.factor = factor
+        self.overhead = overhead
+        self.window = window
+        self.rate_list = [] if seconds_per_day is None else [seconds_per_day]
+        self.lock = Lock()
+
+    def get_timeout(self, days):
+        if self.seconds_per_day is None:
+            return None
+        return self.overhead + self.factor * self.seconds_per_day * days
+
+    def update(self, days, seconds):
+        if days <= 0:
+            return
+        with self.lock:
+            self.rate_list = self.rate_list[-self.window + 1:] + [seconds / days]
+            self.seconds_per_day = max(self.rate_list)
+
+class StepPolicy:
+    """
+    Restart step length (days) fitted from the cost of the previous steps, pass it as `step` of `restart_list_iterator`.
+    target_latency: seconds per yield, else the shortest step with at most `max_overhead_fraction` overhead is chosen.
+    boundary_list: days steps don't cross (ex: where the caller takes new decisions).
+    timing_key: entry of the model timing, `None` takes the one named like "total" or the largest one.
+    """
+    def __init__(self, target_latency=None, max_overhead_fraction=0.1, initial_step=7, min_step=1, max_step=28,
+                 boundary_list=(), smoothing=0.3, timing_key=None):
+        self.target_latency = target_latency
+        self.max_overhead_fraction = max_overhead_fraction
+        self.initial_step = initial_step
+        self.min_step = min_step
+        self.max_step = max_step
+        self.boundary_list = sorted(boundary_list)
+        self.smoothing = smoothing
+        self.timing_key = timing_key
+
+        self.seconds_per_day = None
+        self.overhead = None
+        self.sample_list = [] # (days, seconds) for the fit without the model timing
+        self.probe_from = None # the only step length sampled so far
+        self.lock = Lock()
+
+    def _ema(self, old, new):
+        return new if old is None else (1 - self.smoothing) * old + self.smoothing * new
+
+    def update(self, days, seconds, model_seconds=None):
+        # step wall time = overhead + seconds_per_day * days, `model_seconds` (model timing) separates the two
+        if days <= 0:
+            return
+        with self.lock:
+            if model_seconds is not None:
+                self.seconds_per_day = self._ema(self.seconds_per_day, model_seconds / days)
+                self.overhead = self._ema(self.overhead, max(seconds - model_seconds, 0.0))
+                return
+            self.sample_list = self.sample_list[-19:] + [(days, seconds)]
+            days_arr, seconds_arr = np.array(self.sample_list).T
+            if len(np.unique(days_arr)) >= 2:
+                seconds_per_day, overhead = np.polyfit(days_arr, seconds_arr, 1)
+                self.seconds_per_day = max(seconds_per_day, 1e-9)
+                self.overhead = max(overhead, 0.0)
+            else:
+                # a single step length doesn't separate the overhead yet, the next step probes another one
+                self.probe_from = int(days_arr[0])
+
+    def _get_probe_step(self, days):
+        return days * 2 if days * 2 <= self.max_step else max(days // 2, self.min_step)
+
+    def get_step(self, day, end_day):
+        with self.lock:
+            seconds_per_day, overhead, probe_from = self.seconds_per_day, self.overhead, self.probe_from
+        if seconds_per_day is None:
+            length = self.initial_step if probe_from is None else self._get_probe_step(probe_from)
+        elif self.target_latency is not None:
+            length = np.floor((self.target_latency - overhead) / seconds_per_day + 1e-6)
+        else:
+            fraction = self.max_overhead_fraction
+            length = np.ceil(overhead * (1 - fraction) / (fraction * seconds_per_day) - 1e-6)
+        length = int(min(max(length, self.min_step), self.max_step)) # the model runs whole days
+
+        for boundary in self.boundary_list:
+            if day < boundary < day + length:
+                length = boundary - day
+                break
+        return min(length, end_day - day)
+
+    def get_timing(self, parsed: dict):
+        # model seconds from a `parse_shell_output` result, `None` if it's not there
+        if self.timing_key is not None:
+            return parsed.get(self.timing_key)
+        if len(parsed) == 0:
+            return None
+        total_list = [key for key in parsed if "total" in key.lower()]
+        if len(total_list) > 0:
+            return parsed[total_list[0]]
+        return max(parsed.values())
+
+    def get_model_seconds(self, runner_list: List["Runner"], n_parsed_list: List[int]):
+        # timing of the slowest runner which ran since `n_parsed_list` were taken, `None` if none reports it
+        seconds_list = []
+        for runner, n_parsed in zip(runner_list, n_parsed_list):
+            parsed_list = getattr(runner, "shell_output_parsed_list", [])
+            if len(parsed_list) > n_parsed:
+                seconds = self.get_timing(parsed_list[-1])
+                if seconds is not None:
+                    seconds_list.append(seconds)
+        return max(seconds_list) if len(seconds_list) > 0 else None
+
+    def __repr__(self):
+        return f"StepPolicy(seconds_per_day={self.seconds_per_day}, overhead={self.overhead}, target_latency={self.target_latency})"
 
 shell_end_anchor = "TIMING INFORMATION IN SECONDS"
 shell_end_anchor_offset = len(shell_end_anchor)
@@ -49,10 +186,30 @@ class Runner:
     """
     Create a new environment, replace some *inp with the one proposed by optimizer and fetch result.
     """
-
-    def __init__(self, src_root, dst_root=None, without_create_simulation=False):
+    sandbox_pool = None # set when the runner is leased from a `SandboxPool`
+    timeout_policy: "TimeoutPolicy" = None
+    scratch_root = None
+    link_mode = "symlink"
+    handoff_mode = "copy"
+    checkpoint_key = None # key of the state held by the restart outputs, see `CheckpointStore`
+
+    def __init__(self, src_root, dst_root=None, without_create_simulation=False, out_kwargs_map=None,
+                 scratch_root=None, link_mode="symlink", handoff_mode="copy"):
+        """
+        out_kwargs_map: keyword arguments for output parsers, ex: `{"WQWCTS.OUT": dict(columns=["ROP"])}`
+            to read only the interested part of a large WQWCTS.OUT.
+        scratch_root: where the simulation directory is created if `dst_root` is not given, ex: a tmpfs mount
+            like "/dev/shm" since the model writes its large outputs by many small writes.
+        link_mode: how the base files are put into the simulation directory, see `create_simulation`.
+        handoff_mode: how the restart outputs become restart inputs, see `copy_restart_files`.
+            Runners forked from this one inherit it.
+        """
         self.shell_output_list = []
         self.shell_output_parsed_list = []
+        self.out_kwargs_map = out_kwargs_map
+        self.scratch_root = scratch_root
+        self.link_mode = link_mode
+        self.handoff_mode = handoff_mode
 
         if without_create_simulation:
             self.src_root = None
@@ -61,39 +218,160 @@ class Runner:
             self.src_root = Path(src_root)
 
             if dst_root is None:
-                dst_root = mkdtemp_locked() # create_simulation will "replace" it instantly, but is it thread-safe?
-
-            self.dst_root = Path(dst_root)
-            create_simulation(src_root, dst_root)
+                self.dst_root = create_simulation_atomic(src_root, scratch_root, link_mode=link_mode)
+            else:
+                self.dst_root = Path(dst_root)
+                create_simulation(src_root, dst_root, link_mode=link_mode)
 
     def write(self, data_map:dict):
         # {"efdc.inp": efdc_node_list: List[Node], ....}
+        # the restart outputs will no longer match the key, `_restart_batch_checkpointed` sets it after the step
+        self.checkpoint_key = None
+        if self.handoff_mode == "hardlink":
+            # restart outputs may be hardlinked into forks, let the model create new files rather than truncating them
+            for out_s in restart_out_to_inp:
+                if os.path.lexists(self.dst_root / out_s):
+                    os.unlink(self.dst_root / out_s)
         for fname in dumpable_list:
             node_list = data_map[fname]
             if node_list is not None:
+                # node sources are file identities of this host, so the inputs sent to a `remote.WorkerDaemon`
+                # never match its own copy of the root and are always fully written there
+                if is_clean_link(node_list, self.dst_root / fname):
+                    # keep the symbolic link created by `create_simulation`
+                    logging.debug(f"skip writing clean {self.dst_root / fname}")
+                    continue
                 with open_safe(self.dst_root / fname, "w", encoding="utf8") as f:
-                    f.write(dumps(node_list))
+                    dump(node_list, f)
     
-    def run_simulation(self):
-        return run_simulation(self.dst_root, popen=False)
+    def run_simulation(self, timeout=None):
+        return run_simulation(self.dst_root, popen=False, timeout=timeout)
 
     def parse_out(self):
-        return parse_out(self.dst_root)
+        return parse_out(self.dst_root, kwargs_map=self.out_kwargs_map)
 
     def run_strict(self, data_map:dict):
         # If efdc_node_list or qser_node_list takes None, the value will not be changed.
+        self.simulate_strict(data_map)
+        return self.parse_out()
+
+    async def run_strict_async(self, data_map:dict, parse_pool: Executor=None, post_func=None):
+        """
+        `run_strict` as a coroutine, writing and parsing run in `parse_pool` (default executor if `None`)
+        so they don't block the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.write, data_map)
+        days, timeout = self._get_days_timeout(data_map)
+        begin = time.time()
+        shell_output = (await run_simulation_async(self.dst_root, timeout=timeout)).decode()
+        self._update_timeout_policy(days, time.time() - begin)
+        self.shell_output_list.append(shell_output)
+        self.check_shell_output(shell_output)
+        return await loop.run_in_executor(parse_pool, parse_out_task, self.dst_root, self.out_kwargs_map, post_func)
+
+    def simulate_strict(self, data_map:dict):
+        # `run_strict` without parsing the outputs
         self.write(data_map)
-        shell_output = self.run_simulation().decode()
+        days, timeout = self._get_days_timeout(data_map)
+        begin = time.time()
+        shell_output = self.run_simulation(timeout=timeout).decode()
+        self._update_timeout_policy(days, time.time() - begin)
         self.shell_output_list.append(shell_output)
         self.check_shell_output(shell_output)
-        return self.parse_out()
     
     def run(self, data_map:dict):
         data_map_filled = data_map_fill(data_map)
         return self.run_strict(data_map_filled)
 
+    def _get_days_timeout(self, data_map:dict):
+        if self.timeout_policy is None:
+            return None, None
+        days = get_simulation_days(data_map, self.dst_root)
+        return days, self.timeout_policy.get_timeout(days)
+
+    def _update_timeout_policy(self, days, seconds):
+        if self.timeout_policy is not None:
+            self.timeout_policy.update(days, seconds)
+
+    def follow_strict(self, data_map:dict, poll_interval=1.0):
+        """
+        Generator version of `run_strict`, output files are parsed while the model is running.
+        Yield `{"qbal.out": new_rows_df, ...}` (only files having new rows) every `poll_interval` seconds
+        and return the out map when the model exits, use `out_map = yield from runner.follow_strict(...)`
+        or `run_follow`. Closing the generator early kills the model process.
+        """
+        self.write(data_map)
+        reader_map = tail_out(self.dst_root, kwargs_map=self.out_kwargs_map)
+
+        with TemporaryFile() as stdout_f:
+            proc = self.run_simulation_popen(stdout=stdout_f)
+            try:
+                while True:
+                    running = proc.poll() is None
+                    chunk_map = {}
+                    for fname, reader in reader_map.items():
+                        df = reader.read()
+                        if df is not None:
+                            chunk_map[fname] = df
+                    if len(chunk_map) > 0:
+                        yield chunk_map
+                    if not running:
+                        break
+                    time.sleep(poll_interval)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+                    logging.debug(f"killed unfinished model in {self.dst_root}")
+
+            if proc.returncode != 0:
+                raise subprocess.CalledProcessError(proc.returncode, proc.args)
+            stdout_f.seek(0)
+            shell_output = stdout_f.read().decode()
+
+        self.shell_output_list.append(shell_output)
+        self.check_shell_output(shell_output)
+
+        out = {}
+        for fname, reader in reader_map.items():
+            df = reader.get_df()
+            if df is None: # no row, let the parser deal with it
+                df = out_map[fname].parse(self.dst_root / fname, **(self.out_kwargs_map or {}).get(fname, {}))
+            out[fname] = df
+        return out
+
+    def follow(self, data_map:dict, poll_interval=1.0):
+        data_map_filled = data_map_fill(data_map)
+        return self.follow_strict(data_map_filled, poll_interval=poll_interval)
+
+    def run_follow(self, data_map:dict, callback, poll_interval=1.0):
+        """
+        `run` calling `callback(chunk_map)` on new output rows (see `follow_strict`).
+        If `callback` returns True, the model is killed and `None` is returned (early abort).
+        """
+        gen = self.follow(data_map, poll_interval=poll_interval)
+        while True:
+            try:
+                chunk_map = next(gen)
+            except StopIteration as e:
+                return e.value
+            if callback(chunk_map):
+                gen.close()
+                return None
+
+    def run_simulation_popen(self, **popen_kwargs):
+        return run_simulation(self.dst_root, popen=True, **popen_kwargs)
+
+    def handoff(self):
+        # the restart outputs become the restart inputs of the next step
+        copy_restart_files(self.dst_root, handoff_mode=self.handoff_mode)
+
     def cleanup(self):
         # user may want to keep those files
+        if self.sandbox_pool is not None:
+            self.sandbox_pool.release(self)
+            return
         rmtree(self.dst_root)
         logging.debug(f"cleanup {self.dst_root}")
 
@@ -121,36 +399,271 @@ class RunnerInplace(Runner):
     def __init__(self, src_root):
         self.src_root = Path(src_root)
         self.dst_root = self.src_root
+        self.out_kwargs_map = None
         # create_simulation(src_root, dst_root)
 
+class SandboxPool:
+    """
+    Simulation directories reused across batches, `release` (or `Runner.cleanup`) resets a leased one:
+
+    with SandboxPool(root, pool_size) as sandbox_pool:
+        for data_map_list in ...:
+            out_map_list = run_batch(root, data_map_list, sandbox_pool=sandbox_pool)
+    """
+    def __init__(self, root, size=0, out_kwargs_map=None, scratch_root=None, link_mode="symlink", handoff_mode="copy"):
+        # scratch_root, link_mode, handoff_mode: see `Runner`
+        self.root = Path(root)
+        self.out_kwargs_map = out_kwargs_map
+        self.scratch_root = scratch_root
+        self.link_mode = link_mode
+        self.handoff_mode = handoff_mode
+        self.lock = Lock()
+        self.runner_list = []
+        self.free_list = []
+        for _ in range(size):
+            self.free_list.append(self._create())
+
+    def _create(self):
+        runner = Runner(self.root, out_kwargs_map=self.out_kwargs_map, scratch_root=self.scratch_root, link_mode=self.link_mode,
+                        handoff_mode=self.handoff_mode)
+        # name -> (base file, inode of the created link), a replaced file gets another inode
+        runner.sandbox_link_map = {}
+        with os.scandir(runner.dst_root) as it:
+            for entry in it:
+                runner.sandbox_link_map[entry.name] = (self.root / entry.name, entry.inode())
+        with self.lock:
+            self.runner_list.append(runner)
+        logging.debug(f"sandbox created: {runner.dst_root}")
+        return runner
+
+    def acquire(self) -> Runner:
+        # the pool grows when every directory is leased
+        with self.lock:
+            runner = self.free_list.pop() if len(self.free_list) > 0 else None
+        if runner is None:
+            runner = self._create()
+        runner.sandbox_pool = self
+        return runner
+
+    def release(self, runner: Runner):
+        assert runner.sandbox_pool is self, "runner is not leased from this pool"
+        self.reset(runner)
+        runner.sandbox_pool = None
+        with self.lock:
+            self.free_list.append(runner)
+
+    def reset(self, runner: Runner):
+        # remove what the previous job wrote or produced and restore the original links
+        link_map = runner.sandbox_link_map
+        with os.scandir(runner.dst_root) as it:
+            for entry in it:
+                link = link_map.get(entry.name)
+                if link is not None and entry.inode() == link[1]:
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+        for name, (base_p, _) in link_map.items():
+            p = runner.dst_root / name
+            if not os.path.lexists(p):
+                link_file(p, base_p, runner.link_mode)
+                link_map[name] = (base_p, os.lstat(p).st_ino)
+        runner.shell_output_list = []
+        runner.shell_output_parsed_list = []
+        runner.checkpoint_key = None
+        runner.timeout_policy = None
+        runner.handoff_mode = self.handoff_mode
+        logging.debug(f"sandbox reset: {runner.dst_root}")
+
+    def close(self):
+        with self.lock:
+            runner_list = self.runner_list
+            self.runner_list = []
+            self.free_list = []
+        for runner in runner_list:
+            runner.sandbox_pool = None
+            runner.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.runner_list)
+
+
+def parse_out_task(dst_root, out_kwargs_map=None, post_func=None):
+    # Runs in `parse_pool`, so arguments and the result are pickled.
+    out = parse_out(dst_root, kwargs_map=out_kwargs_map)
+    if post_func is not None:
+        out = post_func(out)
+    return out
+
+def _run_or_submit(runner: Runner, data_map: dict, parse_pool: Executor=None, post_func=None):
+    """
+    Without `parse_pool` return the out map (processed by `post_func`),
+    else return a future of it after the model exits, the caller thread is free to launch the next simulation.
+    """
+    if parse_pool is None:
+        out = runner.run_strict(data_map)
+        return out if post_func is None else post_func(out)
+    runner.simulate_strict(data_map)
+    return parse_pool.submit(parse_out_task, runner.dst_root, runner.out_kwargs_map, post_func)
+
 def work(process_args: dict):
     root:str = process_args["root"]
     data_map:dict = process_args["data_map"]
     dst_root = process_args["dst_root"]
     debug_list = process_args["debug_list"]
     idx:int = process_args["idx"]
-
-    runner = Runner(root, dst_root)
+    out_kwargs_map = process_args.get("out_kwargs_map")
+    sandbox_pool: SandboxPool = process_args.get("sandbox_pool")
+    parse_pool: Executor = process_args.get("parse_pool")
+    post_func = process_args.get("post_func")
+    timeout_policy: TimeoutPolicy = process_args.get("timeout_policy")
+
+    if sandbox_pool is not None:
+        runner = sandbox_pool.acquire()
+        runner.out_kwargs_map = out_kwargs_map
+    else:
+        runner = Runner(root, dst_root, out_kwargs_map=out_kwargs_map,
+                        scratch_root=process_args.get("scratch_root"), link_mode=process_args.get("link_mode", "symlink"),
+                        handoff_mode=process_args.get("handoff_mode", "copy"))
+    runner.timeout_policy = timeout_policy
     if debug_list is not None:
         debug_list[idx] = runner
-    out = runner.run_strict(data_map)
+    try:
+        out = _run_or_submit(runner, data_map, parse_pool, post_func)
+    except Exception:
+        if debug_list is None:
+            runner.cleanup() # a failed (ex: timed out) attempt is retried by `YPool` in another directory
+        raise
+
+    if parse_pool is not None:
+        # the directory is still being parsed, `_resolve` cleans it up
+        return out, runner if debug_list is None else None
 
     if debug_list is None:
-        runner.cleanup()        
+        runner.cleanup()
     
     return out
 
+def _retry_parse(idx, error, func, process_args, report: TaskReport, quota, backoff=0.0):
+    # a failed parse uses the quota of its task as a failed model run does, the task runs again parsed in this thread
+    process_args = {**process_args, "parse_pool": None}
+    warn(f"task: {idx} (quota:{quota-report.attempts}/{quota}) parse fail due to: {error}")
+    report.error_list.append(error)
+    for used_quota in range(report.attempts, quota):
+        time.sleep(get_backoff_delay(backoff, used_quota))
+        report.attempts += 1
+        try:
+            return func(process_args)
+        except Exception as e:
+            warn(f"task: {idx} (quota:{quota-used_quota-1}/{quota}) fail due to: {e}")
+            report.error_list.append(e)
+    raise YPoolFailed(f"task {idx} failed after {report.attempts} attempts: {report.error_list}")
+
+def _resolve(out_list, parse_pool: Executor=None, func=None, process_args_list=None, task_report_list=None,
+             quota=1, backoff=0.0):
+    # out_list: [(future, runner to cleanup or None)] if `parse_pool` is used
+    # func, process_args_list, task_report_list, quota, backoff: the tasks of `out_list`, to retry failed parses
+    if parse_pool is None:
+        return out_list
+    try:
+        res_list = []
+        for idx, (future, _) in enumerate(out_list):
+            try:
+                res_list.append(future.result())
+            except Exception as e:
+                if func is None:
+                    raise
+                report = task_report_list[idx] if task_report_list is not None else TaskReport(idx, 1, [])
+                res_list.append(_retry_parse(idx, e, func, process_args_list[idx], report, quota, backoff))
+        return res_list
+    finally:
+        for future, runner in out_list:
+            if runner is not None:
+                wait([future])
+                runner.cleanup()
 
-def run_batch(root, data_map_list, pool_size=0, debug_list=None, dst_root_list=None, sequential=False):
+
+def run_batch(root, data_map_list, pool_size=0, debug_list=None, dst_root_list=None, sequential=False,
+              out_kwargs_map=None, sandbox_pool: SandboxPool=None, parse_pool: Executor=None, post_func=None,
+              timeout_policy: TimeoutPolicy=None, backoff=0.0, report_list=None, result_cache: ResultCache=None,
+              scratch_root=None, link_mode="symlink", handoff_mode="copy", executor=None, batch_executor: BatchExecutor=None):
     """
     sequential argument is used to control parallel related factor to help debugging
+    out_kwargs_map: see `Runner`
+    sandbox_pool: lease simulation directories from it instead of creating and removing them for every job.
+        Runners kept in `debug_list` are returned to the pool by `cleanup`.
+    parse_pool: an executor (typically `ProcessPoolExecutor`) parsing the outputs, then the worker threads only
+        supervise the model processes and parsing doesn't fight for the GIL with them.
+        A failed parse uses the quota as a failed model run, the simulation runs again (parsed in the caller thread).
+    post_func: `post_func(out_map)` replaces the returned out map, it runs in `parse_pool` (so must be picklable),
+        ex: `functools.partial(pedant.get_df, actioner)`.
+    timeout_policy: kill a model running longer than the timeout given by the policy, the attempt fails.
+    backoff: see `YPool`.
+    report_list: if given, extended with a `TaskReport` (attempts and failure causes) for every data_map.
+    result_cache: return the stored out map of a candidate simulated before, repeated candidates in
+        `data_map_list` are simulated once, each gets a shallow copy of the out map.
+        `report_list` then only covers the simulated candidates.
+    scratch_root, link_mode, handoff_mode: see `Runner`, ignored for the directories of `sandbox_pool` and `dst_root_list`
+        (`link_mode` and `handoff_mode` still apply to `dst_root_list`).
+    executor: a `remote.RemoteExecutor`, the simulations run on its daemons (which have their own copies of `root`),
+        `debug_list` is then filled with `RemoteRunner`. `post_func` is applied locally, local-only options are ignored.
+    batch_executor: run the jobs on the threads of a long-lived `BatchExecutor` rather than starting a `YPool`,
+        its size, quota and backoff are used instead of `pool_size` and `backoff`.
     """
     data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
 
+    if executor is not None and result_cache is None:
+        out_list = executor.run_batch(data_map_list, out_kwargs_map=out_kwargs_map, debug_list=debug_list)
+        if report_list is not None:
+            report_list.extend(executor.report_list)
+        if post_func is not None:
+            out_list = [post_func(out) for out in out_list]
+        return out_list
+
+    if result_cache is not None:
+        if debug_list is not None or dst_root_list is not None:
+            raise ValueError("result_cache skips simulations, it can't be used with debug_list or dst_root_list")
+        if post_func is not None:
+            raise ValueError("result_cache stores raw out maps, apply post_func to the returned ones instead")
+
+        key_list = [result_cache.get_key(data_map, root, out_kwargs_map) for data_map in data_map_list]
+        out_map_map = {key: result_cache.load(key) for key in set(key_list)}
+        miss_map = {}
+        for key, data_map in zip(key_list, data_map_list):
+            if out_map_map[key] is None:
+                miss_map.setdefault(key, data_map)
+        logging.info(f"result cache: {len(data_map_list)} candidates, {len(miss_map)} to simulate")
+
+        if len(miss_map) > 0:
+            out_list = run_batch(root, list(miss_map.values()), pool_size=pool_size, sequential=sequential,
+                                 out_kwargs_map=out_kwargs_map, sandbox_pool=sandbox_pool, parse_pool=parse_pool,
+                                 timeout_policy=timeout_policy, backoff=backoff, report_list=report_list,
+                                 scratch_root=scratch_root, link_mode=link_mode, handoff_mode=handoff_mode,
+                                 executor=executor, batch_executor=batch_executor)
+            for key, out in zip(miss_map, out_list):
+                result_cache.dump(key, out)
+                out_map_map[key] = out
+        out_list = []
+        seen = set()
+        for key in key_list:
+            # repeated candidates get their own map (sharing the frames)
+            out_list.append(out_map_map[key] if key not in seen else dict(out_map_map[key]))
+            seen.add(key)
+        return out_list
+
     if pool_size == 0:
         pool_size = get_default_pool_size()
     if dst_root_list is None:
         dst_root_list = [None for _ in data_map_list]
+    else:
+        assert sandbox_pool is None, "dst_root_list and sandbox_pool are exclusive"
 
     if debug_list is not None:
         assert len(debug_list) == 0, "debug_list is not None or empty list, maybe mistakenly use a previous list?"
@@ -158,55 +671,88 @@ def run_batch(root, data_map_list, pool_size=0, debug_list=None, dst_root_list=N
 
     process_args_list = []
     for idx, (data_map, dst_root) in enumerate(zip(data_map_list, dst_root_list)):
-        process_args = {"root":root, "data_map": data_map, "debug_list": debug_list, "dst_root": dst_root, "idx": idx} 
+        process_args = {"root":root, "data_map": data_map, "debug_list": debug_list, "dst_root": dst_root, "idx": idx,
+                        "out_kwargs_map": out_kwargs_map, "sandbox_pool": sandbox_pool,
+                        "parse_pool": parse_pool, "post_func": post_func, "timeout_policy": timeout_policy,
+                        "scratch_root": scratch_root, "link_mode": link_mode, "handoff_mode": handoff_mode}
         process_args_list.append(process_args)
     
+    if batch_executor is not None and not sequential:
+        task_report_list = []
+        try:
+            out_list = batch_executor.map_batch(work, process_args_list, report_list=task_report_list)
+            return _resolve(out_list, parse_pool, work, process_args_list, task_report_list,
+                            batch_executor.quota, batch_executor.backoff)
+        finally:
+            if report_list is not None:
+                report_list.extend(task_report_list)
     if not sequential:
-        pool = Pool(pool_size)
-        return pool.map(work, process_args_list)
+        pool = Pool(pool_size, backoff=backoff)
+        try:
+            out_list = pool.map(work, process_args_list)
+            return _resolve(out_list, parse_pool, work, process_args_list, pool.report_list, pool.quota, pool.backoff)
+        finally:
+            if report_list is not None:
+                report_list.extend(pool.report_list)
     else:
-        return [work(process_arg) for process_arg in process_args_list]
+        return _resolve([work(process_arg) for process_arg in process_args_list], parse_pool)
 
 
 def work_restart(process_args: dict):
-    # TODO: An valuable altnative implementation is to just rename three files rather than symbolic link
+    # restart files are renamed rather than copied with `handoff_mode` "hardlink" or "reflink", see `copy_restart_files`
     runner: Runner = process_args["runner"]
     data_map:dict = process_args["data_map"]
 
-    out = runner.run_strict(data_map)
+    parse_pool = process_args.get("parse_pool")
+    out = _run_or_submit(runner, data_map, parse_pool, process_args.get("post_func"))
 
+    if parse_pool is not None:
+        return out, None
     return out
 
 
-def copy_restart_files(src, dst=None):
+def copy_restart_files(src, dst=None, handoff_mode="copy"):
+    """
+    Make the restart outputs of `src` the restart inputs of `dst` (`src` itself if `None`).
+    handoff_mode: "copy", or "hardlink"/"reflink" which rename the files inside a directory and link them into another.
+    """
     src = Path(src)
     dst = Path(dst) if dst is not None else src
 
-    out_to_inp = {
-        "RESTART.OUT": "RESTART.INP",
-        "TEMPBRST.OUT": "TEMPB.RST",
-        "WQWCRST.OUT": "wqini.inp"
-    }
-
-    for out_s, inp_s in out_to_inp.items():
+    for out_s, inp_s in restart_out_to_inp.items():
         src_p = src / out_s
         dst_p = dst / inp_s
-        if dst_p.exists():
-            dst_p.unlink()
-        copy_locked(src_p, dst_p)
-        assert dst_p.exists(), "Strange bug?"
+        if handoff_mode != "copy" and dst == src:
+            os.replace(src_p, dst_p)
+            logging.debug(f"renamed {src_p} => {dst_p}")
+            continue
+        if handoff_mode != "copy" and not src_p.exists():
+            src_p = src / inp_s # renamed by a previous handoff
+        handoff_file(src_p, dst_p, handoff_mode)
 
-        logging.debug(f"copied {src_p} => {dst_p}")
+        logging.debug(f"{handoff_mode} {src_p} => {dst_p}")
 
-def fork(runner_base: Runner, size:int) -> List[Runner]:
+def fork(runner_base: Runner, size:int, sandbox_pool: SandboxPool=None) -> List[Runner]:
     """
     Fork a executed runner into many runners.
+    sandbox_pool: take the runners from the pool, it should be created from the root `runner_base` comes from.
+    A `RemoteRunner` is forked on its daemon.
     """
+    if getattr(runner_base, "is_remote", False):
+        return runner_base.executor.fork(runner_base, size)
+
     #copy_name_list = ["RESTART.OUT", "TEMPBRST.OUT", "WQWCRST.OUT"]
     runner_list = []
     for _ in range(size):
-        runner = Runner(runner_base.dst_root)
-        copy_restart_files(runner_base.dst_root, runner.dst_root)
+        if sandbox_pool is not None:
+            runner = sandbox_pool.acquire()
+            runner.out_kwargs_map = runner_base.out_kwargs_map
+        else:
+            runner = Runner(runner_base.dst_root, out_kwargs_map=runner_base.out_kwargs_map,
+                            scratch_root=runner_base.scratch_root, link_mode=runner_base.link_mode)
+        runner.handoff_mode = runner_base.handoff_mode
+        copy_restart_files(runner_base.dst_root, runner.dst_root, handoff_mode=runner.handoff_mode)
+        runner.checkpoint_key = runner_base.checkpoint_key
         runner_list.append(runner)
 
         logging.debug(f"fork: {runner_base.dst_root} -> {runner.dst_root}")
@@ -218,8 +764,10 @@ def check_is_restarting(data_map_or_actioner):
     elif isinstance(data_map_or_actioner, dict):
         warn("Input is data_map instead of Actioner, is_restarting is not checked")
 
-def restart_batch(runner_list:List[Runner], data_map_list, pool_size=None):
-    # runner_list can be obtained by `debug_list` in `run_batch`
+def restart_batch(runner_list:List[Runner], data_map_list, pool_size=None, parse_pool: Executor=None, post_func=None,
+                  timeout_policy: TimeoutPolicy=None, backoff=0.0, report_list=None, batch_executor: BatchExecutor=None):
+    # runner_list can be obtained by `debug_list` in `run_batch`, `RemoteRunner` restart on their daemons.
+    # parse_pool, post_func, timeout_policy, backoff, report_list, batch_executor: see `run_batch`
     assert len(runner_list) == len(data_map_list)
 
     for x in data_map_list:
@@ -227,33 +775,240 @@ def restart_batch(runner_list:List[Runner], data_map_list, pool_size=None):
     
     data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
 
+    if len(runner_list) > 0 and getattr(runner_list[0], "is_remote", False):
+        executor = runner_list[0].executor
+        out_list = executor.restart_batch(runner_list, data_map_list)
+        if report_list is not None:
+            report_list.extend(executor.report_list)
+        if post_func is not None:
+            out_list = [post_func(out) for out in out_list]
+        return out_list
+
     if pool_size is None:
         pool_size = get_default_pool_size()
 
-    pool = Pool(pool_size)
+    if timeout_policy is not None:
+        for runner in runner_list:
+            runner.timeout_policy = timeout_policy
+
     process_args_list = []
     for runner, data_map in zip(runner_list, data_map_list):
-        process_args = {"runner": runner, "data_map": data_map} 
+        process_args = {"runner": runner, "data_map": data_map, "parse_pool": parse_pool, "post_func": post_func}
         process_args_list.append(process_args)
+
+    if batch_executor is not None:
+        task_report_list = []
+        try:
+            out_list = batch_executor.map_batch(work_restart, process_args_list, report_list=task_report_list)
+            return _resolve(out_list, parse_pool, work_restart, process_args_list, task_report_list,
+                            batch_executor.quota, batch_executor.backoff)
+        finally:
+            if report_list is not None:
+                report_list.extend(task_report_list)
+    pool = Pool(pool_size, backoff=backoff)
+    try:
+        out_list = pool.map(work_restart, process_args_list)
+        return _resolve(out_list, parse_pool, work_restart, process_args_list, pool.report_list, pool.quota, pool.backoff)
+    finally:
+        if report_list is not None:
+            report_list.extend(pool.report_list)
+
+async def _as_completed(coro_list):
+    task_list = [asyncio.ensure_future(coro) for coro in coro_list]
+    try:
+        for future in asyncio.as_completed(task_list):
+            yield await future
+    finally:
+        # the consumer stopped early or a job failed, unfinished models are killed by the cancellation
+        for task in task_list:
+            task.cancel()
+        await asyncio.gather(*task_list, return_exceptions=True)
+
+async def _run_with_quota(idx, quota, get_runner, release_runner, data_map, parse_pool, post_func, backoff=0.0):
+    # `YPool`-like retry for the coroutine runners
+    error = None
+    for used_quota in range(quota):
+        if used_quota > 0 and backoff > 0:
+            await asyncio.sleep(get_backoff_delay(backoff, used_quota))
+        runner = await get_runner()
+        try:
+            out = await runner.run_strict_async(data_map, parse_pool, post_func)
+        except asyncio.CancelledError:
+            await release_runner(runner)
+            raise
+        except Exception as e:
+            warn(f"task: {idx} (quota:{quota-used_quota-1}/{quota}) fail due to: {e}")
+            error = e
+            await release_runner(runner)
+            continue
+        await release_runner(runner)
+        return idx, out
+    raise error
+
+async def run_batch_async(root, data_map_list, concurrency=0, quota=3, debug_list=None,
+                          out_kwargs_map=None, sandbox_pool: SandboxPool=None, parse_pool: Executor=None, post_func=None,
+                          timeout_policy: TimeoutPolicy=None, backoff=0.0, scratch_root=None, link_mode="symlink"):
+    """
+    Async generator version of `run_batch`, yield `(idx, out_map)` as soon as a simulation finishes:
+
+    async for idx, out_map in run_batch_async(root, actioner_list):
+        ...
+
+    concurrency: max number of running models, 0 means `get_default_pool_size()`.
+    quota: attempts for every simulation, as in `YPool`.
+    Other arguments: see `run_batch`.
+    """
+    data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
+
+    if concurrency == 0:
+        concurrency = max(get_default_pool_size(), 1)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    if debug_list is not None:
+        assert len(debug_list) == 0, "debug_list is not None or empty list, maybe mistakenly use a previous list?"
+        debug_list.extend([None for _ in data_map_list])
+
+    loop = asyncio.get_running_loop()
+
+    def get_job(idx, data_map):
+        async def get_runner():
+            if sandbox_pool is not None:
+                runner = sandbox_pool.acquire()
+                runner.out_kwargs_map = out_kwargs_map
+            else:
+                future = loop.run_in_executor(None, lambda: Runner(root, out_kwargs_map=out_kwargs_map,
+                                                                   scratch_root=scratch_root, link_mode=link_mode))
+                try:
+                    runner = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # the directory is being created in the executor anyway, remove it
+                    runner = await future
+                    await loop.run_in_executor(None, runner.cleanup)
+                    raise
+            runner.timeout_policy = timeout_policy
+            if debug_list is not None:
+                debug_list[idx] = runner
+            return runner
+
+        async def release_runner(runner):
+            if debug_list is None:
+                await loop.run_in_executor(None, runner.cleanup)
+
+        async def job():
+            async with semaphore:
+                return await _run_with_quota(idx, quota, get_runner, release_runner, data_map, parse_pool, post_func, backoff)
+        return job()
+
+    stream = _as_completed([get_job(idx, data_map) for idx, data_map in enumerate(data_map_list)])
+    try:
+        async for idx_out in stream:
+            yield idx_out
+    finally:
+        await stream.aclose() # cancel jobs now rather than when the inner generator is collected
+
+async def restart_batch_async(runner_list:List[Runner], data_map_list, concurrency=None, quota=3,
+                              parse_pool: Executor=None, post_func=None, timeout_policy: TimeoutPolicy=None, backoff=0.0):
+    """
+    Async generator version of `restart_batch`, yield `(idx, out_map)` in completion order.
+    """
+    assert len(runner_list) == len(data_map_list)
+
+    for x in data_map_list:
+        check_is_restarting(x)
     
-    return pool.map(work_restart, process_args_list)
+    data_map_list = [x if isinstance(x, dict) else x.data_map for x in data_map_list]
+
+    if concurrency is None:
+        concurrency = max(get_default_pool_size(), 1)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    if timeout_policy is not None:
+        for runner in runner_list:
+            runner.timeout_policy = timeout_policy
+
+    def get_job(idx, runner, data_map):
+        async def get_runner():
+            return runner
+
+        async def release_runner(runner):
+            pass
+
+        async def job():
+            async with semaphore:
+                return await _run_with_quota(idx, quota, get_runner, release_runner, data_map, parse_pool, post_func, backoff)
+        return job()
+
+    job_list = [get_job(idx, runner, data_map) for idx, (runner, data_map) in enumerate(zip(runner_list, data_map_list))]
+    stream = _as_completed(job_list)
+    try:
+        async for idx_out in stream:
+            yield idx_out
+    finally:
+        await stream.aclose()
 
 def data_map_fill(data_map:dict):
     data_map_filled = {dumpable: None for dumpable in dumpable_list}
     data_map_filled.update(data_map)
     return data_map_filled
 
+def _restart_batch_checkpointed(checkpoint_store: CheckpointStore, runner_list: List[Runner], actioner_list: List[Actioner],
+                                begin_day, length, batch_executor: BatchExecutor=None):
+    """
+    `restart_batch` + `copy_restart_files` for a step, candidates whose step is stored are restored instead,
+    candidates with the same step key are simulated once.
+    """
+    out_map_list = [None for _ in runner_list]
+    key_list = []
+    miss_map = {} # key -> [idx], the first one is simulated
+    for idx, (runner, actioner) in enumerate(zip(runner_list, actioner_list)):
+        key = checkpoint_store.get_step_key(runner.checkpoint_key, actioner.data_map, begin_day, length, runner.out_kwargs_map)
+        key_list.append(key)
+        if key in miss_map:
+            miss_map[key].append(idx)
+            continue
+        out_map = checkpoint_store.load(key)
+        if out_map is not None and checkpoint_store.restore(key, runner.dst_root):
+            out_map_list[idx] = out_map
+        else:
+            miss_map[key] = [idx]
+
+    if len(miss_map) > 0:
+        idx_list = [idx_list[0] for idx_list in miss_map.values()]
+        miss_out_list = restart_batch([runner_list[idx] for idx in idx_list], [actioner_list[idx] for idx in idx_list],
+                                      pool_size=len(idx_list), batch_executor=batch_executor)
+        for (key, idx_list), out_map in zip(miss_map.items(), miss_out_list):
+            checkpoint_store.save(key, runner_list[idx_list[0]].dst_root, out_map)
+            for idx in idx_list:
+                if idx != idx_list[0]:
+                    for out_s in restart_out_to_inp:
+                        handoff_file(runner_list[idx_list[0]].dst_root / out_s, runner_list[idx].dst_root / out_s,
+                                     runner_list[idx].handoff_mode)
+                out_map_list[idx] = out_map
+    logging.info(f"checkpoint: {len(runner_list) - len(miss_map)}/{len(runner_list)} steps restored")
+
+    for runner, key in zip(runner_list, key_list):
+        runner.handoff()
+        runner.checkpoint_key = key
+    return out_map_list
+
 def restart_list_iterator(begin_day, end_day, runner_completed:Runner, actioner_frozen_list: List[Actioner],
                         step=7, pedant: Pedant=None,
-                        debug_list=None, return_out_map=False):
+                        debug_list=None, return_out_map=False, sandbox_pool: SandboxPool=None,
+                        checkpoint_store: CheckpointStore=None, batch_executor: BatchExecutor=None):
     # This function will not modify *qser* and other detailed information, 
     # as they're expected to be encoded in actioner_frozen already.
     # So this function will not yield actioner since the caller can still use action_frozen as usual.
+    # checkpoint_store: resume every candidate from the deepest stored checkpoint it shares, see `CheckpointStore`.
+    #     The runners of restored steps only hold the restart outputs, not the other outputs of the step.
+    # batch_executor: run every step on it, see `run_batch`.
+    # step: days per step, or a `StepPolicy` choosing them from the measured cost of the previous steps.
 
     actioner_list = [actioner.copy() for actioner in actioner_frozen_list]
     processing_begin_day = begin_day
 
-    runner_list = fork(runner_completed, len(actioner_frozen_list))
+    if checkpoint_store is not None and runner_completed.checkpoint_key is None:
+        runner_completed.checkpoint_key = checkpoint_store.get_state_key(runner_completed.dst_root)
+    runner_list = fork(runner_completed, len(actioner_frozen_list), sandbox_pool=sandbox_pool)
 
     if debug_list is not None:
         debug_list.extend(runner_list)
@@ -262,37 +1017,167 @@ def restart_list_iterator(begin_day, end_day, runner_completed:Runner, actioner_
         actioner.enable_restart()
 
     # TODO
-    while processing_begin_day < end_day:
-        simulation_length = min(end_day - processing_begin_day, step)
+    try:
+        while processing_begin_day < end_day:
+            if isinstance(step, StepPolicy):
+                simulation_length = step.get_step(processing_begin_day, end_day)
+                n_parsed_list = [len(getattr(runner, "shell_output_parsed_list", [])) for runner in runner_list]
+                begin = time.time()
+            else:
+                simulation_length = min(end_day - processing_begin_day, step)
 
-        for actioner in actioner_list:
-            actioner.set_simulation_begin_time(processing_begin_day)
-            actioner.set_simulation_length(simulation_length)
-        
-        out_map_list = restart_batch(runner_list, actioner_list, pool_size=len(actioner_list))
+            for actioner in actioner_list:
+                actioner.set_simulation_begin_time(processing_begin_day)
+                actioner.set_simulation_length(simulation_length)
+            
+            if checkpoint_store is not None:
+                out_map_list = _restart_batch_checkpointed(checkpoint_store, runner_list, actioner_list,
+                                                           processing_begin_day, simulation_length, batch_executor)
+            else:
+                out_map_list = restart_batch(runner_list, actioner_list, pool_size=len(actioner_list),
+                                             batch_executor=batch_executor)
 
-        for runner in runner_list:
-            copy_restart_files(runner.dst_root)
+                for runner in runner_list:
+                    runner.handoff()
+
+            if not return_out_map:
+                out_map_list = [pedant.get_df(actioner, out_map) for out_map in out_map_list]
+
+            if isinstance(step, StepPolicy):
+                model_seconds = step.get_model_seconds(runner_list, n_parsed_list)
+                if checkpoint_store is None or model_seconds is not None: # skip steps restored without running
+                    step.update(simulation_length, time.time() - begin, model_seconds)
 
-        if return_out_map:
             yield out_map_list
-        else:
-            df_list = [pedant.get_df(actioner, out_map) for out_map in out_map_list]
-            yield df_list
 
-        processing_begin_day = processing_begin_day + simulation_length
+            processing_begin_day = processing_begin_day + simulation_length
+    finally:
+        # also when the caller stops early (ex: `restart_list_single`)
+        if debug_list is None:
+            for runner in runner_list:
+                runner.cleanup()
 
-    if debug_list is None:
-        for runner in runner_list:
-            runner.cleanup()
+def restart_list_iterator_pipelined(begin_day, end_day, runner_completed: Runner, actioner_frozen_list: List[Actioner],
+                                    step=7, pedant: Pedant=None, debug_list=None, return_out_map=False,
+                                    sandbox_pool: SandboxPool=None, pool_size=None, quota=3, backoff=0.0,
+                                    batch_executor: BatchExecutor=None):
+    """
+    `restart_list_iterator` without waiting for the other candidates, yield `(idx, day, df_or_out_map)` per step.
+    pool_size: max number of running models, `None` means `get_default_pool_size()`.
+    quota, backoff: see `YPool`, a failed step is retried in the directory of the candidate.
+    batch_executor: run the steps on it instead of a pool created for the call (`pool_size` is then ignored).
+    step: days per step, or a `StepPolicy` (updated by every step of every candidate).
+    """
+    if pool_size is None:
+        pool_size = max(get_default_pool_size(), 1)
+
+    actioner_list = [actioner.copy() for actioner in actioner_frozen_list]
+    for actioner in actioner_list:
+        actioner.enable_restart()
+
+    runner_list = fork(runner_completed, len(actioner_frozen_list), sandbox_pool=sandbox_pool)
+    if debug_list is not None:
+        debug_list.extend(runner_list)
+
+    out_queue = Queue() # (idx, day, out, whether it's the last step of the candidate)
+    stopped = Event()
+    executor = batch_executor if batch_executor is not None else ThreadPoolExecutor(pool_size)
+
+    future_set = set() # jobs on `batch_executor`, which isn't shut down by this function
+    future_lock = Lock()
+
+    def discard(future):
+        with future_lock:
+            future_set.discard(future)
+
+    def submit(idx, day):
+        if stopped.is_set():
+            return
+        try:
+            future = executor.submit(job, idx, day)
+        except RuntimeError:
+            return # shut down by the consumer in the meantime
+        with future_lock:
+            future_set.add(future)
+        future.add_done_callback(discard)
+
+    def job(idx, day):
+        if stopped.is_set():
+            return
+        runner, actioner = runner_list[idx], actioner_list[idx]
+        if isinstance(step, StepPolicy):
+            simulation_length = step.get_step(day, end_day)
+        else:
+            simulation_length = min(end_day - day, step)
+        actioner.set_simulation_begin_time(day)
+        actioner.set_simulation_length(simulation_length)
+
+        error_list = []
+        for used_quota in range(quota):
+            time.sleep(get_backoff_delay(backoff, used_quota))
+            n_parsed = len(getattr(runner, "shell_output_parsed_list", []))
+            begin = time.time()
+            try:
+                out_map = runner.run_strict(actioner.data_map)
+            except Exception as e:
+                warn(f"candidate: {idx} day: {day} (quota:{quota-used_quota-1}/{quota}) fail due to: {e}")
+                error_list.append(e)
+                continue
+            break
+        else:
+            out_queue.put((idx, day, FAIL(error_list[-1]), True))
+            return
+
+        try:
+            runner.handoff()
+            # the actioner is not touched by the next step of the candidate before it's submitted
+            out = out_map if return_out_map else pedant.get_df(actioner, out_map)
+        except Exception as e:
+            out_queue.put((idx, day, FAIL(e), True))
+            return
+        if isinstance(step, StepPolicy):
+            step.update(simulation_length, time.time() - begin, step.get_model_seconds([runner], [n_parsed]))
+        is_last = day + simulation_length >= end_day
+        # queued before the next step exists, so the steps of a candidate are yielded in order
+        out_queue.put((idx, day, out, is_last))
+        if not is_last:
+            submit(idx, day + simulation_length)
+
+    try:
+        if begin_day < end_day:
+            for idx in range(len(runner_list)):
+                submit(idx, begin_day)
+            num_running = len(runner_list)
+        else:
+            num_running = 0
+        while num_running > 0:
+            idx, day, out, is_last = out_queue.get()
+            if isinstance(out, FAIL):
+                raise YPoolFailed(f"candidate {idx} failed at day {day}: {out.error}") from out.error
+            num_running -= is_last
+            yield idx, day, out
+    finally:
+        # steps not started yet are skipped, running models are waited for
+        stopped.set()
+        if batch_executor is None:
+            executor.shutdown(wait=True)
+        else:
+            with future_lock:
+                future_list = list(future_set)
+            wait(future_list)
+        if debug_list is None:
+            for runner in runner_list:
+                runner.cleanup()
 
 def restart_iterator(begin_day, end_day, runner_completed: Runner, actioner_frozen:Runner, 
                     step=7, pedant: Pedant=None,
-                    debug_list=None, return_out_map=False):
+                    debug_list=None, return_out_map=False, sandbox_pool: SandboxPool=None,
+                    checkpoint_store: CheckpointStore=None, batch_executor: BatchExecutor=None):
     # This function is for backward compatibility. Favor restart_list_iterator in general.
     actioner_frozen_list = [actioner_frozen]
     for df_or_out_map_list in restart_list_iterator(begin_day, end_day, runner_completed, actioner_frozen_list,
-                    step=step, pedant=pedant, debug_list=debug_list, return_out_map=return_out_map):
+                    step=step, pedant=pedant, debug_list=debug_list, return_out_map=return_out_map,
+                    sandbox_pool=sandbox_pool, checkpoint_store=checkpoint_store, batch_executor=batch_executor):
         yield df_or_out_map_list[0]
     
 """
@@ -339,26 +1224,52 @@ def restart_iterator(begin_day, end_day, runner_completed: Runner, actioner_froz
 
 def start_iterator(begin_day:int, end_day:int, root, actioner_frozen: Actioner,
                     step=7, pedant:Pedant=None, return_out_map=False,
-                    debug_list=None, debug_restart_list=None):
+                    debug_list=None, debug_restart_list=None, sandbox_pool: SandboxPool=None,
+                    checkpoint_store: CheckpointStore=None, handoff_mode="copy", batch_executor: BatchExecutor=None):
+    # checkpoint_store: see `restart_list_iterator`, the first step is restored as well.
+    # handoff_mode: see `Runner`, the one of `sandbox_pool` is used if it's given.
+    # batch_executor: see `run_batch`, shared by the first run and the restart steps.
+    # step: see `restart_list_iterator`, a `StepPolicy` chooses the first step too.
                     
+    first_step = step.get_step(begin_day, end_day) if isinstance(step, StepPolicy) else step
     actioner = actioner_frozen.copy()
     actioner.set_simulation_begin_time(begin_day)
-    actioner.set_simulation_length(step)
+    actioner.set_simulation_length(first_step)
     # assert begin_day + step < end_day
 
     if debug_list is None:
         debug_list = []
-    out_map, = run_batch(root, [actioner], debug_list=debug_list)
-    runner_completed = debug_list[0]
+
+    out_map = None
+    if checkpoint_store is not None:
+        key = checkpoint_store.get_step_key(checkpoint_store.get_start_key(root), actioner.data_map, begin_day, first_step)
+        out_map = checkpoint_store.load(key)
+        if out_map is not None:
+            runner_completed = sandbox_pool.acquire() if sandbox_pool is not None else Runner(root, handoff_mode=handoff_mode)
+            if checkpoint_store.restore(key, runner_completed.dst_root):
+                debug_list.append(runner_completed)
+            else:
+                runner_completed.cleanup()
+                out_map = None
+
+    if out_map is None:
+        out_map, = run_batch(root, [actioner], debug_list=debug_list, sandbox_pool=sandbox_pool, handoff_mode=handoff_mode,
+                             batch_executor=batch_executor)
+        runner_completed = debug_list[0]
+        if checkpoint_store is not None:
+            checkpoint_store.save(key, runner_completed.dst_root, out_map)
+    if checkpoint_store is not None:
+        runner_completed.checkpoint_key = key
 
     if return_out_map:
         yield out_map
     else:
         yield pedant.get_df(actioner, out_map)
 
-    yield from restart_iterator(begin_day + step, end_day, runner_completed, actioner_frozen,
-                step=step, pedant=pedant,
-                debug_list=debug_restart_list)
+    yield from restart_iterator(begin_day + first_step, end_day, runner_completed, actioner_frozen,
+                step=step, pedant=pedant, return_out_map=return_out_map,
+                debug_list=debug_restart_list, sandbox_pool=sandbox_pool, checkpoint_store=checkpoint_store,
+                batch_executor=batch_executor)
 
 @contextmanager
 def debug_env(debug_list=None, protect=None):
@@ -383,15 +1294,48 @@ def start_single(begin_day, end_day, root, actioner_frozen:Actioner, **kwargs):
 def restart_single(begin_day, end_day, runner_completed, actioner_frozen:Actioner, **kwargs):
     step = end_day - begin_day
     it = restart_iterator(begin_day, end_day, runner_completed, actioner_frozen, step=step, **kwargs)
-    return next(it)
+    try:
+        return next(it)
+    finally:
+        it.close()
 
 def restart_list_single(begin_day, end_day, runner_completed, actioner_frozen:Actioner, **kwargs):
     step = end_day - begin_day
     it = restart_list_iterator(begin_day, end_day, runner_completed, actioner_frozen, step=step, **kwargs)
-    return next(it)
+    try:
+        return next(it)
+    finally:
+        it.close()
+
+def _concat_segment_df(df_list):
+    # dfs of consecutive restarted segments, the boundary time may be reported by both sides
+    df = pd.concat(df_list)
+    return df[~df.index.duplicated(keep="first")]
+
+def _get_same_hours(arr, ref_arr):
+    # number of leading rows (hours) on which two decision matrices agree
+    diff = np.any(arr != ref_arr, axis=1)
+    return int(np.argmax(diff)) if diff.any() else len(diff)
 
 class SimilarRestarter:
-    def __init__(self, actioner_limit: Actioner, runner_completed, decided_length, end_hour, pedant, use_cache=True):
+    """
+    Restart from `runner_completed` a list of candidate decisions which share a lot of their prefix
+    (ex: the candidates proposed by a MPC optimizer).
+
+    The candidates are arranged as a tree of whole days: every node simulates once the days its candidates agree on,
+    from the restart files of its parent, and forks for the candidates diverging after them, so only the parts
+    where the candidates differ are simulated for each of them.
+    With `use_cache`, the state at the end of the most shared prefix is kept across `restart` calls,
+    later candidates following the same prefix restart from it directly. Call `cleanup` to remove it.
+
+    decided_ddf: hourly decision df as in `Actioner.set_flow_by_decision_df`,
+        row 0 is the simulation begin time of `actioner_limit`.
+    decided_length: hours already simulated by `runner_completed`.
+    end_hour: hours to simulate to, a multiple of 24.
+    batch_executor: see `run_batch`.
+    """
+    def __init__(self, actioner_limit: Actioner, runner_completed, decided_length, end_hour, pedant, use_cache=True,
+                 batch_executor: BatchExecutor=None):
         self.actioner_limit = actioner_limit
         self.runner_completed = runner_completed
         self.decided_length = decided_length
@@ -400,68 +1344,123 @@ class SimilarRestarter:
 
         self.pedant = pedant
 
-        total_begin_time = self.actioner_limit.get_simulation_begin_time()
+        self.total_begin_time = self.actioner_limit.get_simulation_begin_time()
 
         # whole begin_day, end_day
-        self.begin_day = total_begin_time + self.decided_length // 24
-        self.end_day = total_begin_time + end_hour // 24
+        self.begin_day = self.total_begin_time + self.decided_length // 24
+        self.end_day = self.total_begin_time + end_hour // 24
 
         self.use_cache = use_cache
+        self.batch_executor = batch_executor
 
         self.decided_ddf_cached = None
         self.same_end_day_cached = None
         self.runner_guider_cached = None
+        self.df_guider_cached = None
+
+    def _get_hour(self, day):
+        return int(round(day - self.total_begin_time)) * 24
+
+    # A prefix ending at a day is shared only if the hour following it is shared too,
+    # since the model may read the decision at the boundary time before the restart.
+
+    def _split(self, arr_list, idx_list, day):
+        # group candidates by their decisions of `day` and the hour following it
+        hour = self._get_hour(day)
+        group_map = {}
+        for idx in idx_list:
+            group_map.setdefault(arr_list[idx][hour: hour + 25].tobytes(), []).append(idx)
+        return list(group_map.values())
+
+    def _get_same_end_day(self, arr_list, group, day):
+        # candidates of `group` share the simulation from `day` to the returned day
+        hour = self._get_hour(day)
+        ref_arr = arr_list[group[0]][hour: self.end_hour]
+        same_hours = min(_get_same_hours(arr_list[idx][hour: self.end_hour], ref_arr) for idx in group)
+        if same_hours == self.end_hour - hour:
+            return self.end_day
+        return day + (same_hours - 1) // 24
 
     def restart(self, decided_ddf_list):
         assert len(decided_ddf_list) > 0
 
-        total_begin_time = self.actioner_limit.get_simulation_begin_time()
-
-        use_guider = True
-
-        if len(decided_ddf_list) == 1:
-            use_guider = False
-        else:
-            cut_ddf_arr = np.array([dddf[self.decided_length: self.end_hour].to_numpy() for dddf in decided_ddf_list]) # (num_simulation, time, inflow_and_pump)
-            same_arr = np.cumprod(np.all(cut_ddf_arr[0:1, :, :] == cut_ddf_arr[1:, :, :], axis=(0, 2)))
-            if same_arr[0] == 0:
-                use_guider = False
-            else:
-                same_idx = np.where(same_arr == 1)[0][0]
-                same_end_day = total_begin_time + (self.decided_length + same_idx) // 24
-                if same_end_day == self.begin_day:
-                    use_guider = False
-
-        if not use_guider:
-            actioner_list = []
-            for decided_ddf in decided_ddf_list:
-                actioner = self.actioner_limit.copy()
-                actioner.set_flow_by_decision_df(decided_ddf)
-                actioner_list.append(actioner)
-            return restart_list_single(self.begin_day, self.end_day, self.runner_completed, actioner_list, pedant=self.pedant)
-    
-        if self.use_cache and self.same_idx_cached is not None and self.same_end_day_cached <= same_end_day:
-            same_end_hour = (self.same_end_day_cached - total_begin_time)*24
-            ref_arr = self.decided_ddf_cached[self.decided_length: same_end_hour].to_numpy()[np.newaxis, ...]
-            
-            cut_ddf_arr[:same_end_hour]
-
-        actioner_guider = self.actioner_limit.copy()
-        actioner_guider.set_flow_by_decision_df(decided_ddf_list[0])
-        
-        debug_list = []
-        df_guider = restart_single(begin_day, end_day, self.runner_completed, actioner_guider,
-            debug_list=debug_list, pedant=self.pedant,
-        )
-        runner_guider = debug_list[0]
-
-        # TODO: WIP
-
-
-
-
-
-
-
-
+        arr_list = [decided_ddf[:self.end_hour].to_numpy() for decided_ddf in decided_ddf_list]
+        segment_list_list = [[] for _ in decided_ddf_list] # dfs of the simulated segments of every candidate
+
+        # (runner, day, idx_list): the state of runner at day is shared by the candidates of idx_list
+        frontier = []
+        idx_list_left = list(range(len(decided_ddf_list)))
+        num_hit = 0
+        if self.use_cache and self.runner_guider_cached is not None:
+            begin_hour = self._get_hour(self.begin_day)
+            cached_hour = self._get_hour(self.same_end_day_cached) + 1
+            ref_arr = self.decided_ddf_cached[begin_hour: cached_hour].to_numpy()
+            idx_hit_list = [idx for idx in idx_list_left if np.array_equal(arr_list[idx][begin_hour: cached_hour], ref_arr)]
+            if len(idx_hit_list) > 0:
+                frontier.append((self.runner_guider_cached, self.same_end_day_cached, idx_hit_list))
+                for idx in idx_hit_list:
+                    segment_list_list[idx].append(self.df_guider_cached)
+                idx_hit_set = set(idx_hit_list)
+                idx_list_left = [idx for idx in idx_list_left if idx not in idx_hit_set]
+                num_hit = len(idx_hit_list)
+        if len(idx_list_left) > 0:
+            frontier.append((self.runner_completed, self.begin_day, idx_list_left))
+
+        node_list = [] # (idx_list, day, runner, segment_list) of the shared states created in this call
+        created_list = []
+        num_simulated = 0
+        runner_cached = None
+        try:
+            while len(frontier) > 0:
+                task_list = []
+                for runner_parent, day, idx_list in frontier:
+                    for group in self._split(arr_list, idx_list, day):
+                        task_list.append((runner_parent, day, self._get_same_end_day(arr_list, group, day), group))
+
+                runner_list = []
+                actioner_list = []
+                for runner_parent, day, end_day, group in task_list:
+                    runner, = fork(runner_parent, 1)
+                    created_list.append(runner)
+                    runner_list.append(runner)
+                    actioner = self.actioner_limit.copy()
+                    actioner.config_restart(begin_day=day, end_day=end_day, ddf=decided_ddf_list[group[0]])
+                    actioner_list.append(actioner)
+                out_map_list = restart_batch(runner_list, actioner_list, pool_size=len(runner_list),
+                                             batch_executor=self.batch_executor)
+                num_simulated += len(runner_list)
+
+                frontier = []
+                for (_, _, end_day, group), runner, actioner, out_map in zip(task_list, runner_list, actioner_list, out_map_list):
+                    df = self.pedant.get_df(actioner, out_map)
+                    for idx in group:
+                        segment_list_list[idx].append(df)
+                    if end_day < self.end_day: # children are forked from its restart outputs
+                        frontier.append((runner, end_day, group))
+                        node_list.append((group, end_day, runner, list(segment_list_list[group[0]])))
+
+            if self.use_cache and len(node_list) > 0:
+                group, day, runner, segment_list = max(node_list, key=lambda node: (len(node[0]), node[1]))
+                if len(group) >= num_hit:
+                    if self.runner_guider_cached is not None:
+                        self.runner_guider_cached.cleanup()
+                    self.decided_ddf_cached = decided_ddf_list[group[0]]
+                    self.same_end_day_cached = day
+                    self.runner_guider_cached = runner_cached = runner
+                    self.df_guider_cached = _concat_segment_df(segment_list)
+        finally:
+            for runner in created_list:
+                if runner is not runner_cached:
+                    runner.cleanup()
+
+        logging.info(f"SimilarRestarter: {len(decided_ddf_list)} candidates, {num_hit} restarted from cache, "
+                     f"{num_simulated} segments simulated")
+        return [_concat_segment_df(segment_list) for segment_list in segment_list_list]
 
+    def cleanup(self):
+        if self.runner_guider_cached is not None:
+            self.runner_guider_cached.cleanup()
+        self.decided_ddf_cached = None
+        self.same_end_day_cached = None
+        self.runner_guider_cached = None
+        self.df_guider_cached = None
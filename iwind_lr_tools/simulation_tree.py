@@ -0,0 +1,208 @@
+"""
+Branches of restarted simulations stepped forward from shared states (ex: MPC, scenario planning).
+"""
+
+from typing import List, Callable
+import logging
+
+from .runner import Runner, SandboxPool, fork, restart_batch, _restart_batch_checkpointed, _concat_segment_df
+from .actioner import Actioner
+from .load_stats import Pedant
+from .fault_tolerant_pool import BatchExecutor
+from .checkpoint_store import CheckpointStore
+
+
+class SimulationNode:
+    """
+    Restart state of a branch at `day` held by `runner`, `out` is the output of the step from `parent`.
+    """
+    def __init__(self, tree: "SimulationTree", parent: "SimulationNode", day, runner: Runner,
+                 actioner: Actioner=None, out=None, owns_runner=True):
+        self.tree = tree
+        self.parent = parent
+        self.day = day
+        self.runner = runner
+        self.actioner = actioner
+        self.out = out
+        self.owns_runner = owns_runner
+        self.children: List[SimulationNode] = []
+        self.score = None
+
+        self.ref_count = 1
+        self.tree_held = True
+
+    def is_released(self):
+        return self.runner is None
+
+    def acquire(self):
+        # keep the state after the tree releases it (ex: the best node so far), until a matching `release`
+        if self.is_released():
+            raise ValueError(f"The state of {self} is released")
+        self.ref_count += 1
+        return self
+
+    def release(self):
+        # the sandbox is removed once nothing holds it, the node stays in the tree but can't be expanded
+        assert self.ref_count > 0, f"{self} is released too many times"
+        self.ref_count -= 1
+        if self.ref_count == 0:
+            if self.owns_runner:
+                self.runner.cleanup()
+            self.runner = None
+            logging.debug(f"released {self}")
+
+    def get_path(self) -> List["SimulationNode"]:
+        # nodes from the root to this one
+        path = []
+        node = self
+        while node is not None:
+            path.append(node)
+            node = node.parent
+        return path[::-1]
+
+    def get_out_list(self):
+        return [node.out for node in self.get_path()[1:]]
+
+    def get_path_df(self):
+        # `Pedant` frame from the root day to this node
+        assert self.tree.pedant is not None, "get_path_df requires a tree with a pedant"
+        return _concat_segment_df(self.get_out_list())
+
+    def __repr__(self):
+        return f"SimulationNode(day={self.day}, score={self.score}, ref_count={self.ref_count}, children={len(self.children)})"
+
+
+class SimulationTree:
+    """
+    Tree of (restart state, day) nodes:
+
+    with SimulationTree(runner_completed, begin_day, pedant) as tree:
+        child_list = tree.expand(tree.root, actioner_list, 7) # the children run in parallel
+        grandchild_list = tree.expand(child_list[0], actioner_list, 7)
+        tree.prune(child_list[1]) # release the sandboxes of a branch
+
+    runner_completed: holds the state at `begin_day` (ex: from `debug_list` of `run_batch`), it's not removed by the tree.
+    pedant: turns the out maps into frames (`node.out`), without it `node.out` is the out map.
+    sandbox_pool, batch_executor, checkpoint_store: see `restart_list_iterator`.
+    """
+    def __init__(self, runner_completed: Runner, begin_day, pedant: Pedant=None, sandbox_pool: SandboxPool=None,
+                 batch_executor: BatchExecutor=None, checkpoint_store: CheckpointStore=None):
+        self.pedant = pedant
+        self.sandbox_pool = sandbox_pool
+        self.batch_executor = batch_executor
+        self.checkpoint_store = checkpoint_store
+        self.root = SimulationNode(self, None, begin_day, runner_completed, owns_runner=False)
+
+    def expand(self, node: SimulationNode, actioner_list: List[Actioner], length) -> List[SimulationNode]:
+        return self.expand_list([node], [actioner_list], length)[0]
+
+    def expand_list(self, node_list: List[SimulationNode], actioner_list_list: List[List[Actioner]],
+                    length) -> List[List[SimulationNode]]:
+        # step every node `length` days forward with each of its actioners (copied), in one batch
+        assert len(node_list) == len(actioner_list_list)
+
+        task_list = [] # (parent, actioner)
+        runner_list = []
+        try:
+            for node, actioner_list in zip(node_list, actioner_list_list):
+                if node.is_released():
+                    raise ValueError(f"Can't expand {node}, its state is released")
+                if self.checkpoint_store is not None and node.runner.checkpoint_key is None:
+                    node.runner.checkpoint_key = self.checkpoint_store.get_state_key(node.runner.dst_root)
+                runner_list.extend(fork(node.runner, len(actioner_list), sandbox_pool=self.sandbox_pool))
+                for actioner_frozen in actioner_list:
+                    actioner = actioner_frozen.copy()
+                    actioner.enable_restart()
+                    actioner.set_simulation_begin_time(node.day)
+                    actioner.set_simulation_length(length)
+                    task_list.append((node, actioner))
+
+            if self.checkpoint_store is not None:
+                # steps of a checkpointed batch share their begin day
+                out_map_list = [None for _ in task_list]
+                for day in sorted(set(node.day for node, _ in task_list)):
+                    idx_list = [idx for idx, (node, _) in enumerate(task_list) if node.day == day]
+                    day_out_map_list = _restart_batch_checkpointed(
+                        self.checkpoint_store, [runner_list[idx] for idx in idx_list],
+                        [task_list[idx][1] for idx in idx_list], day, length, self.batch_executor)
+                    for idx, out_map in zip(idx_list, day_out_map_list):
+                        out_map_list[idx] = out_map
+            else:
+                out_map_list = restart_batch(runner_list, [actioner for _, actioner in task_list],
+                                             pool_size=len(runner_list), batch_executor=self.batch_executor)
+                for runner in runner_list:
+                    runner.handoff()
+        except BaseException:
+            for runner in runner_list:
+                runner.cleanup()
+            raise
+
+        child_list_list = [[] for _ in node_list]
+        idx = 0
+        for child_list, node, actioner_list in zip(child_list_list, node_list, actioner_list_list):
+            for _ in actioner_list:
+                _, actioner = task_list[idx]
+                out_map = out_map_list[idx]
+                out = self.pedant.get_df(actioner, out_map) if self.pedant is not None else out_map
+                child = SimulationNode(self, node, node.day + length, runner_list[idx], actioner, out)
+                node.children.append(child)
+                child_list.append(child)
+                idx += 1
+        return child_list_list
+
+    def release_state(self, node: SimulationNode):
+        # drop the reference of the tree, the node stays in the tree
+        if node.tree_held:
+            node.tree_held = False
+            node.release()
+
+    def prune(self, node: SimulationNode):
+        # remove the branch from the tree and release the states it holds
+        if node.parent is not None and node in node.parent.children:
+            node.parent.children.remove(node)
+        stack = [node]
+        while len(stack) > 0:
+            _node = stack.pop()
+            self.release_state(_node)
+            stack.extend(_node.children)
+
+    def beam_search(self, branch_func: Callable[[SimulationNode], List[Actioner]],
+                    score_func: Callable[[SimulationNode], float], length, num_steps, beam_width,
+                    node: SimulationNode=None) -> List[SimulationNode]:
+        """
+        Expand the `beam_width` best nodes `num_steps` times from `node` (the root by default), return the final beam.
+        branch_func: `branch_func(node)` gives the actioners of the children of `node`.
+        score_func: `score_func(child)` scores a child, higher is better.
+        """
+        # only the beam holds sandboxes between steps: expanded nodes (but `node`) are released, the rest is pruned
+        start = self.root if node is None else node
+        beam = [start]
+        for _ in range(num_steps):
+            child_list_list = self.expand_list(beam, [branch_func(_node) for _node in beam], length)
+            for _node in beam:
+                if _node is not start:
+                    self.release_state(_node)
+
+            child_list = [child for child_list in child_list_list for child in child_list]
+            for child in child_list:
+                child.score = score_func(child)
+            child_list.sort(key=lambda child: child.score, reverse=True)
+            beam = child_list[:beam_width]
+            for child in child_list[beam_width:]:
+                self.prune(child)
+            logging.info(f"beam search day {beam[0].day}: best score {beam[0].score}, {len(child_list)} children")
+        return beam
+
+    def close(self):
+        # release every state held by the tree, states held by `acquire` are kept
+        stack = [self.root]
+        while len(stack) > 0:
+            node = stack.pop()
+            self.release_state(node)
+            stack.extend(node.children)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
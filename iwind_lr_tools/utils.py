@@ -1,6 +1,9 @@
 
 from pathlib import Path
+import os
+import errno
 import subprocess
+import asyncio
 from threading import Lock
 from tempfile import mkdtemp
 import pandas as pd
@@ -39,14 +42,36 @@ def check_exe_version_number(p: Path):
         warn(f"Checking version for {p} failed, expected version {exe_version}")
 
 
-def run_simulation(root: str, popen=False):
+def run_simulation(root: str, popen=False, timeout=None, **popen_kwargs):
+    """
+    timeout: seconds, a model running longer is killed and `subprocess.TimeoutExpired` is raised.
+    """
     exe_p = get_exe_p(root)
     command = str(exe_p)
     cwd = str(root)
     if popen:
-        return subprocess.Popen(command, cwd=cwd)
+        return subprocess.Popen(command, cwd=cwd, **popen_kwargs)
     # return subprocess.run(command, cwd=cwd)
-    return subprocess.check_output(command, cwd=cwd)
+    return subprocess.check_output(command, cwd=cwd, timeout=timeout)
+
+async def run_simulation_async(root: str, timeout=None):
+    """
+    `run_simulation` for asyncio, the model process is killed if the awaiting task is cancelled or timed out.
+    """
+    exe_p = get_exe_p(root)
+    proc = await asyncio.create_subprocess_exec(str(exe_p), cwd=str(root), stdout=asyncio.subprocess.PIPE)
+    try:
+        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError) as e:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if isinstance(e, asyncio.TimeoutError):
+            raise subprocess.TimeoutExpired(str(exe_p), timeout)
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, str(exe_p), output=stdout)
+    return stdout
 
 def open_safe(path, mode, **kwargs):
     # Prevent symbolic link occasionally rewrite to the original file
@@ -56,11 +81,14 @@ def open_safe(path, mode, **kwargs):
         p.unlink()
     return open(p, mode, **kwargs)
 
+# The `*_locked` helpers serialize every caller in the process, sandboxes are created without them now
+# (see `create_simulation_atomic`), they're kept for the scripts using them.
 mkdtemp_lock = Lock()
 
-def mkdtemp_locked():
+def mkdtemp_locked(dir=None):
+    # dir: scratch root holding the simulation directories (ex: a tmpfs mount), `None` means the system temp directory
     with mkdtemp_lock:
-        return mkdtemp()
+        return mkdtemp(dir=dir)
 
 symlink_lock = Lock()
 
@@ -68,6 +96,74 @@ def symlink_locked(src:Path, dst:Path):
     with symlink_lock:
         src.symlink_to(dst)
 
+link_mode_list = ["symlink", "hardlink", "reflink"]
+
+FICLONE = 0x40049409 # linux/fs.h
+
+def reflink_or_copy(src, dst):
+    """
+    Copy-on-write clone of `src` (btrfs, xfs, ...), fall back to a plain copy where it's not supported.
+    """
+    try:
+        import fcntl
+        with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+            fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+        shutil.copystat(src, dst) # keep the exe executable
+        return
+    except (ImportError, OSError):
+        pass
+    shutil.copy2(src, dst)
+
+_hardlink_fallback_warned = False
+
+def copy_replace(src, dst):
+    """
+    Replace `dst` (ex: a link to the base root) by a copy of `src`.
+    It only touches `dst`, so callers working in their own simulation directories don't need a lock.
+    """
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    shutil.copy(src, dst)
+
+def link_file(src:Path, dst:Path, link_mode="symlink"):
+    """
+    Create `src` as a link to `dst` (same order as `symlink_locked`).
+    "hardlink" falls back to a copy across file systems (ex: a tmpfs scratch root and a disk root).
+    Files are replaced by `open_safe` rather than written in place, so hardlinked base files are never modified.
+    """
+    global _hardlink_fallback_warned
+    if link_mode == "symlink":
+        os.symlink(dst, src)
+    elif link_mode == "hardlink":
+        try:
+            os.link(dst, src)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            if not _hardlink_fallback_warned:
+                _hardlink_fallback_warned = True
+                warn(f"Can't hardlink {dst} into another file system, copy instead")
+            shutil.copy2(dst, src)
+    elif link_mode == "reflink":
+        reflink_or_copy(dst, src)
+    else:
+        raise ValueError(f"Unknown link_mode {link_mode}, expected one of {link_mode_list}")
+
+handoff_mode_list = ["copy", "hardlink", "reflink"]
+
+def handoff_file(src, dst, handoff_mode="copy"):
+    """
+    Replace `dst` by the content of `src` from another simulation directory, `src` must not be modified in place after.
+    """
+    if handoff_mode == "copy":
+        copy_replace(src, dst)
+        return
+    if handoff_mode not in handoff_mode_list:
+        raise ValueError(f"Unknown handoff_mode {handoff_mode}, expected one of {handoff_mode_list}")
+    if os.path.lexists(dst):
+        os.unlink(dst)
+    link_file(dst, src, handoff_mode)
+
 copy_lock = Lock()
 
 def copy_locked(src, dst):
@@ -0,0 +1,45 @@
+"""
+Compare `dumps` (`DataFrame.to_csv` based) with streaming `dump` on the large qser.inp and wqpsc.inp.
+
+python -m tests.benchmark_dump path/to/root
+"""
+
+import time
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from iwind_lr_tools.collector import get_all
+from iwind_lr_tools.io.common import dumps, dump
+
+
+def run(root: str, repeat: int=5, *, fname_list: str="qser.inp,wqpsc.inp"):
+    data_map, df_node_map_map, df_map_map = get_all(Path(root))
+
+    with TemporaryDirectory() as temp_root:
+        for fname in fname_list.split(","):
+            node_list = data_map[fname]
+            p = Path(temp_root) / fname
+
+            begin = time.perf_counter()
+            for _ in range(repeat):
+                with open(p, "w", encoding="utf8") as f:
+                    f.write(dumps(node_list))
+            elapsed_dumps = (time.perf_counter() - begin) / repeat
+            with open(p, encoding="utf8") as f:
+                text_dumps = f.read()
+
+            begin = time.perf_counter()
+            for _ in range(repeat):
+                with open(p, "w", encoding="utf8") as f:
+                    dump(node_list, f)
+            elapsed_dump = (time.perf_counter() - begin) / repeat
+            with open(p, encoding="utf8") as f:
+                text_dump = f.read()
+
+            assert text_dumps == text_dump, f"{fname}: dump and dumps are not identical"
+            print(f"{fname}: dumps {elapsed_dumps:.3f}s, dump {elapsed_dump:.3f}s, speedup x{elapsed_dumps / elapsed_dump:.2f}")
+
+
+if __name__ == "__main__":
+    import clize
+    clize.run(run)
@@ -0,0 +1,68 @@
+"""
+Cost of the restart file handoff for each `handoff_mode`, for an ensemble of `num` runners:
+"step" is the handoff inside every simulation directory after a restart step (as `restart_list_iterator` does),
+"fork" is the handoff from one completed directory into `num` new ones (as `fork` does).
+Restart files are random bytes of `--size-mb` each, or the ones of `--restart-root`
+(a directory holding RESTART.OUT, TEMPBRST.OUT and WQWCRST.OUT, ex: a completed runner).
+
+python -m tests.benchmark_restart_handoff 32 --size-mb 64 --scratch-root /dev/shm
+"""
+
+import os
+import shutil
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+
+from iwind_lr_tools.runner import copy_restart_files
+from iwind_lr_tools.checkpoint_store import restart_out_to_inp
+from iwind_lr_tools.utils import handoff_mode_list
+
+
+def put_restart_out(dst_root: Path, size_mb, restart_root=None):
+    # what the model leaves in a directory, not timed
+    for out_s in restart_out_to_inp:
+        if restart_root is not None:
+            shutil.copy(Path(restart_root) / out_s, dst_root / out_s)
+        else:
+            with open(dst_root / out_s, "wb") as f:
+                f.write(os.urandom(int(size_mb * 1024 * 1024)))
+
+
+def measure(handoff_mode, num, size_mb, scratch_root=None, restart_root=None):
+    work_root = Path(mkdtemp(dir=scratch_root))
+    try:
+        dst_root_list = [work_root / str(idx) for idx in range(num)]
+        for dst_root in dst_root_list:
+            dst_root.mkdir()
+            put_restart_out(dst_root, size_mb, restart_root)
+
+        begin = time.perf_counter()
+        for dst_root in dst_root_list:
+            copy_restart_files(dst_root, handoff_mode=handoff_mode)
+        elapsed_step = time.perf_counter() - begin
+
+        base_root = work_root / "base"
+        base_root.mkdir()
+        put_restart_out(base_root, size_mb, restart_root)
+        begin = time.perf_counter()
+        for dst_root in dst_root_list:
+            copy_restart_files(base_root, dst_root, handoff_mode=handoff_mode)
+        elapsed_fork = time.perf_counter() - begin
+    finally:
+        shutil.rmtree(work_root)
+    return elapsed_step, elapsed_fork
+
+
+def run(num: int=16, repeat: int=3, *, size_mb: float=16.0, scratch_root: str=None, restart_root: str=None,
+        handoff_mode_list: str=",".join(handoff_mode_list)):
+    for handoff_mode in handoff_mode_list.split(","):
+        elapsed_list = [measure(handoff_mode, num, size_mb, scratch_root, restart_root) for _ in range(repeat)]
+        elapsed_step = min(step for step, _ in elapsed_list)
+        elapsed_fork = min(fork for _, fork in elapsed_list)
+        print(f"{handoff_mode}: step {elapsed_step * 1000:.1f}ms, fork {elapsed_fork * 1000:.1f}ms for {num} runners")
+
+
+if __name__ == "__main__":
+    import clize
+    clize.run(run)
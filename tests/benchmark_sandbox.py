@@ -0,0 +1,33 @@
+"""
+Compare the throughput of simulation directories created with each link mode, optionally on a scratch root (ex: tmpfs).
+
+python -m tests.benchmark_sandbox path/to/root --scratch-root /dev/shm
+"""
+
+import time
+from pathlib import Path
+
+from iwind_lr_tools import Runner, run_batch
+from iwind_lr_tools.runner import data_map_fill
+
+
+def run(root: str, num: int=8, pool_size: int=1, *, scratch_root: str=None, link_mode_list: str="symlink,hardlink,reflink"):
+    data_map_list = [data_map_fill({}) for _ in range(num)] # baseline inputs, only the model and the outputs cost
+
+    for link_mode in link_mode_list.split(","):
+        begin = time.perf_counter()
+        runner_list = [Runner(root, scratch_root=scratch_root, link_mode=link_mode) for _ in range(num)]
+        elapsed_create = (time.perf_counter() - begin) / num
+        for runner in runner_list:
+            runner.cleanup()
+
+        begin = time.perf_counter()
+        run_batch(root, data_map_list, pool_size=pool_size, scratch_root=scratch_root, link_mode=link_mode)
+        elapsed = time.perf_counter() - begin
+
+        print(f"{link_mode}: create {elapsed_create * 1000:.1f}ms/sandbox, {num / elapsed:.3f} simulations/s")
+
+
+if __name__ == "__main__":
+    import clize
+    clize.run(run)
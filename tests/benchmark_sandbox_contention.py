@@ -0,0 +1,78 @@
+"""
+Time-to-first-launch against pool size: every worker thread creates its simulation directory at the same time,
+as `run_batch` does at startup, and the time until the last one is ready to launch the model is reported.
+"locked" reproduces the former creation (`mkdtemp_locked` + `symlink_locked`), "atomic" is `create_simulation_atomic`.
+With `--restart-root` (a directory holding RESTART.OUT, TEMPBRST.OUT and WQWCRST.OUT, ex: a completed runner),
+every worker also copies the restart files as `fork` does, with `copy_locked` or `copy_restart_files`.
+
+python -m tests.benchmark_sandbox_contention path/to/root --pool-size-list 1,2,4,8,16,32
+"""
+
+import time
+from pathlib import Path
+from shutil import rmtree
+from threading import Barrier, Thread
+
+from iwind_lr_tools.create_simulation import create_simulation_atomic, selected_name_list_default
+from iwind_lr_tools.utils import mkdtemp_locked, symlink_locked, copy_locked, get_exe_p
+from iwind_lr_tools.runner import copy_restart_files
+
+out_to_inp = {"RESTART.OUT": "RESTART.INP", "TEMPBRST.OUT": "TEMPB.RST", "WQWCRST.OUT": "wqini.inp"}
+
+
+def create_locked(root: Path, scratch_root=None, restart_root=None):
+    dst_root = Path(mkdtemp_locked(scratch_root))
+    for src in [get_exe_p(root)] + [root / name for name in selected_name_list_default]:
+        symlink_locked(dst_root / src.name, src)
+        assert (dst_root / src.name).is_file()
+    if restart_root is not None:
+        for out_s, inp_s in out_to_inp.items():
+            if (dst_root / inp_s).exists():
+                (dst_root / inp_s).unlink()
+            copy_locked(Path(restart_root) / out_s, dst_root / inp_s)
+    return dst_root
+
+
+def create_atomic(root: Path, scratch_root=None, restart_root=None):
+    dst_root = create_simulation_atomic(root, scratch_root)
+    if restart_root is not None:
+        copy_restart_files(restart_root, dst_root)
+    return dst_root
+
+
+def measure(create, root: Path, pool_size: int, scratch_root=None, restart_root=None):
+    barrier = Barrier(pool_size + 1)
+    ready_list = [None] * pool_size
+    dst_root_list = [None] * pool_size
+
+    def job(idx):
+        barrier.wait()
+        dst_root_list[idx] = create(root, scratch_root, restart_root)
+        ready_list[idx] = time.perf_counter()
+
+    thread_list = [Thread(target=job, args=(idx,)) for idx in range(pool_size)]
+    for thread in thread_list:
+        thread.start()
+    barrier.wait()
+    begin = time.perf_counter()
+    for thread in thread_list:
+        thread.join()
+
+    for dst_root in dst_root_list:
+        rmtree(dst_root)
+    return max(ready_list) - begin
+
+
+def run(root: str, repeat: int=5, *, pool_size_list: str="1,2,4,8,16,32", scratch_root: str=None, restart_root: str=None):
+    root = Path(root)
+    for pool_size in [int(x) for x in pool_size_list.split(",")]:
+        line = f"pool_size={pool_size}:"
+        for name, create in [("locked", create_locked), ("atomic", create_atomic)]:
+            elapsed = min(measure(create, root, pool_size, scratch_root, restart_root) for _ in range(repeat))
+            line += f" {name} {elapsed * 1000:.1f}ms"
+        print(line)
+
+
+if __name__ == "__main__":
+    import clize
+    clize.run(run)
@@ -17,12 +17,21 @@ import shutil
 from typing import List
 import pandas as pd
 import logging
+import asyncio
+import time
+from queue import Queue
 
-from iwind_lr_tools import Actioner, Runner, run_batch, Runner, restart_batch, fork
+from iwind_lr_tools import Actioner, Runner, run_batch, Runner, restart_batch, fork, SandboxPool, run_batch_async, TimeoutPolicy, ResultCache, RemoteExecutor, CheckpointStore, Pedant, StepPolicy, SimulationTree
 # import iwind_lr_tools
-from iwind_lr_tools.runner import data_map_fill #, append_out_map
-from iwind_lr_tools.collector import dumpable_list, get_all
-from iwind_lr_tools.fault_tolerant_pool import YPool
+from iwind_lr_tools.runner import data_map_fill, parse_shell_output, start_iterator, SimilarRestarter, copy_restart_files, restart_list_iterator, restart_list_iterator_pipelined #, append_out_map
+from iwind_lr_tools.collector import dumpable_list, get_all, parse_out
+from iwind_lr_tools.fault_tolerant_pool import YPool, YPoolFailed, BatchExecutor
+from iwind_lr_tools.remote import start_local_daemons
+import iwind_lr_tools.runner as runner_module
+from iwind_lr_tools.io import qser_inp, WQWCTS_OUT
+from iwind_lr_tools.io.common import dumps, dump, DataFrameNode, LazyDataFrameNode
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 MIN_SIMULATION_TIME = 1.0 # It seeems that there's round in the model program, 0.9 -> 0, 1.5 -> 1 etc.
 
@@ -86,6 +95,159 @@ def name_suit(root=None):
     return root, data, data_map, df_node_map_map, df_map_map, actioner
 
 
+def test_qser_vectorized_parse():
+    qser_p = Path(ori_root) / "qser.inp"
+
+    node_list = qser_inp.parse(qser_p)
+    node_list_ref = qser_inp.parse(qser_p, vectorized=False)
+
+    assert len(node_list) == len(node_list_ref)
+    assert [node.to_str() for node in node_list] == [node.to_str() for node in node_list_ref]
+    assert dumps(node_list) == dumps(node_list_ref)
+
+    # clean nodes dump their raw text, which has to be normalized the same way
+    text = "# comment\n  1  4  1 1 1 0 0  POINT_A \n  1\n 0.0\t0 \n\n 1.5  2\n1 2 1 1 1 0 0 POINT_B\n1\n0 1e-3\n2 0.5\n"
+    with TemporaryDirectory() as tmp_dir:
+        qser_p = Path(tmp_dir) / "qser.inp"
+        qser_p.write_text(text)
+        node_list = qser_inp.parse(qser_p)
+        node_list_ref = qser_inp.parse(qser_p, vectorized=False)
+        node_list_window = qser_inp.parse(qser_p, time_begin=1.0)
+        node_list_window_ref = qser_inp.parse(qser_p, vectorized=False, time_begin=1.0)
+    assert dumps(node_list) == dumps(node_list_ref)
+    for node, node_ref in zip(node_list[1:] + node_list_window[1:], node_list_ref[1:] + node_list_window_ref[1:]):
+        assert node.get_df().equals(node_ref.get_df()) # including the integer columns
+
+
+def test_dump_identical():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    for fname in dumpable_list:
+        for node in data_map[fname]:
+            node.mark_dirty() # serialize rather than emitting parsed text
+        buf = StringIO()
+        dump(data_map[fname], buf)
+        assert buf.getvalue() == dumps(data_map[fname]), f"{fname} is not identical"
+
+
+def test_write_skip_clean():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    runner = Runner(root)
+    try:
+        runner.write(data_map_fill({"efdc.inp": data_map["efdc.inp"], "qser.inp": data_map["qser.inp"]}))
+        assert not (runner.dst_root / "efdc.inp").is_symlink() # simulation length is modified in `name_suit`
+        assert (runner.dst_root / "qser.inp").is_symlink()
+
+        actioner.set_flow_range(actioner.list_flow_name()[0], 0, 0, 1)
+        runner.write(data_map_fill({"qser.inp": data_map["qser.inp"]}))
+        assert not (runner.dst_root / "qser.inp").is_symlink()
+    finally:
+        runner.cleanup()
+
+
+def test_get_all_cache():
+    with TemporaryDirectory() as cache_dir:
+        data_map_ref = get_all(Path(ori_root))[0]
+        get_all(Path(ori_root), cache_dir=cache_dir) # cold
+        data_map = get_all(Path(ori_root), cache_dir=cache_dir)[0] # warm
+
+    for fname in dumpable_list:
+        assert dumps(data_map[fname]) == dumps(data_map_ref[fname]), f"{fname} is not identical"
+        assert all(not node.is_dirty() for node in data_map[fname])
+
+
+def test_get_all_parallel():
+    data_map_ref = get_all(Path(ori_root))[0]
+    data_map = get_all(Path(ori_root), parallel="thread")[0]
+
+    assert set(data_map) == set(data_map_ref)
+    for fname in dumpable_list:
+        assert dumps(data_map[fname]) == dumps(data_map_ref[fname]), f"{fname} is not identical"
+
+
+def test_master_input_lazy():
+    data_map = get_all(Path(ori_root))[0]
+
+    for fname in ["efdc.inp", "wq3dwc.inp"]:
+        text = dumps(data_map[fname])
+        for node in LazyDataFrameNode.get_df_node_list(data_map[fname]):
+            node_ref = DataFrameNode.from_str_list(node._str_list)
+            node_ref.set_header(node._header)
+            assert node.get_df().equals(node_ref.get_df()), f"{fname} {node.get_name()} is not identical"
+            node.mark_dirty() # serialize the built frame
+        assert dumps(data_map[fname]) == text
+
+
+def test_time_window():
+    data_map, df_node_map_map, df_map_map = get_all(Path(ori_root))
+    time = data_map["aser.inp"]["time"]
+    time_begin, time_end = time.iloc[len(time) // 3], time.iloc[len(time) // 2]
+    data_map_w, df_node_map_map_w, df_map_map_w = get_all(Path(ori_root), time_begin=time_begin, time_end=time_end)
+
+    def window(df, key):
+        return df[(df[key] >= time_begin) & (df[key] <= time_end)].reset_index(drop=True)
+
+    assert window(data_map["aser.inp"], "time").equals(data_map_w["aser.inp"])
+    for flow_name, df in df_map_map["qser.inp"].items():
+        assert window(df, "time").equals(df_map_map_w["qser.inp"][flow_name])
+    for fname in dumpable_list:
+        assert dumps(data_map_w[fname]) == dumps(data_map[fname]), f"{fname} is not identical"
+
+    actioner = Actioner(data_map_w, df_node_map_map_w, df_map_map_w)
+    actioner.set_flow_range(actioner.list_flow_name()[0], 0, 0, 1)
+    with pytest.raises(ValueError):
+        dumps(data_map_w["qser.inp"])
+
+
+def test_tail_reader():
+    lines = ["TIME I J K ROP DO\n"] + [f"{t}.5 3 {j} 1 {t * 0.1} 8.{j}\n" for t in range(5) for j in [4, 5]]
+    with TemporaryDirectory() as temp_dir:
+        p = Path(temp_dir) / "WQWCTS.OUT"
+        reader = WQWCTS_OUT.tail(p, columns=["ROP"], cells=[(3, 4, 1)])
+        assert reader.read() is None # not created yet
+
+        with open(p, "w") as f:
+            f.write("".join(lines[:4]) + lines[4][:5]) # the last line is incomplete
+            f.flush()
+            assert reader.read().shape[0] == 2
+            f.write(lines[4][5:] + "".join(lines[5:]))
+            f.flush()
+            assert reader.read().shape[0] == 3
+            assert reader.read() is None
+
+        df_ref = WQWCTS_OUT.parse(p, columns=["ROP"], cells=[(3, 4, 1)])
+        assert reader.get_df().equals(df_ref)
+
+
+def test_flow_store():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    actioner_store = actioner.copy()
+    actioner_store.enable_flow_store()
+    # binding leaves unmodified flows clean (qser.inp stays a link) and `detach` restores their dtypes
+    actioner_detached = actioner_store.copy()
+    assert not any(node.is_dirty() for node in actioner_detached.data_map["qser.inp"])
+    actioner_detached.enable_flow_store(False)
+    assert not any(node.is_dirty() for node in actioner_detached.data_map["qser.inp"])
+    for node, node_ref in zip(actioner_detached.data_map["qser.inp"][1:], actioner.data_map["qser.inp"][1:]):
+        assert node.get_df().dtypes.equals(node_ref.get_df().dtypes)
+
+    flow_name_list = actioner.list_flow_name()
+    length = df_map_map["qser.inp"][flow_name_list[0]].shape[0] // 2
+    decision_df = pd.DataFrame({flow_name: [0.0, 1.0] * (length // 2) + [1.0] * (length % 2) for flow_name in flow_name_list})
+
+    for _actioner in [actioner, actioner_store]:
+        _actioner.set_flow_by_decision_df(decision_df)
+        _actioner.set_flow_range(flow_name_list[0], 1.5, 0, 1)
+
+    actioner_store_copied = actioner_store.copy()
+    for _actioner in [actioner_store, actioner_store_copied]:
+        for flow_name in flow_name_list:
+            flow = _actioner.df_map_map["qser.inp"][flow_name]["flow"].to_numpy()
+            assert (flow == df_map_map["qser.inp"][flow_name]["flow"].to_numpy()).all()
+
+
 def test_fast_too_small():
     root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
 
@@ -96,6 +258,21 @@ def test_fast_too_small():
 
         assert out_map["qbal.out"].shape[0] > 1
 
+def test_WQWCTS_OUT_projection():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    with debug_env() as debug_list:
+        out_map, = run_batch(root, [data_map], debug_list=debug_list)
+        df = out_map["WQWCTS.OUT"]
+        cell = tuple(df[["I", "J", "K"]].iloc[0])
+
+        out_kwargs_map = {"WQWCTS.OUT": dict(columns=["ROP"], cells=[cell], chunksize=100)}
+        df_projected = parse_out(debug_list[0].dst_root, kwargs_map=out_kwargs_map)["WQWCTS.OUT"]
+
+        mask = (df["I"] == cell[0]) & (df["J"] == cell[1]) & (df["K"] == cell[2])
+        df_expected = df.loc[mask, ["TIME", "I", "J", "K", "ROP"]].reset_index(drop=True)
+        assert df_projected.equals(df_expected)
+
 def compare_out_map(out_map1, out_map2, neq=False):
     assert set(out_map1) == set(out_map2)
 
@@ -146,10 +323,13 @@ def test_more_time_sanity_check():
 def test_environment_isolation():
     # return # disable this test for all-copying method
     root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    qser_modified = actioner.copy().data_map["qser.inp"]
+    qser_modified[1].mark_dirty()
     
     data_map_list = [
         data_map_fill({"efdc.inp": data_map["efdc.inp"]}),
-        data_map_fill({"efdc.inp": data_map["efdc.inp"], "qser.inp": data_map["qser.inp"]})
+        data_map_fill({"efdc.inp": data_map["efdc.inp"], "qser.inp": data_map["qser.inp"]}),
+        data_map_fill({"efdc.inp": data_map["efdc.inp"], "qser.inp": qser_modified})
     ]
 
     with debug_env() as debug_list:
@@ -168,9 +348,14 @@ def test_environment_isolation():
 
         assert efdc_stat_list[0].st_mtime < efdc_stat_list[1].st_mtime
         assert efdc_stat_list[0].st_mtime < efdc_stat_list[2].st_mtime
+        assert efdc_stat_list[0].st_mtime < efdc_stat_list[3].st_mtime
 
+        # an unmodified qser.inp is kept as the link to the base file, a modified one is written
         assert qser_stat_list[0].st_mtime == qser_stat_list[1].st_mtime
-        assert qser_stat_list[0].st_mtime < qser_stat_list[2].st_mtime
+        assert qser_stat_list[0].st_mtime == qser_stat_list[2].st_mtime
+        assert (Path(dst_root_list[2]) / "qser.inp").is_symlink()
+        assert qser_stat_list[0].st_mtime < qser_stat_list[3].st_mtime
+        assert not (Path(dst_root_list[3]) / "qser.inp").is_symlink()
 
 def test_select_flow():
     root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
@@ -241,6 +426,279 @@ def test_restart_fork():
         # compare_out_map_weak(out_map_list[0], out_map_list[1])
         compare_out_map(out_map_list[0], out_map_list[1])
 
+def test_sandbox_pool():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    out_map_ref, = run_batch(root, [actioner], pool_size=1)
+    with SandboxPool(root, 2) as sandbox_pool:
+        for _ in range(2):
+            out_map_list = run_batch(root, [actioner, actioner], pool_size=2, sandbox_pool=sandbox_pool)
+            for out_map in out_map_list:
+                compare_out_map(out_map, out_map_ref)
+        assert len(sandbox_pool) == 2
+        for runner in sandbox_pool.runner_list:
+            # only the original symbolic links are left
+            assert sorted(os.listdir(runner.dst_root)) == sorted(runner.sandbox_link_map)
+
+
+def test_parse_pool():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    out_map_ref, = run_batch(root, [actioner], pool_size=1)
+    with ProcessPoolExecutor(2) as parse_pool:
+        out_map_list = run_batch(root, [actioner, actioner], pool_size=2, parse_pool=parse_pool)
+    for out_map in out_map_list:
+        compare_out_map(out_map, out_map_ref)
+
+def test_parse_pool_retry(monkeypatch):
+    # the first parse fails, the step is run again within the quota
+    class FakeRunner:
+        dst_root = None
+        out_kwargs_map = None
+
+        def simulate_strict(self, data_map):
+            pass
+
+        def run_strict(self, data_map):
+            return {"retried": True}
+
+    def parse_out_task(dst_root, out_kwargs_map=None, post_func=None):
+        raise ValueError("truncated output")
+
+    monkeypatch.setattr(runner_module, "parse_out_task", parse_out_task)
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    actioner = actioner.copy()
+    actioner.enable_restart()
+    report_list = []
+    with ThreadPoolExecutor(1) as parse_pool:
+        out_map_list = restart_batch([FakeRunner()], [actioner], pool_size=1, parse_pool=parse_pool, report_list=report_list)
+    assert out_map_list == [{"retried": True}]
+    assert report_list[0].attempts == 2 and isinstance(report_list[0].error_list[0], ValueError)
+
+
+def test_result_cache():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    out_map_ref, = run_batch(root, [actioner], pool_size=1)
+    with TemporaryDirectory() as cache_dir:
+        result_cache = ResultCache(cache_dir, max_entries=1)
+        report_list = []
+        out_map_list = run_batch(root, [actioner, actioner.copy()], pool_size=2, result_cache=result_cache, report_list=report_list)
+        assert len(report_list) == 1 # repeated candidates are simulated once
+        assert out_map_list[0] is not out_map_list[1]
+        report_list = []
+        out_map_list += run_batch(root, [actioner], pool_size=1, result_cache=result_cache, report_list=report_list)
+        assert len(report_list) == 0
+    for out_map in out_map_list:
+        compare_out_map(out_map, out_map_ref)
+
+
+def test_content_hash_index(monkeypatch):
+    with TemporaryDirectory() as cache_dir, TemporaryDirectory() as root:
+        p_list = [Path(root) / f"{idx}.inp" for idx in range(3)]
+        for idx, p in enumerate(p_list):
+            p.write_text(str(idx))
+        result_cache = ResultCache(cache_dir)
+        hash_list = result_cache.get_content_hash_list(p_list)
+        load_list = []
+        load_index = result_cache._load_index
+        monkeypatch.setattr(result_cache, "_load_index", lambda: load_list.append(1) or load_index())
+        assert [result_cache.get_content_hash(p) for p in p_list] == hash_list
+        assert len(load_list) == 0 # the index is kept in memory
+        assert ResultCache(cache_dir).get_content_hash_list(p_list) == hash_list # and written back
+
+        p_list[0].write_text("modified")
+        assert ResultCache(cache_dir).get_content_hash(p_list[0]) != hash_list[0]
+        assert result_cache.get_content_hash(p_list[0]) != hash_list[0]
+
+
+def test_remote_executor():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    out_map_ref, = run_batch(root, [actioner], pool_size=1)
+    authkey = os.urandom(16)
+    daemon_list, address_list = start_local_daemons(root, 2, slots=1, authkey=authkey)
+    try:
+        with RemoteExecutor(address_list, authkey=authkey) as executor:
+            out_map_list = run_batch(root, [actioner, actioner, actioner], executor=executor)
+    finally:
+        for daemon in daemon_list:
+            daemon.close()
+    for out_map in out_map_list:
+        compare_out_map(out_map, out_map_ref)
+
+
+def test_remote_restart_chain():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time() + MIN_SIMULATION_TIME
+    end_day = begin_day + 2 * MIN_SIMULATION_TIME
+
+    with debug_env() as debug_list:
+        run_batch(root, [actioner], pool_size=1, debug_list=debug_list)
+        out_map_list_list_ref = list(restart_list_iterator(begin_day, end_day, debug_list[0], [actioner],
+                                                           step=MIN_SIMULATION_TIME, return_out_map=True))
+    authkey = os.urandom(16)
+    daemon_list, address_list = start_local_daemons(root, 1, slots=2, authkey=authkey)
+    try:
+        with RemoteExecutor(address_list, authkey=authkey) as executor, debug_env() as remote_list:
+            run_batch(root, [actioner], executor=executor, debug_list=remote_list)
+            out_map_list_list = list(restart_list_iterator(begin_day, end_day, remote_list[0], [actioner],
+                                                           step=MIN_SIMULATION_TIME, return_out_map=True))
+            idx_day_out_list = list(restart_list_iterator_pipelined(begin_day, end_day, remote_list[0], [actioner],
+                                                                    step=MIN_SIMULATION_TIME, return_out_map=True))
+    finally:
+        for daemon in daemon_list:
+            daemon.close()
+    for out_map_list, out_map_list_ref in zip(out_map_list_list, out_map_list_list_ref):
+        compare_out_map(out_map_list[0], out_map_list_ref[0])
+    assert [day for _, day, _ in idx_day_out_list] == [begin_day, begin_day + MIN_SIMULATION_TIME]
+    for _, day, out_map in idx_day_out_list:
+        compare_out_map(out_map, out_map_list_list_ref[int((day - begin_day) // MIN_SIMULATION_TIME)][0])
+
+
+def test_run_batch_async():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+
+    out_map_ref, = run_batch(root, [actioner], pool_size=1)
+
+    async def collect():
+        return [idx_out async for idx_out in run_batch_async(root, [actioner, actioner], concurrency=2)]
+
+    idx_out_list = asyncio.run(collect())
+    assert sorted(idx for idx, _ in idx_out_list) == [0, 1]
+    for _, out_map in idx_out_list:
+        compare_out_map(out_map, out_map_ref)
+
+
+@pytest.mark.parametrize("handoff_mode", ["copy", "hardlink", "reflink"])
+def test_restart_handoff(handoff_mode):
+    with TemporaryDirectory() as src, TemporaryDirectory() as dst:
+        src, dst = Path(src), Path(dst)
+        for out_s in ["RESTART.OUT", "TEMPBRST.OUT", "WQWCRST.OUT"]:
+            (src / out_s).write_text(out_s)
+        copy_restart_files(src, handoff_mode=handoff_mode)
+        copy_restart_files(src, dst, handoff_mode=handoff_mode) # forked after the handoff inside src
+        for out_s, inp_s in [("RESTART.OUT", "RESTART.INP"), ("TEMPBRST.OUT", "TEMPB.RST"), ("WQWCRST.OUT", "wqini.inp")]:
+            assert (src / inp_s).read_text() == (dst / inp_s).read_text() == out_s
+            assert (src / out_s).exists() == (handoff_mode == "copy")
+
+def test_similar_restarter():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    pedant = Pedant(pd.to_datetime("2000-01-01"))
+
+    flow_name_list = actioner.list_flow_name()
+    length = df_map_map["qser.inp"][flow_name_list[0]].shape[0] // 2
+    decision_df = pd.DataFrame({flow_name: [1.0] * length for flow_name in flow_name_list})
+    decision_df_late = decision_df.copy()
+    decision_df_late.iloc[60:] = 0.5 # diverge in the middle of the second restarted day
+    decided_ddf_list = [decision_df, decision_df.copy(), decision_df_late]
+
+    with debug_env() as debug_list:
+        run_batch(root, [actioner], pool_size=1, debug_list=debug_list)
+        restarter = SimilarRestarter(actioner, debug_list[0], 24, 72, pedant)
+        try:
+            df_list = restarter.restart(decided_ddf_list)
+            assert restarter.same_end_day_cached == restarter.begin_day + 1
+            df_list_cached = restarter.restart(decided_ddf_list)
+        finally:
+            restarter.cleanup()
+    assert len(df_list) == 3
+    assert df_list[0].equals(df_list[1])
+    assert df_list[0].index.equals(df_list[2].index)
+    for df, df_cached in zip(df_list, df_list_cached):
+        assert df.equals(df_cached)
+
+def test_restart_list_iterator_pipelined():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time() + MIN_SIMULATION_TIME
+    end_day = begin_day + 2 * MIN_SIMULATION_TIME
+
+    with debug_env() as debug_list:
+        run_batch(root, [actioner], pool_size=1, debug_list=debug_list)
+        out_map_list_list = list(restart_list_iterator(begin_day, end_day, debug_list[0], [actioner, actioner],
+                                                       step=MIN_SIMULATION_TIME, return_out_map=True))
+        idx_day_out_list = list(restart_list_iterator_pipelined(begin_day, end_day, debug_list[0], [actioner, actioner],
+                                                                step=MIN_SIMULATION_TIME, return_out_map=True, pool_size=2))
+    assert sorted((idx, day) for idx, day, _ in idx_day_out_list) == \
+        [(0, begin_day), (0, begin_day + MIN_SIMULATION_TIME), (1, begin_day), (1, begin_day + MIN_SIMULATION_TIME)]
+    for idx, day, out_map in idx_day_out_list:
+        compare_out_map(out_map, out_map_list_list[int((day - begin_day) // MIN_SIMULATION_TIME)][idx])
+
+def test_restart_list_iterator_pipelined_order(monkeypatch):
+    # instant fake steps, the result of a step is queued slowly so the next step would win a race
+    class FakeRunner:
+        def run_strict(self, data_map):
+            return {}
+
+        def handoff(self):
+            pass
+
+        def cleanup(self):
+            pass
+
+    class SlowQueue(Queue):
+        def put(self, item, *args, **kwargs):
+            if not item[3]:
+                time.sleep(0.05)
+            super().put(item, *args, **kwargs)
+
+    monkeypatch.setattr(runner_module, "fork", lambda runner, size, sandbox_pool=None: [FakeRunner() for _ in range(size)])
+    monkeypatch.setattr(runner_module, "Queue", SlowQueue)
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time()
+    idx_day_out_list = list(restart_list_iterator_pipelined(begin_day, begin_day + 3, None, [actioner], step=1,
+                                                            return_out_map=True, pool_size=4))
+    assert [day for _, day, _ in idx_day_out_list] == [begin_day, begin_day + 1, begin_day + 2]
+
+def test_checkpoint_store():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time()
+    end_day = begin_day + 2 * MIN_SIMULATION_TIME
+
+    def collect(checkpoint_store):
+        with debug_env() as debug_list, debug_env() as debug_restart_list:
+            return list(start_iterator(begin_day, end_day, root, actioner, step=MIN_SIMULATION_TIME, return_out_map=True,
+                                       debug_list=debug_list, debug_restart_list=debug_restart_list,
+                                       checkpoint_store=checkpoint_store))
+
+    out_map_ref_list = collect(None)
+    with TemporaryDirectory() as store_dir:
+        checkpoint_store = CheckpointStore(store_dir)
+        out_map_list = collect(checkpoint_store)
+        out_map_list_resumed = collect(checkpoint_store) # every step is restored
+    assert len(out_map_list) == len(out_map_list_resumed) == len(out_map_ref_list) == 2
+    for out_map, out_map_resumed, out_map_ref in zip(out_map_list, out_map_list_resumed, out_map_ref_list):
+        compare_out_map(out_map, out_map_ref)
+        compare_out_map(out_map_resumed, out_map_ref)
+
+def test_checkpoint_sandbox_reuse():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time()
+    end_day = begin_day + 2 * MIN_SIMULATION_TIME
+
+    with TemporaryDirectory() as store_dir, SandboxPool(root, 1) as sandbox_pool:
+        checkpoint_store = CheckpointStore(store_dir)
+        with debug_env() as debug_list, debug_env() as debug_restart_list:
+            list(start_iterator(begin_day, end_day, root, actioner, step=MIN_SIMULATION_TIME, return_out_map=True,
+                                debug_list=debug_list, debug_restart_list=debug_restart_list,
+                                sandbox_pool=sandbox_pool, checkpoint_store=checkpoint_store))
+            assert debug_restart_list[0].checkpoint_key is not None
+        # the sandboxes are reused for a run outside the store
+        with debug_env() as debug_list:
+            run_batch(root, [actioner], pool_size=1, sandbox_pool=sandbox_pool, debug_list=debug_list)
+            assert debug_list[0].checkpoint_key is None
+
+            debug_list[0].checkpoint_key = checkpoint_store.get_state_key(debug_list[0].dst_root)
+            runner_list = fork(debug_list[0], 1, sandbox_pool=sandbox_pool)
+            debug_list.extend(runner_list)
+            actioner_restart = actioner.copy()
+            actioner_restart.enable_restart()
+            actioner_restart.set_simulation_begin_time(begin_day + MIN_SIMULATION_TIME)
+            actioner_restart.set_simulation_length(MIN_SIMULATION_TIME)
+            restart_batch(runner_list, [actioner_restart], pool_size=1)
+            assert runner_list[0].checkpoint_key is None # the inherited key is stale after the step
+
+
 """
 @pytest.mark.xfail()
 def test_start_iterator_1day_plus():
@@ -291,3 +749,91 @@ def test_ypool_tsundere():
     with pytest.raises(Exception): # For some reasons, `pytest.raises(Baka)` doesn't works.
         with pytest.warns(UserWarning):
             pool.map(func, [1])
+
+def test_ypool_report():
+    pool = YPool(3, quota=3, backoff=0.01)
+    func = Tsundere(3)
+    with pytest.warns(UserWarning):
+        pool.map(func, [1])
+    report, = pool.report_list
+    assert report.is_success() and report.attempts == 3
+    assert len(report.error_list) == 2
+
+def test_batch_executor():
+    with BatchExecutor(2, quota=3) as executor:
+        report_list = []
+        with pytest.warns(UserWarning):
+            assert executor.map_batch(Tsundere(2), [1], report_list=report_list) == [True]
+        report, = report_list
+        assert report.attempts == 2
+        with pytest.warns(UserWarning):
+            with pytest.raises(YPoolFailed):
+                executor.map_batch(Tsundere(4), [1])
+        assert executor.submit(sum, [1, 2]).result() == 3 # the threads survive failed batches
+
+def test_timeout_policy():
+    policy = TimeoutPolicy(factor=2.0, overhead=10.0)
+    assert policy.get_timeout(5) is None
+    policy.update(5, 50.0)
+    policy.update(5, 20.0) # the slowest rate is kept
+    assert policy.get_timeout(1) == 10.0 + 2.0 * 10.0
+
+    policy = TimeoutPolicy(factor=2.0, overhead=10.0, window=3)
+    policy.update(5, 50.0)
+    policy.update(5, 10.0)
+    policy.update(5, 10.0)
+    assert policy.get_timeout(1) == 10.0 + 2.0 * 10.0
+    policy.update(5, 10.0) # the slow run left the window
+    assert policy.get_timeout(1) == 10.0 + 2.0 * 2.0
+
+def test_step_policy():
+    policy = StepPolicy(target_latency=50.0, initial_step=7, boundary_list=[12])
+    assert policy.get_step(0, 100) == 7
+    policy.update(7, 10.0 + 7 * 4.0, model_seconds=7 * 4.0)
+    assert policy.get_step(0, 100) == 10 # (50 - 10) / 4
+    assert policy.get_step(5, 100) == 7 # cut at the boundary
+    assert policy.get_step(95, 100) == 5
+
+    policy = StepPolicy(max_overhead_fraction=0.1, max_step=100, smoothing=1.0)
+    policy.update(2, 10.0 + 2 * 1.0)
+    policy.update(4, 10.0 + 4 * 1.0) # fitted without the model timing
+    assert policy.get_step(0, 1000) == 90 # 10 / (10 + 1 * 90) = 0.1
+
+    policy = StepPolicy(initial_step=7, max_step=28)
+    policy.update(7, 120.0 + 7 * 1.0)
+    assert policy.get_step(0, 1000) == 14 # probe another length rather than assuming no overhead
+    policy.update(14, 120.0 + 14 * 1.0)
+    assert policy.get_step(0, 1000) == 28
+
+    parsed = parse_shell_output("...\n TIMING INFORMATION IN SECONDS\n HYDRO = 3.0\n WQ = 5.0\n TOTAL TIME = 9.5\n")
+    assert StepPolicy().get_timing(parsed) == 9.5
+    assert StepPolicy(timing_key="WQ").get_timing(parsed) == 5.0
+    assert StepPolicy().get_timing({"HYDRO": 3.0, "WQ": 5.0}) == 5.0
+
+def test_simulation_tree():
+    root, data, data_map, df_node_map_map, df_map_map, actioner = name_suit()
+    begin_day = actioner.get_simulation_begin_time() + MIN_SIMULATION_TIME
+    end_day = begin_day + 2 * MIN_SIMULATION_TIME
+
+    with debug_env() as debug_list:
+        run_batch(root, [actioner], pool_size=1, debug_list=debug_list)
+        out_map_list_list = list(restart_list_iterator(begin_day, end_day, debug_list[0], [actioner],
+                                                       step=MIN_SIMULATION_TIME, return_out_map=True))
+        with SimulationTree(debug_list[0], begin_day) as tree:
+            child_list = tree.expand(tree.root, [actioner, actioner], MIN_SIMULATION_TIME)
+            grandchild_list = tree.expand(child_list[0], [actioner], MIN_SIMULATION_TIME)
+            tree.prune(child_list[1])
+            assert child_list[1].is_released() and not child_list[0].is_released()
+            kept = grandchild_list[0].acquire()
+        assert child_list[0].is_released() and not kept.is_released()
+        kept.release()
+        assert kept.is_released()
+
+        with SimulationTree(debug_list[0], begin_day) as tree:
+            beam = tree.beam_search(lambda node: [actioner, actioner], lambda child: 0.0, MIN_SIMULATION_TIME, 2, 1)
+            assert len(beam) == 1 and beam[0].day == end_day
+            assert beam[0].parent.is_released()
+
+    for out_map_list, node in zip(out_map_list_list, [child_list[0], kept]):
+        compare_out_map(node.out, out_map_list[0])
+    compare_out_map(beam[0].out, out_map_list_list[1][0])